@@ -2,7 +2,8 @@
 supports the ARM chipset with external triggering. Mimic the Dash
 functionality of acquiring a single line internally triggered, set the
 external trigger opcode, then wait until USB timeout for data on the
-bulk endpoint.
+bulk endpoint. After the first line, stream every triggered line and
+report any missed triggers.
 """
 
 import sys, time
@@ -38,12 +39,12 @@ def print_device():
         sys.exit(1)
 
     dev_count = 0
-    for item in dev_list.get_all():
+    for item in result:
         print "Device: %s      VID: %s PID: %s" \
                % (dev_count, item[0], item[1])
         dev_count += 1
 
-    last_device = dev_list.get_all()[-1]
+    last_device = result[-1]
     last_pid = int(last_device[1], 16)
 
     device = feature_identification.Device(pid=last_pid)
@@ -91,10 +92,26 @@ if __name__ == "__main__":
 
     time.sleep(1)
 
-    # Set external trigger, wait forever
+    # Set external trigger, wait for the first line
     device.set_trigger_source(1)
     print_data(device)
 
+    # Keep a read armed and report each triggered line until ctrl-c
+    device.start_triggered_stream()
+    try:
+        while True:
+            result = device.read_triggered(timeout=1.0)
+            if result is None:
+                continue
+
+            sequence, timestamp, data = result
+            counters = device.get_trigger_counters()
+            print "Line %s at %.6f missed: %s dropped: %s" \
+                  % (sequence, timestamp, counters["missed"],
+                     counters["dropped"])
+    except KeyboardInterrupt:
+        device.stop_stream()
+
 
 
 
@@ -0,0 +1,113 @@
+""" benchmark - measure acquisition throughput and latency of the first
+attached Wasatch Photonics device, or of the fake backend with --fake.
+Writes the results as JSON with --output, and exits non-zero when
+--baseline is given and any case regressed against it. With --archive,
+measures the archive codecs on synthetic Raman spectra instead.
+"""
+
+import sys
+import logging
+import argparse
+
+log = logging.getLogger()
+strm = logging.StreamHandler(sys.stderr)
+log.addHandler(strm)
+log.setLevel(logging.WARN)
+
+from wasatchusb import registry
+from wasatchusb import benchmark
+
+
+def create_parser():
+    desc = "Benchmark the acquisition path of a spectrometer"
+    parser = argparse.ArgumentParser(description=desc)
+
+    parser.add_argument("-f", "--fake", action="store_true",
+                        help="Use the fake backend instead of hardware")
+    parser.add_argument("-p", "--pid", type=lambda text: int(text, 0),
+                        default=None, help="Product id, such as 0x1000")
+    parser.add_argument("-i", "--iterations", type=int, default=1000,
+                        help="Calls per host side case")
+    parser.add_argument("-d", "--device-iterations", type=int,
+                        default=200, help="Calls per device case")
+    parser.add_argument("-l", "--latency", type=float, default=0.0,
+                        help="Fake control transfer latency in seconds")
+    parser.add_argument("-c", "--cases", nargs="+",
+                        default=list(benchmark.CASES),
+                        choices=benchmark.CASES, help="Cases to run")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Write the JSON report to this file")
+    parser.add_argument("-b", "--baseline", default=None,
+                        help="JSON report to check for regressions")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.2,
+                        help="Allowed regression as a fraction")
+    parser.add_argument("-a", "--archive", action="store_true",
+                        help="Measure archive throughput and ratio")
+    parser.add_argument("--frames", type=int, default=4096,
+                        help="Spectra per archive codec")
+    parser.add_argument("--pixels", type=int, default=1024,
+                        help="Pixels per archived spectrum")
+    return parser
+
+
+def open_suite(args):
+    if args.fake:
+        return benchmark.fake_suite(args.pid or 0x1000, args.iterations,
+                                    args.device_iterations,
+                                    latency=args.latency)
+
+    device_registry = registry.get_registry()
+    device = device_registry.open(pid=args.pid)
+    if device is None:
+        print("No device found, use --fake to run without hardware")
+        sys.exit(1)
+    return benchmark.BenchmarkSuite(device, device_registry,
+                                    args.iterations,
+                                    args.device_iterations)
+
+
+def run_archive(args):
+    frames = benchmark.raman_frames(args.frames, args.pixels)
+    results = benchmark.archive_benchmark(frames)
+    for result in results:
+        print(result)
+
+    if args.output is not None:
+        summary = benchmark.report([], pixels=args.pixels,
+                                   archive=dict((result.codec,
+                                                 result.as_dict())
+                                                for result in results))
+        benchmark.write_report(args.output, summary)
+    return 0
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv[1:] if argv else None)
+    if args.archive:
+        return run_archive(args)
+
+    suite = open_suite(args)
+
+    results = suite.run(args.cases)
+    for result in results:
+        print(result)
+
+    summary = benchmark.report(results, fake=args.fake,
+                               pid=suite.device.pid)
+    if args.output is not None:
+        benchmark.write_report(args.output, summary)
+
+    if args.baseline is not None:
+        baseline = benchmark.read_report(args.baseline)
+        regressions = benchmark.find_regressions(baseline, summary,
+                                                 args.tolerance)
+        for name, field, before, after in regressions:
+            print("Regression %s %s: %.3f -> %.3f"
+                  % (name, field, before, after))
+        if regressions:
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
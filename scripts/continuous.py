@@ -22,7 +22,7 @@ except ImportError as exc:
     log.warn("See: https://github.com/WasatchPhotonics/diagram")
     log.warn("Exception: %s", exc)
 
-from wasatchusb import stroker_protocol, feature_identification
+from wasatchusb import registry
 
 # selected as an acceptable value for both default terminal sizes
 # and subsampling of the 1024 (typical) pixels
@@ -39,34 +39,25 @@ def print_device():
     file.
     """
 
-    dev_list = stroker_protocol.ListDevices()
-    result = dev_list.get_all()
-    fid_device = 0
-    if result == []:
+    entries = registry.get_registry().entries()
+    dev_entries = [entry for entry in entries
+                   if not entry.is_feature_identification()]
+    if dev_entries == []:
         log.warn("No stroker protocol device")
 
-    	dev_list = feature_identification.ListDevices()
-    	result = dev_list.get_all()
-	fid_device = 1
-    	if result == []:
+        dev_entries = entries
+        if dev_entries == []:
             print "No feature identification protocol device"
-	    sys.exit(1)
+            sys.exit(1)
 
 
     dev_count = 0
-    for item in dev_list.get_all():
+    for entry in dev_entries:
         print "Device: %s      VID: %s PID: %s" \
-               % (dev_count, item[0], item[1])
+               % (dev_count, hex(entry.vid), hex(entry.pid))
         dev_count += 1
 
-    last_device = dev_list.get_all()[-1]
-    last_pid = int(last_device[1], 16)
-
-    if fid_device:
-        device = feature_identification.Device(pid=last_pid)
-
-    else:
-        device = stroker_protocol.StrokerProtocolDevice(pid=last_pid)
+    device = dev_entries[-1].create()
     device.connect()
     print "Serial:        %s" % device.get_serial_number()
     print "SWCode:        %s" % device.get_standard_software_code()
@@ -83,7 +74,7 @@ def subsample(data, sample_size):
     """
     # use 3 for triplets, etc.
     samples = list(zip(*[iter(data)]*sample_size))
-    return map(lambda x:sum(x)/float(len(x)), samples)
+    return map(lambda x:sum(x, 0.0)/len(x), samples)
 
 
 def print_data(device):
@@ -110,21 +101,22 @@ def print_data(device):
         log.warn("No laser [%s]", exc)
 
 
-    # Temperature data is stored for trending strip chart
-    temp_points = []
-    temp_values = []
+    # Temperature is sampled in the background for the trending strip
+    # chart, keeping the readings out of the spectrum loop
+    if init_tempc is not None:
+        device.start_telemetry(interval=0.5, depth=column_width,
+                               channels=("ccd",))
 
     while True:
         data = device.get_line()
         tempc = 0.0
+        temp_points = []
         if init_tempc is not None:
-            tempc = device.get_ccd_temperature()
-
-        temp_points.append(tempc)
-        temp_values.append(len(temp_points))
-        if len(temp_points) > column_width:
-            temp_points = temp_points[1:]
-            temp_values = temp_values[1:]
+            stamps, temps = device.telemetry_window()
+            temp_points = list(temps[:, 0])
+            if temp_points:
+                tempc = temp_points[-1]
+        temp_values = range(1, len(temp_points) + 1)
 
         values = []
         subsample_size = len(data) / column_width
@@ -139,7 +131,7 @@ def print_data(device):
 
 
         else:
-            avg_data =  sum(data) / len(data)
+            avg_data = int(data.sum()) / len(data)
             print "Min: %s Max: %s Avg: %s" \
                   % (min(data), max(data), avg_data)
 
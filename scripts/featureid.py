@@ -36,24 +36,25 @@ def print_device():
         sys.exit(1)
 
     dev_count = 0
-    for item in dev_list.get_all():
+    for item in result:
         print "Device: %s      VID: %s PID: %s" \
                % (dev_count, item[0], item[1])
         dev_count += 1
 
-    last_device = dev_list.get_all()[-1]
+    last_device = result[-1]
     last_pid = int(last_device[1], 16)
 
     device = feature_identification.Device(pid=last_pid)
     device.connect()
-    print "Model:         %s" % device.get_model_number()
-    print "Serial:        %s" % device.get_serial_number()
-    print "SWCode:        %s" % device.get_standard_software_code()
-    print "FPGARev:       %s" % device.get_fpga_revision()
-    print "Gain:          %s" % device.get_ccd_gain()
-    print "Int Time:      %s" % device.get_integration_time()
-    print "Laser Avail:   %s" % device.get_laser_availability()
-    print "Sensor Length: %s" % device.get_sensor_line_length()
+    info = device.read_info()
+    print "Model:         %s" % info.model
+    print "Serial:        %s" % info.serial
+    print "SWCode:        %s" % info.software_code
+    print "FPGARev:       %s" % info.fpga_revision
+    print "Gain:          %s" % info.gain
+    print "Int Time:      %s" % info.integration_time
+    print "Laser Avail:   %s" % info.laser_available
+    print "Sensor Length: %s" % info.line_length
 
     return device
 
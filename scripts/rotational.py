@@ -22,7 +22,7 @@ except ImportError as exc:
     log.warn("See: https://github.com/WasatchPhotonics/diagram")
     log.warn("Exception: %s", exc)
 
-from wasatchusb import stroker_protocol, feature_identification
+from wasatchusb import registry
 
 
 def print_device():
@@ -33,34 +33,25 @@ def print_device():
     file.
     """
 
-    dev_list = stroker_protocol.ListDevices()
-    result = dev_list.get_all()
-    fid_device = 0
-    if result == []:
+    entries = registry.get_registry().entries()
+    dev_entries = [entry for entry in entries
+                   if not entry.is_feature_identification()]
+    if dev_entries == []:
         log.warn("No stroker protocol device")
 
-    	dev_list = feature_identification.ListDevices()
-    	result = dev_list.get_all()
-	fid_device = 1
-    	if result == []:
+        dev_entries = entries
+        if dev_entries == []:
             print "No feature identification protocol device"
-	    sys.exit(1)
+            sys.exit(1)
 
 
     dev_count = 0
-    for item in dev_list.get_all():
+    for entry in dev_entries:
         print "Device: %s      VID: %s PID: %s" \
-               % (dev_count, item[0], item[1])
+               % (dev_count, hex(entry.vid), hex(entry.pid))
         dev_count += 1
 
-    last_device = dev_list.get_all()[-1]
-    last_pid = int(last_device[1], 16)
-
-    if fid_device:
-        device = feature_identification.Device(pid=last_pid)
-
-    else:
-        device = stroker_protocol.StrokerProtocolDevice(pid=last_pid)
+    device = dev_entries[-1].create()
     device.connect()
     print "Serial:        %s" % device.get_serial_number()
     print "SWCode:        %s" % device.get_standard_software_code()
@@ -38,12 +38,12 @@ def print_device():
         sys.exit(1)
 
     dev_count = 0
-    for item in dev_list.get_all():
+    for item in result:
         print "Device: %s      VID: %s PID: %s" \
                % (dev_count, item[0], item[1])
         dev_count += 1
 
-    last_device = dev_list.get_all()[-1]
+    last_device = result[-1]
     last_pid = int(last_device[1], 16)
 
     device = stroker_protocol.StrokerProtocolDevice(pid=last_pid)
@@ -10,7 +10,8 @@ config = {
     'download_url': 'https://github.com/nharringtonwasatch/WasatchUSB',
     'author_email': 'nharrington@wasatchphotonics.com',
     'version': '1.0.1',
-    'install_requires': ['phidgeter', 'pyusb'],
+    'install_requires': ['phidgeter', 'pyusb', 'numpy'],
+    'extras_require': {'hotplug': ['libusb1'], 'lz4': ['lz4']},
     'packages': ['wasatchusb'],
     'scripts': [],
     'name': 'WasatchUSB'
@@ -0,0 +1,103 @@
+""" Tests for the frame and command arbiter shared by device threads.
+"""
+
+import time
+import threading
+
+import pytest
+
+from wasatchusb import arbiter
+from wasatchusb import fake_backend
+
+def run_later(call):
+    thread = threading.Thread(target=call)
+    thread.daemon = True
+    thread.start()
+    return thread
+
+class TestCommandArbiter():
+
+    def test_reentrant_command_inside_frame(self):
+        lock = arbiter.CommandArbiter()
+        with lock.frame:
+            with lock.command:
+                assert lock.depth == 2
+        assert lock.owner is None
+
+    def test_release_not_owned(self):
+        lock = arbiter.CommandArbiter()
+        with pytest.raises(RuntimeError):
+            lock.release()
+
+    def test_waiting_frame_beats_new_command(self):
+        lock = arbiter.CommandArbiter()
+        order = []
+
+        def frame():
+            with lock.frame:
+                order.append("frame")
+
+        def command():
+            with lock.command:
+                order.append("command")
+
+        lock.acquire_command()
+        frame_thread = run_later(frame)
+        while lock.frames_waiting == 0:
+            time.sleep(0.001)
+
+        command_thread = run_later(command)
+        while lock.commands_waiting == 0:
+            time.sleep(0.001)
+
+        lock.release()
+        frame_thread.join(1.0)
+        command_thread.join(1.0)
+        assert order == ["frame", "command"]
+
+    def test_waiting_command_gets_next_turn(self):
+        lock = arbiter.CommandArbiter()
+        done = []
+
+        def command():
+            with lock.command:
+                done.append(lock.frames_waiting)
+
+        def frame():
+            with lock.frame:
+                pass
+
+        lock.acquire_frame()
+        command_thread = run_later(command)
+        while lock.commands_waiting == 0:
+            time.sleep(0.001)
+
+        # A second frame queued behind the command still waits its turn
+        frame_thread = run_later(frame)
+        while lock.frames_waiting == 0:
+            time.sleep(0.001)
+
+        lock.release()
+        command_thread.join(1.0)
+        frame_thread.join(1.0)
+        assert done == [1]
+
+class TestSharedHandle():
+
+    def test_setters_never_split_a_line(self):
+        device = fake_backend.fake_device(pid=0x1000, line_latency=0.001)
+        device.enable_trace(depth=8192)
+        device.start_stream(depth=16)
+
+        for count in range(50):
+            device.set_integration_time(10 + count)
+            device.get_ccd_temperature()
+
+        device.stop_stream()
+        assert device.stream.errors == 0
+        assert device.stream.ring.count > 0
+
+        entries = device.trace.entries()
+        for index, entry in enumerate(entries[:-1]):
+            if entry[2] == 0xAD:
+                assert entries[index + 1][1:3] == ("bulk", 0x82)
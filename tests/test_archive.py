@@ -0,0 +1,130 @@
+""" Tests for the compressed spectral archive.
+"""
+
+import os
+
+import numpy
+import pytest
+
+from wasatchusb import archive
+from wasatchusb import recording
+from wasatchusb import benchmark
+
+def stamped(count):
+    meta = numpy.zeros(count, dtype=archive.META)
+    meta["sequence"] = numpy.arange(count)
+    meta["timestamp"] = 100.0 + numpy.arange(count) * 0.5
+    meta["temperature"] = -10.0
+    return meta
+
+class TestEncoding():
+
+    def test_delta_shuffle_round_trip(self):
+        frames = numpy.array([[0, 65535, 7], [65535, 0, 7], [1, 2, 3]],
+                             dtype=numpy.uint16)
+        data = archive.encode_frames(frames)
+        assert len(data) == frames.nbytes
+
+        decoded = archive.decode_frames(data, 3, 3)
+        assert decoded.dtype == numpy.uint16
+        assert decoded.tolist() == frames.tolist()
+
+class TestArchive():
+
+    @pytest.mark.parametrize("codec", archive.codecs())
+    def test_round_trip(self, tmpdir, codec):
+        path = str(tmpdir.join("run.wspa"))
+        frames = benchmark.raman_frames(100, pixels=64)
+        with archive.ArchiveWriter(path, 64, {"serial": "WP-1"},
+                                   chunk_frames=16, codec=codec) as writer:
+            writer.append(frames[0], timestamp=100.0, temperature=-10.0)
+            writer.extend(frames[1:], stamped(100)[1:])
+
+        with archive.Archive(path) as reader:
+            assert len(reader) == 100
+            assert len(reader.index) == 7
+            assert reader.device == {"serial": "WP-1"}
+
+            meta, stored = reader.read()
+            assert stored.tolist() == frames.tolist()
+            assert meta["sequence"].tolist() == list(range(100))
+
+    def test_random_access(self, tmpdir):
+        path = str(tmpdir.join("run.wspa"))
+        frames = benchmark.raman_frames(50, pixels=32)
+        with archive.ArchiveWriter(path, 32, chunk_frames=8) as writer:
+            writer.extend(frames, stamped(50))
+
+        with archive.Archive(path) as reader:
+            meta, frame = reader.frame(37)
+            assert meta["sequence"] == 37
+            assert frame.tolist() == frames[37].tolist()
+
+            meta, block = reader.read(6, 19)
+            assert block.tolist() == frames[6:19].tolist()
+            assert reader.index_at(100.0 + 20 * 0.5 + 0.1) == 20
+            assert reader.index_at(99.0) == -1
+
+            with pytest.raises(IndexError):
+                reader.frame(50)
+
+    def test_unclosed_archive_scanned(self, tmpdir):
+        path = str(tmpdir.join("run.wspa"))
+        frames = benchmark.raman_frames(40, pixels=32)
+        writer = archive.ArchiveWriter(path, 32, chunk_frames=16)
+        writer.extend(frames, stamped(40))
+        writer.archive_file.close()
+
+        with archive.Archive(path) as reader:
+            assert len(reader) == 32
+            assert reader.read()[1].tolist() == frames[:32].tolist()
+            assert reader.index["stop"].tolist() == [107.5, 115.5]
+            assert reader.index_at(110.2) == 20
+
+    def test_zero_filled_tail_scanned(self, tmpdir):
+        path = str(tmpdir.join("run.wspa"))
+        writer = archive.ArchiveWriter(path, 32, chunk_frames=8)
+        writer.extend(benchmark.raman_frames(16, pixels=32), stamped(16))
+        writer.archive_file.write(b"\x00" * 4096)
+        writer.archive_file.close()
+
+        with archive.Archive(path) as reader:
+            assert len(reader) == 16
+            assert reader.frame(15)[0]["sequence"] == 15
+
+    def test_corrupt_chunk(self, tmpdir):
+        path = str(tmpdir.join("run.wspa"))
+        with archive.ArchiveWriter(path, 32, chunk_frames=8) as writer:
+            writer.extend(benchmark.raman_frames(8, pixels=32), stamped(8))
+        with archive.Archive(path) as reader:
+            offset = int(reader.index["offset"][0])
+
+        with open(path, "r+b") as archive_file:
+            archive_file.seek(offset + archive.CHUNK_HEADER.size + 10)
+            archive_file.write(b"\xff\x00\xff")
+
+        with archive.Archive(path) as reader:
+            with pytest.raises(IOError):
+                reader.frame(0)
+
+    def test_unknown_codec(self, tmpdir):
+        with pytest.raises(ValueError):
+            archive.ArchiveWriter(str(tmpdir.join("run")), 32,
+                                  codec="bzip")
+
+    def test_archive_recording(self, tmpdir):
+        source = str(tmpdir.join("run"))
+        frames = benchmark.raman_frames(30, pixels=32)
+        with recording.Recorder(source, 32, {"serial": "WP-1"}) as recorder:
+            for frame in frames:
+                recorder.append(frame, integration_time=10)
+
+        path = str(tmpdir.join("run.wspa"))
+        ratio = archive.archive_recording(source, path, chunk_frames=8)
+        assert ratio > 1.0
+
+        with archive.Archive(path) as reader:
+            assert reader.device == {"serial": "WP-1"}
+            meta, stored = reader.read()
+            assert stored.tolist() == frames.tolist()
+            assert meta["integration_time"].tolist() == [10] * 30
@@ -0,0 +1,94 @@
+""" Tests for the asyncio facade. Python 3 only; a stand-in blocking
+device is used so no hardware is required.
+"""
+
+import time
+import threading
+import pytest
+
+asyncio = pytest.importorskip("asyncio")
+
+from wasatchusb.async_device import AsyncDevice
+
+class BlockingDevice(object):
+    """ Mimics the blocking device calls, recording which thread ran
+    them and whether two ever overlapped.
+    """
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.busy = False
+        self.overlapped = False
+        self.threads = set()
+        self.integration_time = None
+
+    def _work(self):
+        if self.busy:
+            self.overlapped = True
+        self.busy = True
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        self.busy = False
+
+    def get_line(self):
+        self._work()
+        return [1, 2, 3]
+
+    def get_ccd_temperature(self):
+        self._work()
+        return 12.5
+
+    def set_integration_time(self, int_time):
+        self._work()
+        self.integration_time = int_time
+        return True
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+class TestAsyncDevice():
+
+    def test_calls_return_results(self):
+        adev = AsyncDevice(BlockingDevice())
+        assert run(adev.get_line()) == [1, 2, 3]
+        assert run(adev.get_ccd_temperature()) == 12.5
+        assert run(adev.set_integration_time(100)) is True
+        assert adev.device.integration_time == 100
+        adev.close()
+
+    def test_concurrent_calls_are_serialized(self):
+        device = BlockingDevice()
+        adev = AsyncDevice(device, max_pending=2)
+        loop = asyncio.new_event_loop()
+        calls = [loop.create_task(adev.get_line()) for _ in range(6)]
+        results = loop.run_until_complete(asyncio.gather(*calls))
+        loop.close()
+        assert len(results) == 6
+        assert not device.overlapped
+        assert len(device.threads) == 1
+        adev.close()
+
+    def test_timeout_does_not_interleave(self):
+        device = BlockingDevice(delay=0.2)
+        adev = AsyncDevice(device)
+        with pytest.raises(asyncio.TimeoutError):
+            run(adev.get_line(timeout=0.01))
+
+        # The timed out call finishes before the next one starts
+        assert run(adev.get_ccd_temperature()) == 12.5
+        assert not device.overlapped
+        adev.close()
+
+    def test_frames_iterator(self):
+        adev = AsyncDevice(BlockingDevice(delay=0))
+        frames = adev.frames(count=2)
+        loop = asyncio.new_event_loop()
+        assert loop.run_until_complete(frames.__anext__()) == [1, 2, 3]
+        assert loop.run_until_complete(frames.__anext__()) == [1, 2, 3]
+        with pytest.raises(StopAsyncIteration):
+            loop.run_until_complete(frames.__anext__())
+        loop.close()
+        adev.close()
@@ -0,0 +1,76 @@
+""" Tests for the host side scan averagers.
+"""
+
+import numpy
+import pytest
+import threading
+
+from wasatchusb import averaging
+
+class RampDevice(object):
+    """ Each line is every pixel set to the acquire count.
+    """
+    def __init__(self):
+        self.acquires = 0
+        self.lock = threading.RLock()
+
+    def send_acquire(self):
+        self.acquires += 1
+
+    def read_line_into(self, out):
+        out[:] = self.acquires
+        return out
+
+class TestScanAverager():
+
+    def test_scan_limits(self):
+        with pytest.raises(ValueError):
+            averaging.ScanAverager(8, 0)
+        with pytest.raises(ValueError):
+            averaging.ScanAverager(8, averaging.MAX_SCANS + 1)
+
+    def test_no_overflow_at_full_scale(self):
+        avg = averaging.ScanAverager(4, 10)
+        full = numpy.full(4, 65535, dtype=numpy.uint16)
+        for _ in range(9):
+            assert not avg.add(full)
+        assert avg.add(full)
+        assert avg.total.dtype == numpy.uint32
+        assert avg.average().tolist() == [65535.0] * 4
+
+    def test_acquire_reuses_buffers(self):
+        avg = averaging.ScanAverager(4, 4)
+        device = RampDevice()
+        first = avg.acquire(device)
+        assert first.tolist() == [2.5] * 4
+        second = avg.acquire(device)
+        assert second is first
+        assert second.tolist() == [6.5] * 4
+        assert device.acquires == 8
+
+    def test_empty_average(self):
+        assert averaging.ScanAverager(3, 2).average().tolist() == [0, 0, 0]
+
+class TestExponentialAverager():
+
+    def test_alpha_limits(self):
+        with pytest.raises(ValueError):
+            averaging.ExponentialAverager(4, 0.0)
+        with pytest.raises(ValueError):
+            averaging.ExponentialAverager(4, 1.5)
+
+    def test_moving_average(self):
+        avg = averaging.ExponentialAverager(2, 0.5)
+        avg.add(numpy.array([100, 0], dtype=numpy.uint16))
+        avg.add(numpy.array([0, 100], dtype=numpy.uint16))
+        assert avg.average().tolist() == [50.0, 50.0]
+        avg.add(numpy.array([0, 100], dtype=numpy.uint16))
+        assert avg.average().tolist() == [25.0, 75.0]
+
+    def test_create_by_name(self):
+        assert isinstance(averaging.create(8, 4),
+                          averaging.ScanAverager)
+        ema = averaging.create(8, 3, mode="ema")
+        assert ema.alpha == 0.5
+        with pytest.raises(ValueError):
+            averaging.create(8, mode="median")
@@ -0,0 +1,94 @@
+""" Tests for the acquisition benchmark suite, run on the fake backend.
+"""
+
+import json
+
+from wasatchusb import benchmark
+
+class TestBenchmark():
+
+    def test_result_percentiles(self):
+        latencies = [0.001] * 98 + [0.010, 0.100]
+        result = benchmark.BenchmarkResult("case", latencies, 0.5, 0.05)
+        assert result.iterations == 100
+        assert result.frames_per_second == 200.0
+        assert result.p50 == 1.0
+        assert 1.0 < result.p99 < 100.0
+        assert result.max == 100.0
+        assert result.cpu_per_frame == 0.5
+
+    def test_measure_counts_errors(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) % 2:
+                raise IOError("odd call")
+
+        result = benchmark.measure("flaky", flaky, 10, warmup=0)
+        assert result.iterations == 5
+        assert result.errors == 5
+
+        del calls[:]
+        result = benchmark.measure("flaky", flaky, 10, warmup=4)
+        assert result.iterations == 5
+        assert result.errors == 7
+
+    def test_connect_releases_handle(self):
+        suite = benchmark.fake_suite(iterations=5, device_iterations=5)
+        backend = suite.registry.backend
+        closed = []
+        close_device = backend.close_device
+
+        def counting_close(dev_handle):
+            closed.append(dev_handle)
+            close_device(dev_handle)
+
+        backend.close_device = counting_close
+        result = benchmark.measure("connect", suite.case_connect, 5,
+                                   warmup=0)
+        assert result.errors == 0
+        assert len(closed) == 5
+        assert suite.device.get_line() is not None
+
+    def test_fake_suite_json(self, tmpdir):
+        suite = benchmark.fake_suite(iterations=20, device_iterations=5)
+        results = suite.run()
+        assert [result.name for result in results] == \
+               list(benchmark.CASES)
+        assert all(result.errors == 0 for result in results)
+
+        filename = str(tmpdir.join("run.json"))
+        benchmark.write_report(filename, benchmark.report(results,
+                                                          fake=True))
+        summary = benchmark.read_report(filename)
+        assert summary["fake"] is True
+        assert summary["results"]["get_line"]["iterations"] == 5
+        json.dumps(summary)
+
+    def test_find_regressions(self):
+        def report(fps, p99):
+            return {"results": {"get_line": {
+                "frames_per_second": fps, "p99": p99,
+                "cpu_per_frame": 0.1}}}
+
+        assert benchmark.find_regressions(report(100, 1.0),
+                                          report(95, 1.1)) == []
+        regressions = benchmark.find_regressions(report(100, 1.0),
+                                                 report(50, 3.0))
+        assert [field for name, field, before, after in regressions] == \
+               ["frames_per_second", "p99"]
+
+    def test_archive_benchmark(self, tmpdir):
+        frames = benchmark.raman_frames(300, pixels=512)
+        assert frames.shape == (300, 512)
+
+        results = benchmark.archive_benchmark(frames, ("none", "zlib"),
+                                              chunk_frames=64,
+                                              directory=str(tmpdir))
+        none, zlib = results
+        assert zlib.raw_bytes == 300 * 512 * 2
+        assert zlib.ratio > 1.2
+        assert none.ratio < 1.0
+        assert zlib.write_mb_per_second > 0
+        assert tmpdir.listdir() == []
@@ -0,0 +1,89 @@
+""" Tests for the cached wavelength and wavenumber axes.
+"""
+
+import struct
+import pytest
+
+from wasatchusb import calibration, feature_identification
+
+COEFFS = (795.259, 4.65771e-02, -2.53654e-06, -6.00391e-11)
+
+def loop_wavelengths(coeffs, pixels):
+    c0, c1, c2, c3 = coeffs
+    return [c0 + (c1 * x) + (c2 * x * x) + (c3 * x * x * x)
+            for x in range(pixels)]
+
+class TestAxes():
+
+    def setup_method(self, method):
+        calibration.clear_cache()
+
+    def test_wavelengths_match_polynomial(self):
+        axis = calibration.wavelength_axis(COEFFS, 1024)
+        expected = loop_wavelengths(COEFFS, 1024)
+        assert len(axis) == 1024
+        assert max(abs(axis - expected)) < 1e-9
+
+    def test_wavenumbers(self):
+        axis = calibration.wavenumber_axis(COEFFS, 1024, 785.0)
+        assert "%05.2f" % axis[0] == "164.33"
+        assert "%05.2f" % axis[-1] == "836.76"
+
+    def test_axes_are_cached_and_read_only(self):
+        first = calibration.wavelength_axis(COEFFS, 1024)
+        assert calibration.wavelength_axis(list(COEFFS), 1024) is first
+        assert calibration.wavelength_axis(COEFFS, 512) is not first
+        with pytest.raises(ValueError):
+            first[0] = 0
+
+    def test_string_coefficients(self):
+        coeffs = ("7.25405E+02", "1.43880E-01", "7.16617E-06",
+                  "-8.68137E-09")
+        axis = calibration.wavenumber_axis(coeffs, 2048, 785.0)
+        assert "%05.2f" % axis[0] == "-1046.55"
+        assert "%05.2f" % axis[-1] == "2487.62"
+
+    def test_cache_is_bounded(self):
+        for offset in range(calibration.MAX_CACHED + 5):
+            calibration.wavelength_axis((offset, 1.0), 16)
+        assert len(calibration._axis_cache) <= calibration.MAX_CACHED
+
+    def test_calibration_object(self):
+        cal = calibration.Calibration(COEFFS, 1024, excitation=785.0)
+        assert cal.wavelengths() is calibration.wavelength_axis(COEFFS,
+                                                               1024)
+        assert cal.wavenumbers() is \
+               calibration.wavenumber_axis(COEFFS, 1024, 785.0)
+        with pytest.raises(ValueError):
+            calibration.Calibration(COEFFS, 1024).wavenumbers()
+
+class EepromHandle(object):
+    """ Serves the calibration page and counts control transfers.
+    """
+    def __init__(self, coeffs):
+        self.page = bytearray(struct.pack("4d", *coeffs)) + bytearray(32)
+        self.transfers = 0
+
+    def ctrl_transfer(self, bmRequestType, bmRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        self.transfers += 1
+        if bmRequestType == 0xC0:
+            return self.page
+        self.page = bytearray(data_or_wLength) + bytearray(16)
+        return len(data_or_wLength)
+
+class TestDeviceAxis():
+
+    def test_axis_read_once_and_invalidated(self):
+        device = feature_identification.Device()
+        device.device = EepromHandle(COEFFS)
+
+        axis = device.get_wavelength_axis()
+        transfers = device.device.transfers
+        assert device.get_wavelength_axis() is axis
+        assert len(device.get_wavenumber_axis(785.0)) == 1024
+        assert device.device.transfers == transfers
+
+        device.set_calibration((700.0, 0.1, 0, 0), (0, 0, 0, 0, 0), (0, 0))
+        new_axis = device.get_wavelength_axis()
+        assert new_axis[1] == pytest.approx(700.1)
@@ -0,0 +1,44 @@
+""" Tests for the decode module that turns raw bulk endpoint bytes into
+pixel data. No hardware required.
+"""
+
+import array
+import numpy
+
+from wasatchusb import decode
+
+class TestDecode():
+
+    def test_unpack_matches_list_decode(self):
+        raw = array.array("B", [(i * 7) % 256 for i in range(2048)])
+        expected = [i + 256 * j for i, j in zip(raw[::2], raw[1::2])]
+
+        pixels = decode.unpack_line(raw)
+        assert pixels.dtype == numpy.uint16
+        assert len(pixels) == 1024
+        assert pixels.tolist() == expected
+
+    def test_unpack_shares_memory(self):
+        raw = bytearray(8)
+        pixels = decode.unpack_line(raw)
+        raw[2] = 0x34
+        raw[3] = 0x12
+        assert pixels[1] == 0x1234
+
+    def test_odd_trailing_byte_ignored(self):
+        raw = bytearray([1, 0, 2, 0, 9])
+        assert decode.unpack_line(raw).tolist() == [1, 2]
+
+    def test_unpack_into(self):
+        raw = bytearray([0xFF, 0xFF, 0x00, 0x01])
+        out = numpy.zeros(2, dtype=numpy.uint16)
+        result = decode.unpack_line_into(raw, out)
+        assert result is out
+        assert out.tolist() == [65535, 256]
+
+    def test_list_output(self):
+        pixels = decode.unpack_line(bytearray([1, 0, 2, 0]))
+        assert decode.format_line(pixels) is pixels
+        as_list = decode.format_line(pixels, list_output=True)
+        assert as_list == [1, 2]
+        assert isinstance(as_list, list)
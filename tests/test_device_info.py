@@ -0,0 +1,76 @@
+""" Tests for the single pass DeviceInfo read on feature identification
+devices.
+"""
+
+import struct
+
+from wasatchusb import feature_identification
+
+class InfoHandle(object):
+    """ Serves fixed identity, calibration and firmware pages, counting
+    transfers per request.
+    """
+    def __init__(self):
+        identity = bytearray(64)
+        identity[0:5] = b"785LC"
+        identity[16:28] = b"S785LC-00047"
+        calibration = struct.pack("<4d8f", 795.2, 0.046, -2.5e-06,
+                                  -6.0e-11, 3566.62, -143.543, -0.32,
+                                  20.0, 10.0, 100.0, 0.0, 0.0)
+        self.pages = {
+            (0xFF, 0x01, 0): identity,
+            (0xFF, 0x01, 1): bytearray(calibration),
+            (0xFF, 0x03, 0): bytearray([0x00, 0x04]) + bytearray(62),
+            (0xFF, 0x08, 0): bytearray([1]) + bytearray(63),
+            (0xC0, 0, 0): bytearray([0, 0, 0, 10]) + bytearray(60),
+            (0xB4, 0, 0): bytearray(b"026-007") + bytearray(57),
+            (0xC5, 0, 0): bytearray([0, 1]) + bytearray(62),
+            (0xBF, 0, 0): bytearray([100, 0, 0]) + bytearray(61),
+        }
+        self.reads = {}
+
+    def ctrl_transfer(self, bmRequestType, bmRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        key = (bmRequest, wValue, wIndex)
+        self.reads[key] = self.reads.get(key, 0) + 1
+        return self.pages[key]
+
+class TestDeviceInfo():
+
+    def test_read_info_fields(self):
+        device = feature_identification.Device()
+        device.device = InfoHandle()
+        info = device.read_info()
+
+        assert info.model == "785LC"
+        assert info.serial == "S785LC-00047"
+        assert info.wavelength_coeffs[0] == 795.2
+        assert len(info.tec_coeffs) == 3
+        assert info.tec_max == 20.0
+        assert info.tec_min == 10.0
+        assert info.laser_max == 100.0
+        assert info.line_length == 1024
+        assert info.laser_available == 1
+        assert info.software_code == "10.0.0.0"
+        assert info.fpga_revision == "026-007"
+        assert info.integration_time == 100
+        assert info.as_dict()["serial"] == "S785LC-00047"
+
+    def test_matches_individual_getters_without_rereading(self):
+        device = feature_identification.Device()
+        device.device = InfoHandle()
+        info = device.read_info()
+
+        assert device.get_model_number() == info.model
+        assert device.get_serial_number() == info.serial
+        assert device.get_standard_software_code() == info.software_code
+        assert device.get_fpga_revision() == info.fpga_revision
+        assert device.get_sensor_line_length() == info.line_length
+        assert device.get_calibration("C0") == info.wavelength_coeffs[0]
+        assert device.device.reads[(0xFF, 0x01, 0)] == 1
+        assert device.device.reads[(0xFF, 0x01, 1)] == 1
+
+    def test_slots(self):
+        info = feature_identification.DeviceInfo(model="785L")
+        assert info.serial is None
+        assert not hasattr(info, "__dict__")
@@ -0,0 +1,76 @@
+""" Tests for the feature identification EEPROM page cache.
+"""
+
+from wasatchusb import feature_identification
+
+class PageHandle(object):
+    """ Answers upper area reads with a page tagged by wValue and
+    wIndex, and counts the transfers per request.
+    """
+    def __init__(self):
+        self.reads = {}
+        self.fail = False
+
+    def ctrl_transfer(self, bmRequestType, bmRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        key = (bmRequest, wValue, wIndex)
+        self.reads[key] = self.reads.get(key, 0) + 1
+        if self.fail:
+            raise IOError("Pipe error")
+        if bmRequestType == 0x40:
+            return len(data_or_wLength)
+
+        page = bytearray(64)
+        page[0] = 0x00
+        page[1] = 0x04
+        for pos, letter in enumerate(b"785L"):
+            page[pos] = letter
+        for pos, letter in enumerate(b"S-0001"):
+            page[16 + pos] = letter
+        return page
+
+def make_device():
+    device = feature_identification.Device()
+    device.device = PageHandle()
+    return device
+
+class TestEepromCache():
+
+    def test_identity_reads_hit_device_once(self):
+        device = make_device()
+        for _ in range(3):
+            assert device.get_model_number() == "785L"
+            assert device.get_serial_number() == "S-0001"
+            device.get_sensor_line_length()
+            device.get_laser_availability()
+            for name in ("C0", "C1", "C2", "C3"):
+                device.get_calibration(name)
+
+        reads = device.device.reads
+        assert reads[(0xFF, 0x01, 0)] == 1
+        assert reads[(0xFF, 0x01, 1)] == 1
+        assert reads[(0xFF, 0x03, 0)] == 1
+        assert reads[(0xFF, 0x08, 0)] == 1
+
+    def test_write_invalidates(self):
+        device = make_device()
+        device.get_calibration("C0")
+        device.set_calibration((1, 2, 3, 4), (0, 0, 0, 0, 0), (0, 0))
+        assert device.eeprom_cache == {}
+        device.get_calibration("C0")
+        assert device.device.reads[(0xFF, 0x01, 1)] == 2
+
+    def test_explicit_invalidate(self):
+        device = make_device()
+        device.get_model_number()
+        device.invalidate_eeprom()
+        device.get_model_number()
+        assert device.device.reads[(0xFF, 0x01, 0)] == 2
+
+    def test_failures_not_cached(self):
+        device = make_device()
+        device.device.fail = True
+        assert device.get_upper_code(0x01) is None
+        device.device.fail = False
+        assert device.get_model_number() == "785L"
+        assert device.device.reads[(0xFF, 0x01, 0)] == 2
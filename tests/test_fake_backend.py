@@ -0,0 +1,124 @@
+""" Tests for the opcode level fake pyusb backend, driving the real
+protocol Device classes without a spectrometer attached.
+"""
+
+import time
+
+import numpy
+import pytest
+import usb.core
+
+from wasatchusb import registry
+from wasatchusb import fake_backend
+from wasatchusb import feature_identification
+from wasatchusb import stroker_protocol
+
+class TestFakeBackend():
+
+    def test_find_through_backend(self):
+        backend = fake_backend.FakeBackend([
+            fake_backend.FakeSpectrometer(pid=0x1000, address=3),
+            fake_backend.FakeSpectrometer(pid=0x0009, address=4)])
+
+        found = list(usb.core.find(find_all=True, idVendor=0x24aa,
+                                   backend=backend))
+        assert [dev.idProduct for dev in found] == [0x1000, 0x0009]
+        assert found[1].address == 4
+
+    def test_feature_identification_pages(self):
+        device = fake_backend.fake_device(pid=0x1000, serial="WP-00123",
+                                          model="785L")
+        unit = device.backend.devices[0]
+        assert isinstance(device, feature_identification.Device)
+
+        info = device.read_info()
+        assert info.serial == "WP-00123"
+        assert info.model == "785L"
+        assert info.line_length == 1024
+        assert info.laser_available == 1
+        assert info.software_code == "1.2.3.4"
+        assert info.fpga_revision == "010-007"
+        assert info.wavelength_coeffs == unit.wavelength_coeffs
+
+        device.set_calibration([700.0, 0.1, 0.0, 0.0], [1, 2, 3, 20, 10],
+                               [0, 0])
+        assert device.get_calibration("C0") == 700.0
+
+    def test_settings_round_trip(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.set_integration_time(250)
+        assert device.get_integration_time() == 250
+
+        device.set_laser_enable(1)
+        assert device.backend.devices[0].laser_enable == 1
+
+        temperature = device.get_ccd_temperature()
+        assert 5 < temperature < 15
+
+    def test_get_line_and_lines(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        unit = device.backend.devices[0]
+
+        line = device.get_line()
+        assert line.dtype == numpy.uint16
+        numpy.testing.assert_array_equal(line, unit.spectrum)
+
+        lines = device.get_lines(5)
+        assert lines.shape == (5, 1024)
+        assert unit.frames == 6
+
+    def test_stroker_mti_reads_both_endpoints(self):
+        device = fake_backend.fake_device(pid=0x0001)
+        unit = device.backend.devices[0]
+        assert isinstance(device, stroker_protocol.StrokerProtocolDevice)
+
+        line = device.get_line()
+        assert len(line) == 2048
+        numpy.testing.assert_array_equal(line, unit.spectrum)
+
+        lines = device.get_lines(2)
+        numpy.testing.assert_array_equal(lines[1], unit.spectrum)
+
+        coeffs = [float(coeff) for coeff in
+                  device.get_calibration_coeffs()]
+        assert coeffs == list(unit.wavelength_coeffs)
+        assert device.get_laser_temperature() == pytest.approx(25, abs=1)
+
+    def test_external_trigger_waits_for_input(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        unit = device.backend.devices[0]
+        device.set_trigger_source(1)
+        unit.trigger_source = 1
+
+        with pytest.raises(usb.core.USBError):
+            device.device.read(0x82, 2048, timeout=20)
+
+        unit.trigger(2)
+        lines = device.get_lines(2)
+        assert lines.shape == (2, 1024)
+        assert unit.acquires == 0
+
+    def test_unknown_opcode_stalls(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        with pytest.raises(usb.core.USBError):
+            device.device.ctrl_transfer(0xC0, 0x99, 0, 0, 64)
+
+    def test_line_latency(self):
+        device = fake_backend.fake_device(pid=0x1000, line_latency=0.01)
+        start = time.time()
+        device.get_lines(3)
+        assert time.time() - start >= 0.03
+
+    def test_registry_and_stream(self):
+        backend = fake_backend.FakeBackend([
+            fake_backend.FakeSpectrometer(pid=0x1000, serial="WP-1")])
+        devices = registry.DeviceRegistry(backend=backend)
+
+        device = devices.open(serial="WP-1")
+        assert device is not None
+
+        device.start_stream(depth=8)
+        assert device.stream.ring.wait(3, timeout=2.0)
+        device.stop_stream()
+        sequences, stamps, frames = device.read_n(3)
+        assert frames.shape == (3, 1024)
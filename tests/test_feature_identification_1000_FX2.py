@@ -95,7 +95,7 @@ class TestFeatureIdentification():
         assert min(result) >= 10
         assert max(result) <= 65535
 
-        average = sum(result) / len(result)
+        average = int(result.sum()) / len(result)
         assert average >= 20
 
     def test_set_integration_time(self, device):
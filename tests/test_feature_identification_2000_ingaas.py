@@ -111,5 +111,5 @@ class TestFeatureIdentification():
         assert min(result) >= 10
         assert max(result) <= 65535
 
-        average = sum(result) / len(result)
+        average = int(result.sum()) / len(result)
         assert average >= 20
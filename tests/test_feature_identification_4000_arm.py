@@ -117,7 +117,7 @@ class TestFeatureIdentification():
             assert min(result) >= 10
             assert max(result) <= 65535
 
-            average = sum(result) / len(result)
+            average = int(result.sum()) / len(result)
             assert average >= 20
             max_count += 1
 
@@ -127,7 +127,7 @@ class TestFeatureIdentification():
         assert min(result) >= 10
         assert max(result) <= 65535
 
-        average = sum(result) / len(result)
+        average = int(result.sum()) / len(result)
         assert average >= 20
 
     def test_get_arm_integration_time(self, device):
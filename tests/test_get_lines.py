@@ -0,0 +1,95 @@
+""" Tests for batched get_lines on both device classes. A minimal
+stand-in for the pyusb handle fills each line with a frame counter.
+"""
+
+import numpy
+import pytest
+
+from wasatchusb import feature_identification, stroker_protocol
+
+class LineHandle(object):
+    """ Answers ctrl_transfer and bulk reads like pyusb, where the bulk
+    line is every pixel set to the number of acquires seen.
+    """
+    def __init__(self):
+        self.acquires = 0
+        self.reads = 0
+
+    def ctrl_transfer(self, bmRequestType, bmRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        if bmRequest == 0xAD:
+            self.acquires += 1
+        return 0
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        self.reads += 1
+        pixel = bytearray([self.acquires % 256, 0])
+        if isinstance(size_or_buffer, int):
+            return pixel * (size_or_buffer // 2)
+        size_or_buffer[:] = type(size_or_buffer)("B", pixel) * \
+                            (len(size_or_buffer) // 2)
+        return len(size_or_buffer)
+
+def make_device(device_class, pid):
+    device = device_class(pid=pid)
+    device.device = LineHandle()
+    return device
+
+class TestGetLines():
+
+    @pytest.mark.parametrize("device_class,pid,pixels", [
+        (feature_identification.Device, 0x1000, 1024),
+        (feature_identification.Device, 0x2000, 512),
+        (stroker_protocol.StrokerProtocolDevice, 0x0009, 1024),
+        (stroker_protocol.StrokerProtocolDevice, 0x0001, 2048),
+    ])
+    def test_shape_and_order(self, device_class, pid, pixels):
+        device = make_device(device_class, pid)
+        lines = device.get_lines(5)
+        assert lines.shape == (5, pixels)
+        assert lines.dtype == numpy.uint16
+        assert lines[:, 0].tolist() == [1, 2, 3, 4, 5]
+        assert lines[:, -1].tolist() == [1, 2, 3, 4, 5]
+        assert device.device.acquires == 5
+
+    def test_caller_buffer(self):
+        device = make_device(feature_identification.Device, 0x1000)
+        out = numpy.zeros((8, 1024), dtype=numpy.uint16)
+        lines = device.get_lines(3, out=out)
+        assert lines.base is out
+        assert out[:3, 0].tolist() == [1, 2, 3]
+        assert out[3:].sum() == 0
+
+    def test_caller_buffer_wrong_shape(self):
+        device = make_device(feature_identification.Device, 0x1000)
+        with pytest.raises(ValueError):
+            device.get_lines(3, out=numpy.zeros((2, 1024), numpy.uint16))
+        with pytest.raises(ValueError):
+            device.get_lines(3, out=numpy.zeros((3, 512), numpy.uint16))
+
+    @pytest.mark.parametrize("device_class,pid", [
+        (feature_identification.Device, 0x1000),
+        (stroker_protocol.StrokerProtocolDevice, 0x0001),
+    ])
+    def test_short_read_raises(self, device_class, pid):
+        device = make_device(device_class, pid)
+        device.get_lines(1)
+
+        # Only part of the line arrives; the tail still holds line 1
+        device.device.read = lambda endpoint, buff, timeout=None: 100
+        with pytest.raises(IOError):
+            device.get_lines(1)
+
+    def test_matches_get_line(self):
+        device = make_device(feature_identification.Device, 0x1000)
+        line = device.get_line()
+        assert line[0] == 1
+        assert device.get_lines(1)[0, 0] == 2
+
+    def test_averaged_line(self):
+        device = make_device(stroker_protocol.StrokerProtocolDevice, 0x0009)
+        device.set_scans_to_average(3)
+        line = device.get_averaged_line()
+        assert line.shape == (1024,)
+        assert line[0] == 2.0
+        assert device.get_averaged_line()[0] == 5.0
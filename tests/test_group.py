@@ -0,0 +1,79 @@
+""" Tests for the multi device group. Stand-in devices replace real
+hardware.
+"""
+
+import time
+import threading
+
+from wasatchusb import group
+
+class SlowDevice(object):
+    def __init__(self, value, delay=0.05):
+        self.value = value
+        self.delay = delay
+        self.integration_time = None
+        self.disconnected = False
+
+    def get_line(self):
+        time.sleep(self.delay)
+        return [self.value] * 4
+
+    def set_integration_time(self, int_time, force=False):
+        self.integration_time = int_time
+        self.forced = force
+        return True
+
+    def disconnect(self):
+        self.disconnected = True
+        return True
+
+class BrokenDevice(SlowDevice):
+    def get_line(self):
+        raise IOError("USB timeout")
+
+class TestDeviceGroup():
+
+    def test_concurrent_acquire(self):
+        devices = [SlowDevice(value) for value in range(4)]
+        dev_group = group.DeviceGroup(devices)
+
+        start = time.time()
+        bundle = dev_group.get_line(timeout=2.0)
+        elapsed = time.time() - start
+
+        # Four 50ms devices in parallel finish well under 200ms
+        assert elapsed < 0.15
+        assert bundle.complete()
+        assert [frame[0] for frame in bundle.frames] == [0, 1, 2, 3]
+        assert bundle.skew() < 0.05
+        dev_group.close()
+        assert all(device.disconnected for device in devices)
+
+    def test_broadcast_setter(self):
+        devices = [SlowDevice(value, delay=0) for value in range(3)]
+        dev_group = group.DeviceGroup(devices)
+        bundle = dev_group.call("set_integration_time", 25)
+        assert bundle.frames == [True, True, True]
+        assert all(device.integration_time == 25 for device in devices)
+
+        bundle = dev_group.call("set_integration_time", 30, force=True,
+                                timeout=1.0)
+        assert bundle.complete()
+        assert all(device.forced for device in devices)
+        dev_group.close()
+
+    def test_errors_and_timeouts(self):
+        devices = [SlowDevice(0, delay=0), BrokenDevice(1),
+                   SlowDevice(2, delay=0.5)]
+        dev_group = group.DeviceGroup(devices)
+        bundle = dev_group.get_line(timeout=0.1)
+        assert not bundle.complete()
+        assert bundle.frames[0] == [0] * 4
+        assert isinstance(bundle.errors[1], IOError)
+        assert bundle.timestamps[2] is None
+
+        # The late answer is discarded, not mixed into the next bundle
+        time.sleep(0.5)
+        bundle = dev_group.call("set_integration_time", 5, timeout=1.0)
+        assert bundle.frames[2] is True
+        dev_group.close()
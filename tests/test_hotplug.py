@@ -0,0 +1,115 @@
+""" Tests for the polling hotplug monitor. The bus is a list of
+descriptor-only devices that the tests add to and remove from.
+"""
+
+import time
+import pytest
+
+from wasatchusb import hotplug, registry
+
+class BusDevice(object):
+    def __init__(self, pid, bus, address, serial=None):
+        self.idVendor = 0x24aa
+        self.idProduct = pid
+        self.bus = bus
+        self.address = address
+        self.iSerialNumber = 3 if serial else 0
+        self.serial = serial
+
+@pytest.fixture
+def bus(monkeypatch):
+    devices = [BusDevice(0x1000, 1, 4, "WP-00001")]
+
+    def find(find_all=False, idVendor=None, **kwargs):
+        return iter([dev for dev in devices if dev.idVendor == idVendor])
+
+    def get_string(dev, index, langid=None):
+        if dev not in devices:
+            raise IOError("No such device")
+        return dev.serial
+
+    monkeypatch.setattr(registry.usb.core, "find", find)
+    monkeypatch.setattr(registry.usb.util, "get_string", get_string)
+    return devices
+
+def make_monitor():
+    attached = []
+    detached = []
+    monitor = hotplug.HotplugMonitor(registry.DeviceRegistry(),
+                                     on_attach=attached.append,
+                                     on_detach=detached.append,
+                                     interval=0.01, use_libusb=False)
+    return monitor, attached, detached
+
+class TestHotplugMonitor():
+
+    def test_poll_applies_differences(self, bus):
+        monitor, attached, detached = make_monitor()
+        monitor.registry.entries()
+        scans = monitor.registry.scans
+
+        assert monitor.poll_once() == ([], [])
+
+        bus.append(BusDevice(0x0009, 1, 5, "WP-00002"))
+        new, gone = monitor.poll_once()
+        assert [entry.serial for entry in attached] == ["WP-00002"]
+        assert monitor.registry.find(serial="WP-00002").pid == 0x0009
+
+        del bus[0]
+        new, gone = monitor.poll_once()
+        assert [entry.serial for entry in detached] == ["WP-00001"]
+        assert monitor.registry.match(pid=0x1000) is None
+
+        # Incremental updates never trigger a full registry rescan
+        assert monitor.registry.scans == scans
+
+    def test_reused_address_with_new_pid(self, bus):
+        monitor, attached, detached = make_monitor()
+        monitor.registry.entries()
+        bus[0] = BusDevice(0x4000, 1, 4)
+        monitor.poll_once()
+        assert [entry.pid for entry in detached] == [0x1000]
+        assert [entry.pid for entry in attached] == [0x4000]
+
+    def test_callback_errors_are_contained(self, bus):
+        def broken(entry):
+            raise RuntimeError("callback bug")
+
+        monitor = hotplug.HotplugMonitor(registry.DeviceRegistry(),
+                                         on_attach=broken,
+                                         use_libusb=False)
+        monitor.registry.entries()
+        bus.append(BusDevice(0x0009, 1, 5))
+        new, gone = monitor.poll_once()
+        assert len(new) == 1
+
+    def test_thread_reports_attach(self, bus):
+        monitor, attached, detached = make_monitor()
+        monitor.start()
+        bus.append(BusDevice(0x2000, 2, 3, "WP-00003"))
+        for _ in range(100):
+            if attached:
+                break
+            time.sleep(0.01)
+        assert monitor.stop(timeout=1.0)
+        assert attached[0].serial == "WP-00003"
+
+    def test_baseline_device_detached_with_serial(self, bus):
+        monitor, attached, detached = make_monitor()
+        monitor.start()
+        del bus[0]
+        for _ in range(100):
+            if detached:
+                break
+            time.sleep(0.01)
+        assert monitor.stop(timeout=1.0)
+        assert [(entry.pid, entry.serial) for entry in detached] == \
+               [(0x1000, "WP-00001")]
+
+    def test_rescan_keeps_serials(self, bus):
+        monitor, attached, detached = make_monitor()
+        monitor.registry.serial_index()
+        monitor.registry.refresh()
+        del bus[0]
+        monitor.poll_once()
+        assert detached[0].serial == "WP-00001"
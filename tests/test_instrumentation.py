@@ -0,0 +1,66 @@
+""" Tests for the per opcode and per endpoint transfer statistics.
+"""
+
+import pytest
+import usb.core
+
+from wasatchusb import fake_backend
+from wasatchusb import instrumentation
+
+class TestTransferCounter():
+
+    def test_histogram_buckets(self):
+        counter = instrumentation.TransferCounter()
+        for count in range(99):
+            counter.add(0.000100, 64, False)
+        counter.add(0.5, 0, True)
+
+        assert counter.calls == 100
+        assert counter.bytes == 99 * 64
+        assert counter.errors == 1
+        assert counter.max == 0.5
+        assert counter.histogram[7] == 99
+        assert counter.histogram[-1] == 0
+        assert 0.0001 <= counter.percentile(0.5) <= 0.000128
+        assert counter.percentile(1.0) == 0.5
+
+class TestDeviceStats():
+
+    def test_counts_by_opcode_and_endpoint(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.reset_stats()
+
+        device.get_lines(3)
+        device.get_ccd_temperature()
+        device.set_integration_time(100)
+
+        stats = device.stats()
+        assert stats["control"][0xAD]["calls"] == 3
+        assert stats["control"][0xD7]["calls"] == 1
+        assert stats["control"][0xD7]["bytes"] == 64
+        assert stats["control"][0xB2]["errors"] == 0
+        assert stats["bulk"][0x82]["calls"] == 3
+        assert stats["bulk"][0x82]["bytes"] == 3 * 2048
+        assert sum(stats["bulk"][0x82]["histogram"]) == 3
+
+    def test_errors_counted_when_swallowed(self):
+        device = fake_backend.fake_device(pid=0x0009)
+        device.reset_stats()
+        assert device.get_code(0x99) is None
+
+        with pytest.raises(usb.core.USBError):
+            device.device.read(0x82, 2048, timeout=10)
+
+        stats = device.stats()
+        assert stats["control"][0x99]["errors"] == 1
+        assert stats["bulk"][0x82]["errors"] == 1
+
+    def test_reset(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.get_line()
+        assert device.stats()["bulk"]
+
+        device.reset_stats()
+        stats = device.stats()
+        assert stats["bulk"] == {}
+        assert stats["control"] == {}
@@ -0,0 +1,103 @@
+""" Tests for the append only binary recorder and memmap reader.
+"""
+
+import os
+
+import numpy
+import pytest
+
+from wasatchusb import recording
+from wasatchusb import fake_backend
+
+def ramp(value, pixels=8):
+    return numpy.arange(pixels, dtype=numpy.uint16) + value
+
+class TestRecorder():
+
+    def test_round_trip_across_chunks(self, tmpdir):
+        path = str(tmpdir.join("run"))
+        with recording.Recorder(path, 8, {"serial": "WP-1"},
+                                chunk_frames=4) as recorder:
+            for index in range(10):
+                recorder.append(ramp(index), timestamp=100.0 + index,
+                                integration_time=20, temperature=-5.0)
+
+        data = recording.Recording(path)
+        assert len(data) == 10
+        assert isinstance(data.frames, numpy.memmap)
+        assert data.frames.shape == (10, 8)
+        assert data.frames[7].tolist() == ramp(7).tolist()
+        assert data.meta["sequence"].tolist() == list(range(10))
+        assert data.meta["integration_time"][0] == 20
+        assert data.meta["temperature"][9] == -5.0
+        assert data.device == {"serial": "WP-1"}
+
+    def test_time_index(self, tmpdir):
+        path = str(tmpdir)
+        with recording.Recorder(path, 8) as recorder:
+            for index in range(10):
+                recorder.append(ramp(index), timestamp=100.0 + index)
+
+        data = recording.Recording(path)
+        assert data.index_at(104.5) == 4
+        assert data.index_at(99.0) == -1
+
+        meta, frames = data.between(103.0, 106.0)
+        assert meta["timestamp"].tolist() == [103.0, 104.0, 105.0]
+        assert frames[:, 0].tolist() == [3, 4, 5]
+
+    def test_append_trims_partial_frame(self, tmpdir):
+        path = str(tmpdir)
+        with recording.Recorder(path, 8) as recorder:
+            recorder.append(ramp(0))
+            recorder.append(ramp(1))
+
+        # An interrupted run leaves half a frame behind
+        with open(os.path.join(path, recording.FRAMES), "ab") as frames:
+            frames.write(b"\x00" * 5)
+        assert len(recording.Recording(path)) == 2
+
+        with recording.Recorder(path, 8) as recorder:
+            recorder.append(ramp(2))
+
+        data = recording.Recording(path)
+        assert data.meta["sequence"].tolist() == [0, 1, 2]
+        assert data.frames[2].tolist() == ramp(2).tolist()
+
+        with pytest.raises(ValueError):
+            recording.Recorder(path, 16)
+
+    def test_empty_dataset(self, tmpdir):
+        recording.Recorder(str(tmpdir), 8).close()
+        data = recording.Recording(str(tmpdir))
+        assert data.frames.shape == (0, 8)
+        assert data.index_at(1.0) == -1
+
+class TestRecordDevice():
+
+    def test_record_lines(self, tmpdir):
+        device = fake_backend.fake_device(pid=0x1000)
+        unit = device.backend.devices[0]
+        device.set_integration_time(15)
+
+        path = str(tmpdir.join("run"))
+        assert recording.record(device, path, 5, chunk_frames=2) == 5
+
+        data = recording.Recording(path)
+        assert data.device["serial"] == unit.serial
+        assert data.device["wavelength_coeffs"] == \
+               list(unit.wavelength_coeffs)
+        assert data.meta["integration_time"].tolist() == [15] * 5
+        assert numpy.isnan(data.meta["temperature"]).all()
+        assert (numpy.diff(data.timestamps) >= 0).all()
+        assert data.frames[4].tolist() == device.get_line().tolist()
+
+    def test_integration_time_read_from_device(self, tmpdir):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.backend.devices[0].integration_time = 12
+        assert device.get_integration_time() == 12
+
+        path = str(tmpdir.join("run"))
+        recording.record(device, path, 2)
+        data = recording.Recording(path)
+        assert data.meta["integration_time"].tolist() == [12, 12]
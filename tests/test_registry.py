@@ -0,0 +1,105 @@
+""" Tests for the cached device registry. The pyusb enumeration call is
+replaced with a fixed list of descriptor-only devices.
+"""
+
+import pytest
+
+from wasatchusb import registry, feature_identification, stroker_protocol
+from wasatchusb import utils
+
+class BusDevice(object):
+    """ The descriptor fields the registry reads from a usb.core.Device.
+    """
+    def __init__(self, pid, bus, address, serial=None):
+        self.idVendor = 0x24aa
+        self.idProduct = pid
+        self.bus = bus
+        self.address = address
+        self.iSerialNumber = 3 if serial else 0
+        self.serial = serial
+
+# Device list of the current bus fixture, for tests that plug units in
+bus_devices = []
+
+@pytest.fixture
+def bus(monkeypatch):
+    devices = [BusDevice(0x1000, 1, 4, "WP-00001"),
+               BusDevice(0x0009, 1, 5, "WP-00002"),
+               BusDevice(0x1000, 2, 7, "WP-00003"),
+               BusDevice(0x4000, 2, 9)]
+    scans = []
+    bus_devices.append(devices)
+
+    def find(find_all=False, idVendor=None, **kwargs):
+        scans.append(idVendor)
+        return iter([dev for dev in devices if dev.idVendor == idVendor])
+
+    def get_string(dev, index, langid=None):
+        return dev.serial
+
+    monkeypatch.setattr(registry.usb.core, "find", find)
+    monkeypatch.setattr(registry.usb.util, "get_string", get_string)
+    monkeypatch.setattr(registry, "_registries", {})
+    return scans
+
+class TestRegistry():
+
+    def test_device_class_by_pid(self):
+        assert registry.device_class(0x1000) is feature_identification.Device
+        assert registry.device_class(0x4000) is feature_identification.Device
+        assert registry.device_class(0x0001) is \
+               stroker_protocol.StrokerProtocolDevice
+
+    def test_single_scan_is_cached(self, bus):
+        reg = registry.get_registry()
+        assert len(reg.entries()) == 4
+        assert len(reg.entries()) == 4
+        assert reg.find(pid=0x0009).address == 5
+        assert reg.find(serial="WP-00003").location() == (2, 7)
+        assert reg.find(bus=2, address=9).pid == 0x4000
+        assert bus == [0x24aa]
+
+        reg.invalidate()
+        reg.entries()
+        assert len(bus) == 2
+
+    def test_miss_scans_again(self, bus):
+        reg = registry.get_registry()
+        assert reg.find(serial="WP-00009") is None
+        assert len(bus) == 1
+
+        # Plugged in after the scan
+        bus_devices[-1].append(BusDevice(0x2000, 3, 2, "WP-00009"))
+        assert reg.find(serial="WP-00009").location() == (3, 2)
+        assert reg.find(pid=0x2000).address == 2
+        assert len(bus) == 2
+
+    def test_indexes(self, bus):
+        reg = registry.get_registry()
+        reg.entries()
+        assert [entry.address for entry in reg.by_pid[0x1000]] == [4, 7]
+        assert sorted(reg.serial_index()) == ["WP-00001", "WP-00002",
+                                              "WP-00003"]
+        assert reg.find(serial="missing") is None
+        assert reg.find(pid=0x1000, bus=2).address == 7
+
+    def test_entry_creates_protocol_device(self, bus):
+        entry = registry.get_registry().find(serial="WP-00002")
+        device = entry.create(list_output=True)
+        assert isinstance(device, stroker_protocol.StrokerProtocolDevice)
+        assert device.find_match() == {"idVendor": 0x24aa,
+                                       "idProduct": 0x0009,
+                                       "bus": 1, "address": 5}
+        assert device.list_output
+
+    def test_legacy_listings_share_scan(self, bus):
+        fid = feature_identification.ListDevices().get_all()
+        assert fid == [("0x24aa", "0x1000"), ("0x24aa", "0x9"),
+                       ("0x24aa", "0x1000"), ("0x24aa", "0x4000")]
+        stroker = stroker_protocol.ListDevices().get_all()
+        assert stroker == [("0x24aa", "0x9")]
+
+        result, usb_list = utils.FindDevices().list_usb()
+        assert usb_list[0] == "24aa:1000:3 "
+        assert utils.FindDevices().get_serial(0x24aa, 0x1000) == \
+               (True, "WP-00001")
@@ -0,0 +1,98 @@
+""" Tests for playing recorded datasets back through the Device interface.
+"""
+
+import time
+
+import numpy
+import pytest
+
+from wasatchusb import replay
+from wasatchusb import recording
+from wasatchusb import fake_backend
+
+def write_dataset(path, count=5, interval=0.05, pixels=8):
+    info = {"serial": "WP-1", "model": "785L",
+            "wavelength_coeffs": [780.0, 0.2, -1e-5, 0.0]}
+    with recording.Recorder(path, pixels, info) as recorder:
+        for index in range(count):
+            recorder.append(numpy.full(pixels, index, numpy.uint16),
+                            timestamp=1000.0 + index * interval,
+                            integration_time=10 + index,
+                            temperature=-10.0 + index)
+    return path
+
+class TestReplayDevice():
+
+    def test_lines_in_order_then_end(self, tmpdir):
+        device = replay.ReplayDevice(write_dataset(str(tmpdir)))
+        assert device.connect()
+        assert device.get_pixel_count() == 8
+
+        firsts = [int(device.get_line()[0]) for count in range(5)]
+        assert firsts == [0, 1, 2, 3, 4]
+        assert device.get_ccd_temperature() == -6.0
+        assert device.get_integration_time() == 14
+        assert device.get_line() is None
+
+    def test_loop_and_get_lines(self, tmpdir):
+        device = replay.ReplayDevice(write_dataset(str(tmpdir)), loop=True)
+        lines = device.get_lines(7)
+        assert lines[:, 0].tolist() == [0, 1, 2, 3, 4, 0, 1]
+
+    def test_realtime_pacing(self, tmpdir):
+        path = write_dataset(str(tmpdir), interval=0.05)
+        start = time.time()
+        replay.ReplayDevice(path).get_lines(5)
+        assert time.time() - start < 0.1
+
+        start = time.time()
+        replay.ReplayDevice(path, realtime=True).get_lines(5)
+        assert time.time() - start >= 0.19
+
+        start = time.time()
+        replay.ReplayDevice(path, realtime=True, speed=4.0).get_lines(5)
+        assert time.time() - start < 0.15
+
+    def test_empty_dataset(self, tmpdir):
+        recording.Recorder(str(tmpdir), 8).close()
+        device = replay.ReplayDevice(str(tmpdir))
+        assert not device.connect()
+        assert device.get_line() is None
+
+    def test_calibration_from_recorded_unit(self, tmpdir):
+        unit_device = fake_backend.fake_device(pid=0x1000, serial="WP-00042")
+        path = str(tmpdir.join("run"))
+        recording.record(unit_device, path, 3)
+
+        device = replay.ReplayDevice(path)
+        assert device.get_serial_number() == "WP-00042"
+        assert device.read_info().line_length == 1024
+        assert device.get_calibration("C1") == \
+               unit_device.get_calibration("C1")
+        numpy.testing.assert_allclose(device.get_wavelength_axis(),
+                                      unit_device.get_wavelength_axis())
+        assert device.get_line().tolist() == unit_device.get_line().tolist()
+
+    def test_stream_and_average(self, tmpdir):
+        device = replay.ReplayDevice(write_dataset(str(tmpdir)), loop=True)
+        device.set_scans_to_average(5)
+        assert device.get_averaged_line()[0] == 2.0
+
+        device.start_stream(depth=8)
+        deadline = time.time() + 2.0
+        while device.stream.ring.count < 10 and time.time() < deadline:
+            time.sleep(0.005)
+        device.stop_stream()
+
+        sequences, stamps, frames = device.read_n(5)
+        assert len(frames) == 5
+        assert device.stream.errors == 0
+
+    def test_stream_ends_with_dataset(self, tmpdir):
+        device = replay.ReplayDevice(write_dataset(str(tmpdir)))
+        device.start_stream(depth=8)
+        device.stream.join(2.0)
+        assert not device.stream.is_alive()
+        assert device.stream.ring.count == 5
+        assert device.stream.errors == 0
+        assert device.read_n(5)[2][:, 0].tolist() == [0, 1, 2, 3, 4]
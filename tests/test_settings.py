@@ -0,0 +1,107 @@
+""" Tests for the write-through settings cache.
+"""
+
+import pytest
+
+from wasatchusb import settings
+from wasatchusb import fake_backend
+
+def sent(device, opcode):
+    return device.stats()["control"].get(opcode, {}).get("calls", 0)
+
+class TestSettingsCache():
+
+    def test_changed_and_invalidate(self):
+        cache = settings.SettingsCache()
+        assert cache.changed("integration_time", 10)
+
+        cache.store("integration_time", 10)
+        assert not cache.changed("integration_time", 10)
+        assert cache.changed("integration_time", 11)
+
+        cache.invalidate("integration_time")
+        assert cache.get("integration_time") is None
+
+class TestDeviceSettings():
+
+    def test_skips_repeated_writes(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.reset_stats()
+
+        device.set_integration_time(100)
+        device.set_integration_time(100)
+        device.set_integration_time(100, force=True)
+        assert sent(device, 0xB2) == 2
+        assert device.backend.devices[0].integration_time == 100
+
+    def test_getter_served_from_cache(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.reset_stats()
+
+        device.set_integration_time(30)
+        assert device.get_integration_time() == 30
+        assert device.integration_time == 30
+        assert sent(device, 0xBF) == 0
+
+        # Changed behind our back, only seen on refresh
+        device.backend.devices[0].integration_time = 45
+        assert device.get_integration_time() == 30
+        assert device.get_integration_time(refresh=True) == 45
+        assert device.integration_time == 45
+        assert sent(device, 0xBF) == 1
+
+    def test_stroker_tec_double_write_skipped(self):
+        device = fake_backend.fake_device(pid=0x0009)
+        device.reset_stats()
+
+        device.set_ccd_tec_enable(1)
+        device.set_ccd_tec_enable(1)
+        assert sent(device, 0xD6) == 2
+
+        device.set_laser_enable(1)
+        assert device.get_laser_enable() == 1
+        assert sent(device, 0xE2) == 0
+
+    def test_failed_write_not_cached(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.backend.devices[0].send_handlers.pop(0xB2)
+
+        device.set_integration_time(20)
+        assert device.settings.get("integration_time") is None
+        assert device.integration_time is None
+
+    def test_apply_settings_sends_diff(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        recipe = {"integration_time": 50, "tec_setpoint": 15,
+                  "tec_enable": 1, "laser_enable": 0}
+        assert device.apply_settings(recipe) == [
+            "integration_time", "tec_setpoint", "tec_enable",
+            "laser_enable"]
+
+        device.reset_stats()
+        recipe["integration_time"] = 60
+        assert device.apply_settings(recipe) == ["integration_time"]
+        assert list(device.stats()["control"]) == [0xB2]
+
+        unit = device.backend.devices[0]
+        assert unit.integration_time == 60
+        assert unit.tec_enable == 1
+
+    def test_apply_reports_only_written(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.backend.devices[0].send_handlers.pop(0xB2)
+        recipe = {"integration_time": 50, "tec_setpoint": 35,
+                  "tec_enable": 1}
+        assert device.apply_settings(recipe) == ["tec_enable"]
+        assert device.settings.get("tec_setpoint") is None
+
+    def test_apply_skips_disabled_laser(self):
+        device = fake_backend.fake_device(pid=0x0001)
+        assert device.apply_settings({"laser_enable": 1,
+                                      "tec_enable": 1}) == ["tec_enable"]
+
+    def test_apply_unknown_setting(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        with pytest.raises(ValueError):
+            device.apply_settings({"gain": 2})
+        assert device.stats()["control"] == {}
@@ -0,0 +1,161 @@
+""" Tests for the streaming ring buffer and background line reader. A
+minimal stand-in device is used so no hardware is required.
+"""
+
+import time
+import numpy
+import pytest
+import threading
+
+from wasatchusb import streaming
+
+class CountingDevice(object):
+    """ Provides the interface LineStream expects, filling each line
+    with the number of acquires sent so far.
+    """
+    def __init__(self, pixels=16):
+        self.pixels = pixels
+        self.acquires = 0
+        self.lock = threading.RLock()
+
+    def get_pixel_count(self):
+        return self.pixels
+
+    def send_acquire(self):
+        self.acquires += 1
+
+    def read_line_into(self, out):
+        time.sleep(0.001)
+        out[:] = self.acquires
+        return out
+
+class QueueingDevice(CountingDevice):
+    """ Tracks how many acquires are waiting to be read, like firmware
+    that queues triggers.
+    """
+    def __init__(self, pixels=16):
+        super(QueueingDevice, self).__init__(pixels)
+        self.queued = 0
+        self.max_queued = 0
+        self.integration_time = 1
+
+    def send_acquire(self):
+        super(QueueingDevice, self).send_acquire()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+
+    def read_line_into(self, out):
+        assert self.queued > 0
+        self.queued -= 1
+        return super(QueueingDevice, self).read_line_into(out)
+
+class FailingDevice(QueueingDevice):
+    """ Loses every third line, like a read that times out.
+    """
+    def read_line_into(self, out):
+        out = super(FailingDevice, self).read_line_into(out)
+        if self.acquires % 3 == 0:
+            raise IOError("Operation timed out")
+        return out
+
+class TestFrameRing():
+
+    def test_depth_too_small(self):
+        with pytest.raises(ValueError):
+            streaming.FrameRing(1, 16)
+
+    def test_empty_ring(self):
+        ring = streaming.FrameRing(4, 16)
+        assert ring.read_latest() is None
+        seq, stamps, frames = ring.read_n(3)
+        assert frames.shape == (0, 16)
+
+    def test_commit_and_read(self):
+        ring = streaming.FrameRing(4, 8)
+        for value in range(10):
+            ring.write_slot()[:] = value
+            ring.commit(timestamp=100.0 + value)
+
+        seq, stamp, frame = ring.read_latest()
+        assert seq == 9
+        assert stamp == 109.0
+        assert frame.tolist() == [9] * 8
+
+        # One slot is reserved for the writer
+        seq, stamps, frames = ring.read_n(10)
+        assert seq.tolist() == [7, 8, 9]
+        assert stamps.tolist() == [107.0, 108.0, 109.0]
+        assert frames[:, 0].tolist() == [7, 8, 9]
+
+    def test_read_into_caller_buffer(self):
+        ring = streaming.FrameRing(4, 8)
+        ring.write_slot()[:] = 5
+        ring.commit()
+
+        out = numpy.zeros((3, 8), dtype=numpy.uint16)
+        seq, stamps, frames = ring.read_n(3, out=out)
+        assert frames.base is out or frames is out
+        assert out[0].tolist() == [5] * 8
+
+class TestLineStream():
+
+    def test_stream_fills_ring(self):
+        device = CountingDevice()
+        stream = streaming.LineStream(device, depth=8)
+        stream.start()
+        assert stream.ring.wait(5, timeout=2.0)
+        assert stream.stop(timeout=2.0)
+
+        seq, stamps, frames = stream.ring.read_n(5)
+        assert len(seq) == 5
+        assert list(numpy.diff(seq)) == [1, 1, 1, 1]
+        assert numpy.all(numpy.diff(stamps) >= 0)
+        assert frames[-1, 0] == device.acquires
+        assert stream.errors == 0
+
+    def test_duty_cycle_unknown_integration(self):
+        stream = streaming.LineStream(CountingDevice(), depth=4)
+        assert stream.duty_cycle() is None
+        assert stream.line_rate() == 0.0
+
+class TestPipelinedStream():
+
+    def test_outstanding_must_be_positive(self):
+        with pytest.raises(ValueError):
+            streaming.PipelinedStream(QueueingDevice(), outstanding=0)
+
+    def test_keeps_acquires_queued_and_drains(self):
+        device = QueueingDevice()
+        stream = streaming.PipelinedStream(device, depth=8, outstanding=3)
+        stream.start()
+        assert stream.ring.wait(10, timeout=2.0)
+        assert stream.stop(timeout=2.0)
+
+        assert device.max_queued == 3
+        assert device.queued == 0
+        assert stream.errors == 0
+
+        seq, stamps, frames = stream.ring.read_n(4)
+        assert list(numpy.diff(seq)) == [1, 1, 1]
+
+    def test_errors_do_not_grow_backlog(self):
+        device = FailingDevice()
+        stream = streaming.PipelinedStream(device, depth=8, outstanding=3)
+        stream.start()
+        assert stream.ring.wait(10, timeout=2.0)
+        assert stream.stop(timeout=2.0)
+
+        assert stream.errors > 0
+        assert device.max_queued == 3
+        assert device.queued == 0
+
+    def test_duty_cycle_reported(self):
+        device = QueueingDevice()
+        stream = streaming.PipelinedStream(device, depth=8, outstanding=2)
+        stream.start()
+        assert stream.ring.wait(10, timeout=2.0)
+        stream.stop(timeout=2.0)
+
+        duty = stream.duty_cycle()
+        assert 0.0 < duty <= 1.0
+        assert stream.line_rate() > 0
@@ -0,0 +1,66 @@
+""" Tests for the background temperature telemetry.
+"""
+
+import numpy
+import pytest
+
+from wasatchusb import telemetry
+from wasatchusb import fake_backend
+
+class TestTelemetryRing():
+
+    def test_empty(self):
+        ring = telemetry.TelemetryRing(4, ("ccd", "laser"))
+        assert ring.latest() is None
+        stamps, values = ring.window()
+        assert values.shape == (0, 2)
+
+    def test_wraps_and_windows(self):
+        ring = telemetry.TelemetryRing(4, ("ccd", "laser"))
+        for count in range(6):
+            ring.append(100.0 + count, [count, -count])
+
+        assert ring.latest() == (105.0, {"ccd": 5.0, "laser": -5.0})
+
+        stamps, values = ring.window()
+        assert list(stamps) == [102.0, 103.0, 104.0, 105.0]
+
+        stamps, values = ring.window(seconds=1.5, now=105.0)
+        assert list(values[:, 0]) == [4.0, 5.0]
+
+class TestTelemetryPoller():
+
+    def test_unknown_channel(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        with pytest.raises(ValueError):
+            telemetry.TelemetryPoller(device, channels=("humidity",))
+
+    def test_failed_reading_is_nan(self):
+        class Broken(object):
+            def get_ccd_temperature(self):
+                raise IndexError("short read")
+
+        poller = telemetry.TelemetryPoller(Broken(), channels=("ccd",))
+        values = poller.sample()
+        assert numpy.isnan(values[0])
+        assert poller.errors == 1
+
+    @pytest.mark.parametrize("pid", [0x1000, 0x0009])
+    def test_samples_while_streaming(self, pid):
+        device = fake_backend.fake_device(pid=pid, line_latency=0.001)
+        device.start_stream(depth=16)
+        device.start_telemetry(interval=0.005, depth=8)
+
+        assert device.stream.ring.wait(20, timeout=2.0)
+        device.stop_telemetry()
+        device.stop_stream()
+
+        assert device.telemetry.errors == 0
+        assert device.stream.errors == 0
+        stamp, reading = device.latest_telemetry()
+        assert 5 < reading["ccd"] < 15
+        assert reading["laser"] == pytest.approx(25, abs=1)
+
+        stamps, values = device.telemetry_window()
+        assert 1 <= len(stamps) <= 8
+        assert values.shape[1] == 2
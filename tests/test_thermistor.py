@@ -0,0 +1,63 @@
+""" Tests for the ADC to temperature lookup tables.
+"""
+
+import math
+import numpy
+import pytest
+
+from wasatchusb import thermistor
+from wasatchusb import fake_backend
+
+def ccd_formula(adc_value):
+    """ The per reading conversion the tables replace.
+    """
+    voltage = (adc_value / 4096.0) * 1.5
+    resistance = 10000 * voltage / (2 - voltage)
+    inside = math.log(resistance / 10000) + 3977.0 / (25 + 273.0)
+    return 3977.0 / inside - 273.0
+
+def laser_formula(adc_value):
+    voltage = (adc_value / 4096.0) * 2.5
+    resistance = 21450 * voltage / (2.5 - voltage)
+    inside = math.log(resistance / 10000) + 3977.0 / (25 + 273.0)
+    return 3977.0 / inside - 273.0
+
+class TestThermistor():
+
+    @pytest.mark.parametrize("convert, formula", [
+        (thermistor.ccd_celsius, ccd_formula),
+        (thermistor.laser_celsius, laser_formula)])
+    def test_matches_formula(self, convert, formula):
+        for adc_value in range(1, 4096, 7):
+            assert convert(adc_value) == pytest.approx(formula(adc_value))
+
+    def test_undefined_counts_are_nan(self):
+        assert math.isnan(thermistor.ccd_celsius(0))
+        assert math.isnan(thermistor.laser_celsius(0))
+
+    def test_table_shared_and_read_only(self):
+        table = thermistor.table(thermistor.CCD_CIRCUIT)
+        assert table is thermistor.table([1.5, 10000, 2])
+        assert table.shape == (4096,)
+        with pytest.raises(ValueError):
+            table[1] = 0.0
+
+    def test_vectorized(self):
+        counts = numpy.array([[1000, 2000], [3000, 9999]],
+                             dtype=numpy.uint16)
+        result = thermistor.ccd_celsius(counts)
+        assert result.shape == (2, 2)
+        assert result[0, 1] == thermistor.ccd_celsius(2000)
+        assert result[1, 1] == thermistor.ccd_celsius(4095)
+
+    def test_device_readings(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        unit = device.backend.devices[0]
+        assert device.get_ccd_temperature() == \
+               pytest.approx(ccd_formula(unit.ccd_adc))
+        assert device.get_laser_temperature() == \
+               pytest.approx(laser_formula(unit.laser_adc))
+
+        stroker = fake_backend.fake_device(pid=0x0009)
+        stroker.backend.devices[0].laser_adc = 0
+        assert stroker.get_laser_temperature() == -173
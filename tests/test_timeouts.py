@@ -0,0 +1,128 @@
+""" Tests for the integration time aware adaptive transfer deadlines.
+"""
+
+import time
+
+import pytest
+
+from wasatchusb import timeouts
+from wasatchusb import fake_backend
+from wasatchusb import instrumentation
+
+class TestAdaptiveTimeout():
+
+    def test_initial_and_unknown_integration(self):
+        deadlines = timeouts.AdaptiveTimeout()
+        assert deadlines.control() == timeouts.INITIAL
+        assert deadlines.bulk(None) == timeouts.CEILING
+        assert deadlines.bulk(2500) == 2500 + timeouts.INITIAL
+
+    def test_converges_to_floor(self):
+        deadlines = timeouts.AdaptiveTimeout()
+        for count in range(50):
+            deadlines.record(instrumentation.CONTROL, 0.001)
+            deadlines.expect(100)
+            deadlines.record(instrumentation.BULK, 0.102)
+
+        assert deadlines.control() == timeouts.CONTROL_FLOOR
+        assert deadlines.control(0x40) == timeouts.WRITE_FLOOR
+        assert deadlines.bulk(100) == 100 + timeouts.BULK_FLOOR
+        assert deadlines.bulk(5000) == 5000 + timeouts.BULK_FLOOR
+
+    def test_timeout_backs_off_until_success(self):
+        deadlines = timeouts.AdaptiveTimeout()
+        deadlines.record(instrumentation.CONTROL, 0.001)
+        assert deadlines.control() == timeouts.CONTROL_FLOOR
+
+        deadlines.record(instrumentation.CONTROL, 0.02,
+                         timeouts.TIMEOUT_ERROR)
+        deadlines.record(instrumentation.CONTROL, 0.04,
+                         timeouts.TIMEOUT_ERROR)
+        assert deadlines.control() == 4 * timeouts.CONTROL_FLOOR
+
+        deadlines.record(instrumentation.CONTROL, 0.001)
+        assert deadlines.control() == timeouts.CONTROL_FLOOR
+
+    def test_unmeasured_reads_ignored(self):
+        deadlines = timeouts.AdaptiveTimeout()
+        deadlines.record(instrumentation.BULK, 30.0)
+        assert deadlines.as_dict()["bulk"]["samples"] == 0
+
+        # Asking for a deadline does not announce a read
+        deadlines.bulk(100)
+        deadlines.record(instrumentation.BULK, 30.0)
+        assert deadlines.as_dict()["bulk"]["samples"] == 0
+
+class TestDeviceTimeouts():
+
+    def test_long_integration_does_not_time_out(self):
+        device = fake_backend.fake_device(pid=0x0009, integrate=True)
+        device.set_integration_time(1300)
+        assert device.line_timeout() > 1300
+
+        line = device.get_line()
+        assert line is not None
+        assert device.timeouts.as_dict()["bulk"]["samples"] == 1
+
+    def test_dead_unit_detected_quickly(self):
+        device = fake_backend.fake_device(pid=0x1000, line_latency=0.001)
+        unit = device.backend.devices[0]
+        device.set_integration_time(10)
+        device.get_lines(20)
+        for count in range(20):
+            device.get_ccd_temperature()
+
+        # Stop answering: the acquire is sent but no line comes back
+        unit.send_handlers[0xAD] = lambda value, index, data: None
+        start = time.time()
+        with pytest.raises(Exception):
+            device.get_line()
+        assert time.time() - start < 0.5
+
+        unit.latency = 5.0
+        start = time.time()
+        assert device.get_code(0xBF) is None
+        assert time.time() - start < 0.5
+
+    def test_control_timeout_retried(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        for count in range(20):
+            device.get_ccd_temperature()
+        assert device.timeouts.control() == timeouts.CONTROL_FLOOR
+
+        # Slower than the floor but within the doubled deadline
+        unit = device.backend.devices[0]
+        unit.latency = 0.03
+        device.reset_stats()
+        assert device.get_code(0xBF) is not None
+        assert device.stats()["control"][0xBF]["calls"] == 2
+        assert device.stats()["control"][0xBF]["errors"] == 1
+
+    def test_write_timeout_not_resent(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        for count in range(20):
+            device.get_ccd_temperature()
+
+        # Slower than the write deadline, even once doubled
+        unit = device.backend.devices[0]
+        unit.latency = 0.05
+        device.timeouts.write_floor = 20
+        device.reset_stats()
+
+        assert device.send_code(0xB2, 25) is None
+        assert device.stats()["control"][0xB2]["calls"] == 1
+        assert device.stats()["control"][0xB2]["errors"] == 1
+
+    def test_deadline_override(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.set_trigger_source(1)
+        assert device.line_timeout() == timeouts.CEILING
+
+        unit = device.backend.devices[0]
+        start = time.time()
+        with pytest.raises(Exception):
+            device.get_line(timeout=30)
+        assert time.time() - start < 0.5
+
+        unit.trigger()
+        assert device.get_line(timeout=100) is not None
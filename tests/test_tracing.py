@@ -0,0 +1,60 @@
+""" Tests for the ring buffered USB transaction trace.
+"""
+
+import pytest
+import usb.core
+
+from wasatchusb import tracing
+from wasatchusb import fake_backend
+
+class TestTransactionTrace():
+
+    def test_ring_keeps_newest(self):
+        trace = tracing.TransactionTrace(depth=4)
+        for count in range(6):
+            trace.record(float(count), "bulk", 0x82, 0, 0, 2048, 2048,
+                         0.001)
+
+        entries = trace.entries()
+        assert len(entries) == 4
+        assert [entry[0] for entry in entries] == [2.0, 3.0, 4.0, 5.0]
+
+    def test_device_trace_and_dump(self, tmpdir):
+        device = fake_backend.fake_device(pid=0x1000)
+        device.enable_trace(depth=16)
+
+        device.set_integration_time(50)
+        device.get_line()
+
+        entries = device.trace.entries()
+        kinds = [(entry[1], entry[2]) for entry in entries]
+        assert kinds == [("control", 0xB2), ("control", 0xAD),
+                         ("bulk", 0x82)]
+        assert entries[0][3] == 50
+        assert entries[2][6] == 2048
+        assert all(entry[8] == 0 for entry in entries)
+
+        filename = tmpdir.join("trace.tsv")
+        assert device.dump_trace(str(filename)) == 3
+        lines = filename.read().splitlines()
+        assert lines[0].split("\t") == list(tracing.FIELDS)
+        assert lines[3].split("\t")[2] == "0x82"
+
+    def test_dump_on_failure(self, tmpdir):
+        filename = tmpdir.join("stall.tsv")
+        device = fake_backend.fake_device(pid=0x1000)
+        device.enable_trace(dump_path=str(filename))
+
+        device.get_line()
+        with pytest.raises(usb.core.USBError):
+            device.device.read(0x82, 2048, timeout=10)
+
+        lines = filename.read().splitlines()
+        assert len(lines) == 4
+        assert lines[-1].split("\t")[8] == "-7"
+
+    def test_disabled_by_default(self):
+        device = fake_backend.fake_device(pid=0x0009)
+        device.get_line()
+        assert device.trace is None
+        assert device.dump_trace("unused") == 0
@@ -0,0 +1,153 @@
+""" Tests for external trigger streaming and missed trigger accounting.
+"""
+
+import time
+import threading
+
+import numpy
+import pytest
+
+from wasatchusb import triggering
+from wasatchusb import fake_backend
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+class ScriptedDevice(object):
+    """ Answers armed reads from a list of outcomes: a pixel value for a
+    whole line, "short" for a partial line and None for a timeout, then
+    times out once the list runs out.
+    """
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.deadlines = []
+        self.lock = threading.RLock()
+
+    def get_pixel_count(self):
+        return 4
+
+    def read_line_into(self, out, timeout=None):
+        self.deadlines.append(timeout)
+        outcome = None
+        if self.outcomes:
+            outcome = self.outcomes.pop(0)
+
+        if outcome is None:
+            time.sleep(timeout / 1000.0)
+            raise fake_backend.timeout_error()
+        if outcome == "short":
+            raise IOError("short read 4/8")
+        out[:] = outcome
+        return out
+
+class TestTriggerTiming():
+
+    def test_missed_from_given_period(self):
+        timing = triggering.TriggerTiming(period=0.01)
+        missed = [timing.arrival(stamp)
+                  for stamp in (1.0, 1.01, 1.02, 1.05, 1.06)]
+        assert missed == [0, 0, 0, 2, 0]
+        assert timing.missed == 2
+        assert timing.gaps == 1
+
+    def test_estimated_period_and_pause(self):
+        timing = triggering.TriggerTiming()
+        stamps = [1.0 + 0.02 * count for count in range(20)]
+        for stamp in stamps:
+            assert timing.arrival(stamp) == 0
+        assert timing.estimate == pytest.approx(0.02)
+
+        assert timing.arrival(stamps[-1] + 0.06) == 2
+
+        # A stopped conveyor is not a run of missed triggers
+        assert timing.arrival(stamps[-1] + 5.0) == 0
+        assert timing.pauses == 1
+        assert timing.missed == 2
+
+class TestFrameQueue():
+
+    def test_bounded_and_ordered(self):
+        queue = triggering.FrameQueue(2, 4)
+        assert queue.get(timeout=0.01) is None
+
+        for value in range(3):
+            queue.put(numpy.full(4, value, numpy.uint16), value, value)
+        assert len(queue) == 2
+        assert queue.dropped == 1
+
+        sequence, stamp, frame = queue.get()
+        assert sequence == 0
+        assert frame.tolist() == [0] * 4
+        assert queue.get()[0] == 1
+        assert len(queue) == 0
+
+class TestTriggeredStream():
+
+    def test_frames_follow_triggers(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        unit = device.backend.devices[0]
+        assert device.start_triggered_stream(period=0.2)
+        assert device.trigger_source == 1
+
+        for count in range(3):
+            unit.trigger()
+            time.sleep(0.2)
+
+        # Two trigger pulses swallowed upstream of the unit
+        time.sleep(0.4)
+        unit.trigger()
+        assert wait_for(lambda: device.stream.ring.count == 4)
+        device.stop_stream()
+
+        assert unit.acquires == 0
+        sequences = [device.read_triggered(timeout=1.0)[0]
+                     for count in range(4)]
+        assert sequences == [0, 1, 2, 5]
+
+        assert device.trigger_source == 0
+        assert device.get_line(timeout=500) is not None
+        assert unit.acquires == 1
+
+        counters = device.get_trigger_counters()
+        assert counters["missed"] == 2
+        assert counters["errors"] == 0
+        assert device.read_triggered(timeout=0.01) is None
+
+    def test_full_queue_keeps_reading(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        unit = device.backend.devices[0]
+        device.start_triggered_stream(depth=16, queue_depth=2,
+                                      period=1.0)
+
+        unit.trigger(5)
+        assert wait_for(lambda: device.stream.ring.count == 5)
+        device.stop_stream()
+
+        assert device.get_trigger_counters()["dropped"] == 3
+        assert device.read_n(5)[0].tolist() == [0, 1, 2, 3, 4]
+
+    def test_short_read_flushed(self):
+        device = ScriptedDevice([1, "short", 7, None, 2])
+        stream = triggering.TriggeredStream(device, poll=0.05)
+        stream.start()
+        assert wait_for(lambda: len(device.deadlines) >= 6)
+        stream.stop()
+
+        # Reads are flushed up to the timeout after the short read
+        assert stream.errors == 1
+        assert [stream.queue.get(timeout=0.1)[2][0]
+                for count in range(2)] == [1, 2]
+        assert device.deadlines[:5] == [50, 50, triggering.FLUSH,
+                                        triggering.FLUSH, 50]
+
+    def test_counters_without_triggered_stream(self):
+        device = fake_backend.fake_device(pid=0x1000)
+        assert device.read_triggered(timeout=0.01) is None
+        assert device.get_trigger_counters() is None
+
+        device.start_stream()
+        device.stop_stream()
+        assert device.get_trigger_counters() is None
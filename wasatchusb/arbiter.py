@@ -0,0 +1,119 @@
+""" arbiter - share one device handle between acquisition, telemetry
+and settings threads.
+
+A line is an acquire control transfer followed by one or more bulk
+reads, and nothing else may reach the device in between. The
+CommandArbiter on each device is held as a frame for that whole
+sequence, and as a command for every other single transfer. Frames go
+first: a command waits while any frame is in flight or waiting. To
+keep a continuous stream from starving settings and telemetry, a
+command that is waiting when a frame ends gets the next turn, so the
+two alternate under load. Holds are re-entrant per thread, so the
+acquire sent inside a frame passes straight through.
+"""
+
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Hold(object):
+    """ Context manager that takes and releases an arbiter hold.
+    """
+    __slots__ = ("acquire", "release")
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+def _nothing():
+    pass
+
+
+# Stand in for devices without an arbiter
+NO_HOLD = Hold(_nothing, _nothing)
+
+
+class CommandArbiter(object):
+    """ Priority lock between frames and commands. Use the frame and
+    command holds as context managers; using the arbiter itself takes
+    a frame hold.
+    """
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.owner = None
+        self.depth = 0
+        self.holding_frame = False
+        self.frames_waiting = 0
+        self.commands_waiting = 0
+        self.command_turn = False
+
+        self.frame = Hold(self.acquire_frame, self.release)
+        self.command = Hold(self.acquire_command, self.release)
+
+    def acquire_frame(self):
+        me = threading.current_thread()
+        with self.condition:
+            if self.owner is me:
+                self.depth += 1
+                return
+
+            self.frames_waiting += 1
+            while self.owner is not None or self.command_turn:
+                self.condition.wait()
+            self.frames_waiting -= 1
+
+            self.owner = me
+            self.depth = 1
+            self.holding_frame = True
+
+    def acquire_command(self):
+        me = threading.current_thread()
+        with self.condition:
+            if self.owner is me:
+                self.depth += 1
+                return
+
+            self.commands_waiting += 1
+            while self.owner is not None or \
+                  (self.frames_waiting and not self.command_turn):
+                self.condition.wait()
+            self.commands_waiting -= 1
+
+            self.command_turn = False
+            self.owner = me
+            self.depth = 1
+            self.holding_frame = False
+
+    def release(self):
+        with self.condition:
+            if self.owner is not threading.current_thread():
+                raise RuntimeError("Release of an arbiter hold not owned")
+
+            self.depth -= 1
+            if self.depth > 0:
+                return
+
+            if self.holding_frame and self.commands_waiting:
+                self.command_turn = True
+            self.owner = None
+            self.holding_frame = False
+            self.condition.notify_all()
+
+    def __enter__(self):
+        self.acquire_frame()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
@@ -0,0 +1,427 @@
+""" archive - compressed long term storage of spectra.
+
+An archive is one file of independently compressed chunks of frames.
+Within a chunk each frame is stored as its difference from the frame
+before, wrapping in uint16 so the transform is lossless, and the bytes
+are shuffled so all low bytes come before all high bytes. Consecutive
+spectra differ mostly by noise, so the deltas are small and the high
+byte plane is nearly constant, which zlib and lz4 compress far better
+than raw pixels. The recording META record of every frame is stored
+with the frames of its chunk.
+
+The file starts with the FILE_HEADER and a JSON header, followed by the
+chunks, each behind a CHUNK_HEADER with its frame count, length, crc32
+and first and last timestamps. close writes the chunk index and the
+FOOTER that points to it, so any frame is found with one seek. An
+archive whose writer never closed has no footer; the reader then
+rebuilds the index from the chunk headers alone, up to the first chunk
+that is missing or damaged.
+
+zlib is always available, at level 1 by default since higher levels
+cost far more time than they save on noisy spectra. lz4 is used when
+the lz4 package is installed and is several times faster at a somewhat
+lower ratio.
+"""
+
+import os
+import json
+import time
+import zlib
+import struct
+import numpy
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+from wasatchusb import recording
+
+import logging
+log = logging.getLogger(__name__)
+
+VERSION = 1
+
+# Magic, version, pixels and length of the JSON header that follows
+FILE_HEADER = struct.Struct("<4sHHI")
+FILE_MAGIC = b"WSPA"
+
+# Magic, frames, stored length, crc32 of the stored bytes, and the
+# timestamps of the first and last frame
+CHUNK_HEADER = struct.Struct("<4sIIIdd")
+CHUNK_MAGIC = b"WSPC"
+
+# Offset of the index, number of chunks
+FOOTER = struct.Struct("<QI4s")
+FOOTER_MAGIC = b"WSPI"
+
+INDEX = numpy.dtype([("offset", "<u8"), ("length", "<u4"),
+                     ("first", "<u8"), ("frames", "<u4"),
+                     ("start", "<f8"), ("stop", "<f8")])
+
+PIXEL = recording.PIXEL
+META = recording.META
+
+
+def lz4_available():
+    return lz4 is not None
+
+
+def codecs():
+    """ Names of the codecs usable here.
+    """
+    names = ["none", "zlib"]
+    if lz4_available():
+        names.append("lz4")
+    return names
+
+
+def compress(codec, data, level):
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    if codec == "lz4":
+        return lz4.frame.compress(data)
+    return data
+
+
+def decompress(codec, data):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "lz4":
+        return lz4.frame.decompress(data)
+    return data
+
+
+def encode_frames(frames):
+    """ Delta and byte shuffle a (count, pixels) uint16 array. Returns
+    the bytes to compress.
+    """
+    deltas = numpy.empty(frames.shape, dtype=PIXEL)
+    deltas[:1] = frames[:1]
+    numpy.subtract(frames[1:], frames[:-1], out=deltas[1:])
+    planes = deltas.view(numpy.uint8).reshape(-1, PIXEL.itemsize)
+    return numpy.ascontiguousarray(planes.T).tobytes()
+
+
+def decode_frames(data, count, pixels):
+    """ Invert encode_frames. Returns a (count, pixels) uint16 array.
+    """
+    planes = numpy.frombuffer(data, dtype=numpy.uint8)
+    planes = planes.reshape(PIXEL.itemsize, count * pixels)
+    deltas = numpy.ascontiguousarray(planes.T).view(PIXEL)
+    return numpy.cumsum(deltas.reshape(count, pixels), axis=0,
+                        dtype=PIXEL)
+
+
+class ArchiveWriter(object):
+    """ Write frames to a new archive at path, compressing every
+    chunk_frames frames with codec. info is stored in the header.
+    """
+    def __init__(self, path, pixels, info=None, chunk_frames=256,
+                 codec="zlib", level=1):
+        if codec not in ("none", "zlib", "lz4"):
+            raise ValueError("Unknown archive codec: %s" % codec)
+        if codec == "lz4" and not lz4_available():
+            raise ValueError("The lz4 codec needs the lz4 package")
+        if chunk_frames < 1:
+            raise ValueError("Chunk must hold at least one frame")
+
+        self.path = path
+        self.pixels = pixels
+        self.codec = codec
+        self.level = level
+        self.header = {"version": VERSION, "pixels": pixels,
+                       "codec": codec, "chunk_frames": chunk_frames,
+                       "created": time.time(), "device": info or {}}
+
+        self.archive_file = open(path, "wb")
+        text = json.dumps(self.header, sort_keys=True).encode("utf-8")
+        self.archive_file.write(FILE_HEADER.pack(FILE_MAGIC, VERSION,
+                                                 pixels, len(text)))
+        self.archive_file.write(text)
+
+        self.frames = numpy.zeros((chunk_frames, pixels), dtype=PIXEL)
+        self.meta = numpy.zeros(chunk_frames, dtype=META)
+        self.pending = 0
+        self.count = 0
+        self.index = []
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def write_slot(self):
+        """ Return the row the next frame should be read into.
+        """
+        return self.frames[self.pending]
+
+    def commit(self, sequence=None, timestamp=None, integration_time=0,
+               temperature=numpy.nan):
+        """ Add the row returned by write_slot as the next frame.
+        """
+        if sequence is None:
+            sequence = self.count
+        if timestamp is None:
+            timestamp = time.time()
+
+        self.meta[self.pending] = (sequence, timestamp,
+                                   integration_time or 0, temperature)
+        self.pending += 1
+        self.count += 1
+        if self.pending == len(self.frames):
+            self.flush()
+
+    def append(self, frame, sequence=None, timestamp=None,
+               integration_time=0, temperature=numpy.nan):
+        """ Copy frame into the archive.
+        """
+        self.write_slot()[:] = frame
+        self.commit(sequence, timestamp, integration_time, temperature)
+
+    def extend(self, frames, meta):
+        """ Copy a block of frames with their META records into the
+        archive.
+        """
+        start = 0
+        while start < len(frames):
+            room = len(self.frames) - self.pending
+            block = frames[start:start + room]
+            held = self.pending + len(block)
+            self.frames[self.pending:held] = block
+            self.meta[self.pending:held] = meta[start:start + len(block)]
+            self.pending = held
+            self.count += len(block)
+            start += len(block)
+            if self.pending == len(self.frames):
+                self.flush()
+
+    def flush(self):
+        """ Compress and write the frames held in the current chunk.
+        """
+        count = self.pending
+        if count == 0:
+            return
+
+        meta = self.meta[:count]
+        raw = meta.tobytes() + encode_frames(self.frames[:count])
+        stored = compress(self.codec, raw, self.level)
+
+        offset = self.archive_file.tell()
+        crc = zlib.crc32(stored) & 0xffffffff
+        start = meta["timestamp"][0]
+        stop = meta["timestamp"][-1]
+        self.archive_file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, count,
+                                                  len(stored), crc,
+                                                  start, stop))
+        self.archive_file.write(stored)
+
+        self.index.append((offset, len(stored), self.count - count, count,
+                           start, stop))
+        self.raw_bytes += count * self.pixels * PIXEL.itemsize
+        self.stored_bytes += CHUNK_HEADER.size + len(stored)
+        self.pending = 0
+
+    def close(self):
+        """ Write the last chunk, the chunk index and the footer.
+        """
+        self.flush()
+        index = numpy.array(self.index, dtype=INDEX)
+        offset = self.archive_file.tell()
+        self.archive_file.write(index.tobytes())
+        self.archive_file.write(FOOTER.pack(offset, len(index),
+                                            FOOTER_MAGIC))
+        self.archive_file.close()
+
+    def ratio(self):
+        """ Raw frame bytes per stored byte so far.
+        """
+        if self.stored_bytes == 0:
+            return 0.0
+        return float(self.raw_bytes) / self.stored_bytes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class Archive(object):
+    """ Random access reader of an archive. The most recently decoded
+    chunk is kept, so reading frames in order decompresses each chunk
+    once.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.archive_file = open(path, "rb")
+        magic, version, pixels, length = FILE_HEADER.unpack(
+            self.archive_file.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError("Not a spectral archive: %s" % path)
+
+        self.header = json.loads(
+            self.archive_file.read(length).decode("utf-8"))
+        self.pixels = pixels
+        self.codec = self.header["codec"]
+        if self.codec == "lz4" and not lz4_available():
+            raise ValueError("Reading %s needs the lz4 package" % path)
+
+        self.data_start = FILE_HEADER.size + length
+        self.index = self.read_index()
+        self.count = int(self.index["frames"].sum())
+        self.cached = (None, None)
+
+    def read_index(self):
+        """ Chunk index from the footer, or rebuilt from the chunk
+        headers when the writer was not closed.
+        """
+        size = os.path.getsize(self.path)
+        if size >= self.data_start + FOOTER.size:
+            self.archive_file.seek(size - FOOTER.size)
+            offset, chunks, magic = FOOTER.unpack(
+                self.archive_file.read(FOOTER.size))
+            if magic == FOOTER_MAGIC:
+                self.archive_file.seek(offset)
+                return numpy.frombuffer(
+                    self.archive_file.read(chunks * INDEX.itemsize),
+                    dtype=INDEX)
+
+        log.warn("No index in %s, scanning chunks", self.path)
+        return self.scan(size)
+
+    def scan(self, size):
+        """ Index of the chunks from their headers, ending at the first
+        chunk that is cut short or not a chunk, such as the zero filled
+        tail of a file that was never closed.
+        """
+        entries = []
+        first = 0
+        offset = self.data_start
+        while offset < size:
+            self.archive_file.seek(offset)
+            header = self.archive_file.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                log.warn("Partial chunk header at %s in %s", offset,
+                         self.path)
+                break
+
+            magic, count, length, crc, start, stop = \
+                CHUNK_HEADER.unpack(header)
+            if magic != CHUNK_MAGIC or count == 0 or \
+               offset + CHUNK_HEADER.size + length > size:
+                log.warn("Bad chunk at %s in %s, dropping the rest",
+                         offset, self.path)
+                break
+
+            entries.append((offset, length, first, count, start, stop))
+            first += count
+            offset += CHUNK_HEADER.size + length
+        return numpy.array(entries, dtype=INDEX)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def device(self):
+        return self.header["device"]
+
+    def decode_chunk(self, offset):
+        """ Read, check and decode the chunk at offset. Returns (meta,
+        frames).
+        """
+        self.archive_file.seek(offset)
+        magic, count, length, crc, start, stop = CHUNK_HEADER.unpack(
+            self.archive_file.read(CHUNK_HEADER.size))
+        stored = self.archive_file.read(length)
+        if magic != CHUNK_MAGIC or \
+           zlib.crc32(stored) & 0xffffffff != crc:
+            raise IOError("Corrupt chunk at %s in %s" % (offset, self.path))
+
+        raw = decompress(self.codec, stored)
+        split = count * META.itemsize
+        meta = numpy.frombuffer(raw[:split], dtype=META)
+        frames = decode_frames(raw[split:], count, self.pixels)
+        return meta, frames
+
+    def read_chunk(self, number):
+        """ Return (meta, frames) of chunk number.
+        """
+        if self.cached[0] == number:
+            return self.cached[1]
+
+        chunk = self.decode_chunk(int(self.index["offset"][number]))
+        self.cached = (number, chunk)
+        return chunk
+
+    def chunk_of(self, frame):
+        return int(numpy.searchsorted(self.index["first"], frame,
+                                      side="right")) - 1
+
+    def frame(self, number):
+        """ Return (meta record, frame) of frame number.
+        """
+        if number < 0 or number >= self.count:
+            raise IndexError("Frame %s not in archive" % number)
+
+        chunk = self.chunk_of(number)
+        meta, frames = self.read_chunk(chunk)
+        row = number - int(self.index["first"][chunk])
+        return meta[row], frames[row]
+
+    def read(self, start=0, stop=None):
+        """ Return (meta, frames) of frames start up to stop, decoding
+        only the chunks they span.
+        """
+        if stop is None or stop > self.count:
+            stop = self.count
+        if start >= stop:
+            return numpy.zeros(0, META), \
+                   numpy.zeros((0, self.pixels), PIXEL)
+
+        metas = []
+        blocks = []
+        for chunk in range(self.chunk_of(start), self.chunk_of(stop - 1) + 1):
+            first = int(self.index["first"][chunk])
+            meta, frames = self.read_chunk(chunk)
+            low = max(start - first, 0)
+            high = min(stop - first, len(frames))
+            metas.append(meta[low:high])
+            blocks.append(frames[low:high])
+        return numpy.concatenate(metas), numpy.concatenate(blocks)
+
+    def index_at(self, timestamp):
+        """ Number of the last frame that arrived at or before timestamp,
+        or -1 if none did.
+        """
+        chunk = int(numpy.searchsorted(self.index["start"], timestamp,
+                                       side="right")) - 1
+        if chunk < 0:
+            return -1
+
+        meta = self.read_chunk(chunk)[0]
+        row = int(numpy.searchsorted(meta["timestamp"], timestamp,
+                                     side="right")) - 1
+        return int(self.index["first"][chunk]) + row
+
+    def close(self):
+        self.archive_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def archive_recording(source, path, chunk_frames=256, codec="zlib",
+                      level=1):
+    """ Compress the recording dataset at source into an archive at
+    path. Returns the compression ratio.
+    """
+    data = recording.Recording(source)
+    with ArchiveWriter(path, data.pixels, data.device, chunk_frames, codec,
+                       level) as writer:
+        for start in range(0, len(data), chunk_frames):
+            stop = start + chunk_frames
+            writer.extend(data.frames[start:stop], data.meta[start:stop])
+    return writer.ratio()
@@ -0,0 +1,103 @@
+""" async_device - asyncio facade over the blocking device classes.
+
+Wraps a feature identification Device or StrokerProtocolDevice so an
+event loop can drive many spectrometers without blocking. Every call
+runs on a single worker thread per device, which keeps the USB handle
+single threaded, and the number of queued calls is bounded. Requires
+python 3.6 or later; the rest of the package remains python 2
+compatible.
+"""
+
+import asyncio
+import functools
+import concurrent.futures
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class AsyncDevice(object):
+    """ Awaitable versions of the common device calls. Timeouts are
+    cancellation safe: when an await is cancelled or times out, the
+    blocking call still finishes on the worker thread before the next
+    call starts, so a transfer is never interrupted part way.
+    """
+    def __init__(self, device, max_pending=8, timeout=None):
+        self.device = device
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._slots = None
+
+    async def run(self, func, *args, timeout=None):
+        """ Run func(*args) on the device worker thread and return its
+        result. Waits for a free slot when max_pending calls are already
+        queued. Raises asyncio.TimeoutError after timeout seconds, which
+        defaults to the value given at creation.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if timeout is None:
+            timeout = self.timeout
+
+        await self._slots.acquire()
+        loop = asyncio.get_event_loop()
+        try:
+            future = loop.run_in_executor(self.executor,
+                                          functools.partial(func, *args))
+        except Exception:
+            self._slots.release()
+            raise
+
+        # The slot is held until the blocking call really finishes, not
+        # just until the caller stops waiting for it
+        future.add_done_callback(lambda result: self._slots.release())
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    async def connect(self, timeout=None):
+        return await self.run(self.device.connect, timeout=timeout)
+
+    async def disconnect(self, timeout=None):
+        return await self.run(self.device.disconnect, timeout=timeout)
+
+    async def get_line(self, timeout=None):
+        return await self.run(self.device.get_line, timeout=timeout)
+
+    async def get_ccd_temperature(self, timeout=None):
+        return await self.run(self.device.get_ccd_temperature,
+                              timeout=timeout)
+
+    async def get_integration_time(self, timeout=None):
+        return await self.run(self.device.get_integration_time,
+                              timeout=timeout)
+
+    async def set_integration_time(self, int_time, timeout=None):
+        return await self.run(self.device.set_integration_time, int_time,
+                              timeout=timeout)
+
+    async def set_laser_enable(self, value=0, timeout=None):
+        return await self.run(self.device.set_laser_enable, value,
+                              timeout=timeout)
+
+    async def set_ccd_tec_setpoint(self, setpoint, timeout=None):
+        return await self.run(self.device.set_ccd_tec_setpoint, setpoint,
+                              timeout=timeout)
+
+    async def set_ccd_tec_enable(self, value=0, timeout=None):
+        return await self.run(self.device.set_ccd_tec_enable, value,
+                              timeout=timeout)
+
+    async def frames(self, count=None, timeout=None):
+        """ Asynchronous iterator of lines from get_line. Runs forever
+        unless count is given.
+        """
+        produced = 0
+        while count is None or produced < count:
+            yield await self.get_line(timeout=timeout)
+            produced += 1
+
+    def close(self):
+        """ Stop accepting calls. A call already on the worker thread is
+        left to finish in the background.
+        """
+        self.executor.shutdown(wait=False)
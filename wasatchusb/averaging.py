@@ -0,0 +1,127 @@
+""" averaging - host side scan averaging without per-frame copies.
+
+ScanAverager sums N lines into a uint32 accumulator, which holds 65536
+full scale 16 bit scans before it can overflow, and divides once at the
+end. ExponentialAverager keeps a float64 moving average updated in
+place as each line arrives. All buffers are allocated at creation, and
+the returned averages are views of those buffers that are overwritten
+by the next update.
+"""
+
+import numpy
+
+import logging
+log = logging.getLogger(__name__)
+
+# Largest scan count a uint32 sum of uint16 lines can hold
+MAX_SCANS = 65536
+
+
+class ScanAverager(object):
+    """ Boxcar average of a fixed number of scans.
+    """
+    def __init__(self, pixels, scans):
+        if scans < 1 or scans > MAX_SCANS:
+            raise ValueError("Scans must be between 1 and %s" % MAX_SCANS)
+
+        self.pixels = pixels
+        self.scans = scans
+        self.count = 0
+        self.total = numpy.zeros(pixels, dtype=numpy.uint32)
+        self.result = numpy.zeros(pixels, dtype=numpy.float64)
+        self.line = numpy.zeros(pixels, dtype=numpy.uint16)
+
+    def reset(self):
+        self.count = 0
+        self.total.fill(0)
+
+    def add(self, frame):
+        """ Accumulate a uint16 line. Return True once scans lines have
+        been added since the last reset.
+        """
+        numpy.add(self.total, frame, out=self.total, casting="unsafe")
+        self.count += 1
+        return self.count >= self.scans
+
+    def average(self):
+        """ Mean of the lines added since the last reset.
+        """
+        if self.count == 0:
+            self.result.fill(0)
+            return self.result
+
+        numpy.divide(self.total, float(self.count), out=self.result)
+        return self.result
+
+    def acquire(self, device):
+        """ Read scans fresh lines from device and return their mean.
+        """
+        self.reset()
+        while self.count < self.scans:
+            with device.lock:
+                device.send_acquire()
+                device.read_line_into(self.line)
+            self.add(self.line)
+
+        return self.average()
+
+
+class ExponentialAverager(object):
+    """ Exponential moving average where each new line has weight alpha.
+    The first line seeds the average.
+    """
+    def __init__(self, pixels, alpha):
+        if alpha <= 0.0 or alpha > 1.0:
+            raise ValueError("Alpha must be in (0, 1]")
+
+        self.pixels = pixels
+        self.alpha = alpha
+        self.count = 0
+        self.result = numpy.zeros(pixels, dtype=numpy.float64)
+        self.delta = numpy.zeros(pixels, dtype=numpy.float64)
+        self.line = numpy.zeros(pixels, dtype=numpy.uint16)
+
+    def reset(self):
+        self.count = 0
+        self.result.fill(0)
+
+    def add(self, frame):
+        """ Fold a line into the moving average. Always returns True.
+        """
+        if self.count == 0:
+            self.result[:] = frame
+        else:
+            numpy.subtract(frame, self.result, out=self.delta)
+            self.delta *= self.alpha
+            self.result += self.delta
+
+        self.count += 1
+        return True
+
+    def average(self):
+        return self.result
+
+    def acquire(self, device):
+        """ Read one fresh line from device and return the updated
+        moving average.
+        """
+        with device.lock:
+            device.send_acquire()
+            device.read_line_into(self.line)
+        self.add(self.line)
+        return self.result
+
+
+def create(pixels, scans=1, mode="boxcar", alpha=None):
+    """ Build an averager by name. For the "ema" mode alpha defaults to
+    2 / (scans + 1), matching an N scan moving average.
+    """
+    if mode == "boxcar":
+        return ScanAverager(pixels, scans)
+
+    if mode == "ema":
+        if alpha is None:
+            alpha = 2.0 / (scans + 1)
+        return ExponentialAverager(pixels, alpha)
+
+    raise ValueError("Unknown averaging mode: %s" % mode)
@@ -0,0 +1,347 @@
+""" benchmark - throughput and latency of the acquisition path.
+
+Each case calls one operation repeatedly and records the wall clock
+latency of every call and the process CPU time over the run. Results
+carry frames per second, p50/p99/p999 latency and CPU per frame, and a
+whole run is written as JSON so releases can be compared with
+find_regressions. The suite runs against real hardware or against
+fake_backend when no spectrometer is attached.
+
+archive_benchmark measures the write and read throughput and the
+compression ratio of each archive codec on synthetic Raman spectra.
+"""
+
+import os
+import time
+import json
+import platform
+import tempfile
+
+import numpy
+import usb.util
+
+from wasatchusb import decode
+from wasatchusb import archive
+from wasatchusb import registry
+from wasatchusb import calibration
+from wasatchusb import fake_backend
+
+import logging
+log = logging.getLogger(__name__)
+
+# process_time is python 3 only, clock is CPU time on python 2 unix
+cpu_time = getattr(time, "process_time", None) or time.clock
+
+CASES = ("get_line", "decode", "calibration_axis", "calibration_cached",
+         "temperature", "enumeration", "connect")
+
+# Cases that talk to the device, run fewer times than the host only ones
+DEVICE_CASES = ("get_line", "temperature", "enumeration", "connect")
+
+
+class BenchmarkResult(object):
+    """ Summary of one case. Latencies are in milliseconds.
+    """
+    __slots__ = ("name", "iterations", "errors", "elapsed",
+                 "frames_per_second", "mean", "p50", "p99", "p999",
+                 "max", "cpu_per_frame")
+
+    def __init__(self, name, latencies, elapsed, cpu, errors=0):
+        latencies = numpy.asarray(latencies, dtype=numpy.float64) * 1000.0
+        self.name = name
+        self.iterations = len(latencies)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.frames_per_second = 0.0
+        self.cpu_per_frame = 0.0
+        self.mean = self.p50 = self.p99 = self.p999 = self.max = 0.0
+
+        if self.iterations == 0:
+            return
+
+        if elapsed > 0:
+            self.frames_per_second = self.iterations / elapsed
+        self.cpu_per_frame = cpu * 1000.0 / self.iterations
+        self.mean = float(latencies.mean())
+        self.p50, self.p99, self.p999 = [
+            float(value) for value in
+            numpy.percentile(latencies, [50.0, 99.0, 99.9])]
+        self.max = float(latencies.max())
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return "%-20s %10.1f/s p50 %8.3fms p99 %8.3fms p999 %8.3fms " \
+               "cpu %8.3fms" % (self.name, self.frames_per_second,
+                                self.p50, self.p99, self.p999,
+                                self.cpu_per_frame)
+
+
+def measure(name, call, iterations, warmup=10):
+    """ Time iterations calls of call. Failures, warmup calls included,
+    are counted and left out of the latency figures.
+    """
+    errors = 0
+    for count in range(warmup):
+        try:
+            call()
+        except Exception as exc:
+            log.debug("%s warmup failed: %s", name, exc)
+            errors += 1
+
+    latencies = []
+    clock = time.time
+    start_cpu = cpu_time()
+    start = clock()
+    for count in range(iterations):
+        before = clock()
+        try:
+            call()
+        except Exception as exc:
+            log.debug("%s failed: %s", name, exc)
+            errors += 1
+            continue
+        latencies.append(clock() - before)
+    elapsed = clock() - start
+    cpu = cpu_time() - start_cpu
+
+    return BenchmarkResult(name, latencies, elapsed, cpu, errors)
+
+
+class BenchmarkSuite(object):
+    """ Run the cases against device, a connected protocol Device. Pass
+    the registry the device was found through to time enumeration and
+    connect on the same backend.
+    """
+    def __init__(self, device, device_registry=None, iterations=1000,
+                 device_iterations=None):
+        self.device = device
+        if device_registry is None:
+            device_registry = registry.DeviceRegistry(device.vid,
+                                                      device.backend)
+        self.registry = device_registry
+        self.iterations = iterations
+        if device_iterations is None:
+            device_iterations = iterations
+        self.device_iterations = device_iterations
+
+        pixels = device.get_pixel_count()
+        self.raw = numpy.arange(pixels, dtype=decode.PIXEL_DTYPE).tobytes()
+        self.coefficients = (780.0, 0.2, -1e-5, 0.0)
+
+    def case_get_line(self):
+        return self.device.get_line()
+
+    def case_decode(self):
+        return decode.unpack_line(self.raw)
+
+    def case_calibration_axis(self):
+        calibration.clear_cache()
+        return calibration.wavelength_axis(self.coefficients,
+                                           self.device.get_pixel_count())
+
+    def case_calibration_cached(self):
+        return calibration.wavelength_axis(self.coefficients,
+                                           self.device.get_pixel_count())
+
+    def case_temperature(self):
+        return self.device.get_ccd_temperature()
+
+    def case_enumeration(self):
+        return self.registry.refresh()
+
+    def case_connect(self):
+        """ Open and release a second handle on the unit, so repeated
+        connects do not pile up open handles and claimed interfaces.
+        """
+        entry = self.registry.find(pid=self.device.pid)
+        device = entry.create()
+        try:
+            if device.connect() is not True:
+                raise IOError("Failure connecting to %s" % entry)
+        finally:
+            device.disconnect()
+            if device.device is not None:
+                usb.util.dispose_resources(device.device.device)
+
+    def run(self, cases=CASES):
+        """ Run each named case in order. Returns a list of results.
+        """
+        results = []
+        for name in cases:
+            iterations = self.iterations
+            if name in DEVICE_CASES:
+                iterations = self.device_iterations
+
+            call = getattr(self, "case_%s" % name)
+            result = measure(name, call, iterations)
+            log.info("%s", result)
+            results.append(result)
+
+        calibration.clear_cache()
+        return results
+
+
+def report(results, **details):
+    """ JSON ready dict of a run, with the interpreter and platform so
+    runs from different machines are not compared by mistake.
+    """
+    summary = {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": numpy.__version__,
+        "results": dict((result.name, result.as_dict())
+                        for result in results),
+    }
+    summary.update(details)
+    return summary
+
+
+def write_report(filename, summary):
+    with open(filename, "w") as json_file:
+        json.dump(summary, json_file, indent=2, sort_keys=True)
+
+
+def read_report(filename):
+    with open(filename) as json_file:
+        return json.load(json_file)
+
+
+def find_regressions(baseline, current, tolerance=0.2):
+    """ Compare two reports. Returns (case, field, before, after) for
+    every case whose throughput dropped, or whose p99 latency or CPU per
+    frame rose, by more than tolerance as a fraction.
+    """
+    regressions = []
+    before_results = baseline["results"]
+    for name, after in sorted(current["results"].items()):
+        before = before_results.get(name)
+        if before is None:
+            continue
+
+        if after["frames_per_second"] < \
+           before["frames_per_second"] * (1.0 - tolerance):
+            regressions.append((name, "frames_per_second",
+                                before["frames_per_second"],
+                                after["frames_per_second"]))
+
+        for field in ("p99", "cpu_per_frame"):
+            if after[field] > before[field] * (1.0 + tolerance):
+                regressions.append((name, field, before[field],
+                                    after[field]))
+
+    return regressions
+
+
+def fake_suite(pid=0x1000, iterations=1000, device_iterations=None,
+               **settings):
+    """ BenchmarkSuite over a fake_backend unit, for runs without
+    hardware. settings configure the FakeSpectrometer latency.
+    """
+    unit = fake_backend.FakeSpectrometer(pid=pid, **settings)
+    backend = fake_backend.FakeBackend([unit])
+    device_registry = registry.DeviceRegistry(backend=backend)
+    device = device_registry.open(pid=pid)
+    return BenchmarkSuite(device, device_registry, iterations,
+                          device_iterations)
+
+
+def raman_frames(count, pixels=1024, seed=0):
+    """ count uint16 spectra that look like Raman data: a broad
+    fluorescence background, a few Lorentzian peaks that drift slowly,
+    a dark offset and shot and read noise.
+    """
+    generator = numpy.random.RandomState(seed)
+    axis = numpy.linspace(0.0, 1.0, pixels)
+    background = 800.0 + 6000.0 * numpy.exp(-((axis - 0.35) / 0.5) ** 2)
+
+    peaks = [(0.18, 0.004, 9000.0), (0.42, 0.006, 4000.0),
+             (0.57, 0.003, 15000.0), (0.81, 0.008, 2500.0)]
+    signal = numpy.zeros(pixels)
+    for center, width, height in peaks:
+        signal += height / (1.0 + ((axis - center) / width) ** 2)
+
+    frames = numpy.empty((count, pixels), dtype=numpy.uint16)
+    for index in range(count):
+        drift = 1.0 + 0.05 * numpy.sin(index / 50.0)
+        mean = background + signal * drift
+        line = generator.poisson(mean) + generator.normal(0.0, 4.0, pixels)
+        frames[index] = numpy.clip(line, 0, 65535)
+    return frames
+
+
+class ArchiveResult(object):
+    """ Throughput in MB/s of raw frame data and compression ratio of
+    one archive codec.
+    """
+    __slots__ = ("codec", "frames", "raw_bytes", "stored_bytes", "ratio",
+                 "write_mb_per_second", "read_mb_per_second")
+
+    def __init__(self, codec, frames, raw_bytes, stored_bytes,
+                 write_seconds, read_seconds):
+        megabytes = raw_bytes / 1e6
+        self.codec = codec
+        self.frames = frames
+        self.raw_bytes = raw_bytes
+        self.stored_bytes = stored_bytes
+        self.ratio = float(raw_bytes) / max(stored_bytes, 1)
+        self.write_mb_per_second = megabytes / max(write_seconds, 1e-9)
+        self.read_mb_per_second = megabytes / max(read_seconds, 1e-9)
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return "%-6s ratio %5.2f write %8.1f MB/s read %8.1f MB/s" \
+               % (self.codec, self.ratio, self.write_mb_per_second,
+                  self.read_mb_per_second)
+
+
+def archive_benchmark(frames=None, codecs=None, chunk_frames=256,
+                      directory=None):
+    """ Write frames, by default 4096 raman_frames, to an archive with
+    each codec and read them back. Returns a list of ArchiveResults.
+    Raises ValueError if any codec does not round trip exactly.
+    """
+    if frames is None:
+        frames = raman_frames(4096)
+    if codecs is None:
+        codecs = archive.codecs()
+
+    meta = numpy.zeros(len(frames), dtype=archive.META)
+    meta["sequence"] = numpy.arange(len(frames))
+    meta["timestamp"] = numpy.arange(len(frames)) * 0.001
+
+    results = []
+    for codec in codecs:
+        handle, path = tempfile.mkstemp(suffix=".wspa", dir=directory)
+        os.close(handle)
+        try:
+            start = time.time()
+            with archive.ArchiveWriter(path, frames.shape[1],
+                                       chunk_frames=chunk_frames,
+                                       codec=codec) as writer:
+                writer.extend(frames, meta)
+            write_seconds = time.time() - start
+
+            start = time.time()
+            with archive.Archive(path) as reader:
+                stored = reader.read()[1]
+            read_seconds = time.time() - start
+
+            if not numpy.array_equal(stored, frames):
+                raise ValueError("Archive codec %s is not lossless"
+                                 % codec)
+
+            result = ArchiveResult(codec, len(frames), writer.raw_bytes,
+                                   os.path.getsize(path), write_seconds,
+                                   read_seconds)
+        finally:
+            os.remove(path)
+
+        log.info("%s", result)
+        results.append(result)
+
+    return results
@@ -0,0 +1,87 @@
+""" calibration - wavelength and wavenumber axes from the EEPROM
+coefficients.
+
+The cubic wavelength polynomial and the Raman shift are evaluated once
+per (coefficients, pixel count, excitation) with numpy and cached, so
+pairing a spectrum with its axis costs nothing on the acquisition path.
+Cached axes are shared between callers and marked read only.
+"""
+
+import numpy
+from numpy.polynomial import polynomial
+
+import logging
+log = logging.getLogger(__name__)
+
+# Axes are small, but bound the cache in case coefficients are swept
+MAX_CACHED = 32
+
+_axis_cache = {}
+
+
+def _cached(key, build):
+    axis = _axis_cache.get(key)
+    if axis is None:
+        if len(_axis_cache) >= MAX_CACHED:
+            _axis_cache.clear()
+        axis = build()
+        axis.flags.writeable = False
+        _axis_cache[key] = axis
+    return axis
+
+
+def wavelength_axis(coefficients, pixels):
+    """ Return the wavelength in nm of each pixel from the C0..C3
+    polynomial coefficients.
+    """
+    coefficients = tuple(float(coeff) for coeff in coefficients)
+    pixels = int(pixels)
+
+    def build():
+        pixel_axis = numpy.arange(pixels, dtype=numpy.float64)
+        return polynomial.polyval(pixel_axis, coefficients)
+
+    return _cached(("wavelength", coefficients, pixels), build)
+
+
+def wavenumber_axis(coefficients, pixels, excitation):
+    """ Return the Raman shift in cm^-1 of each pixel relative to the
+    excitation wavelength in nm.
+    """
+    coefficients = tuple(float(coeff) for coeff in coefficients)
+    pixels = int(pixels)
+    excitation = float(excitation)
+
+    def build():
+        wavelengths = wavelength_axis(coefficients, pixels)
+        return 1e7 / excitation - 1e7 / wavelengths
+
+    return _cached(("wavenumber", coefficients, pixels, excitation), build)
+
+
+class Calibration(object):
+    """ Calibration of one device. Build a new instance when the
+    coefficients change; the axes are looked up lazily.
+    """
+    def __init__(self, coefficients, pixels, excitation=None):
+        self.coefficients = tuple(float(coeff) for coeff in coefficients)
+        self.pixels = int(pixels)
+        self.excitation = excitation
+
+    def wavelengths(self):
+        return wavelength_axis(self.coefficients, self.pixels)
+
+    def wavenumbers(self, excitation=None):
+        """ Raman shift axis. Uses the excitation given at creation
+        unless another is passed.
+        """
+        if excitation is None:
+            excitation = self.excitation
+        if excitation is None:
+            raise ValueError("No excitation wavelength for wavenumbers")
+
+        return wavenumber_axis(self.coefficients, self.pixels, excitation)
+
+
+def clear_cache():
+    _axis_cache.clear()
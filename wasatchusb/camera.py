@@ -3,13 +3,20 @@
 Mostly kept for historical purposes as this was designed as a portable,
 bare functionality wrapper for various hardware validation requirements.
 You probably want the feature identification or stroker protocol files.
+For realistic simulated data, replay.ReplayDevice plays back recorded
+spectra.
 """
 import usb
+import usb.legacy
 import time
 import numpy
 import Queue
 import threading
 
+from wasatchusb import decode
+from wasatchusb import registry
+from wasatchusb import calibration
+
 class SimulatedUSB(object):
     """ Provide a simulation interface designed to mock Wasatch
     Photonics FX2, ARM, FX3 line scan cameras.
@@ -54,15 +61,9 @@ class SimulatedUSB(object):
 
         px = self.get_line_pixel()
 
-        wavel_axis = self.translate_wavelength()
-
-        wavenum_data = []
-        source_wavelength = self.source_wavelength
-
-        for wl_x in wavel_axis:
-            new_x = 1e7 / source_wavelength - 1e7 / wl_x
-            wavenum_data.append(new_x)
-
+        wavenum_data = calibration.wavenumber_axis(self.coefficients(),
+                                                   self.pixel_count,
+                                                   self.source_wavelength)
         return wavenum_data, px
 
     def new_coefficients(self, new_dict):
@@ -76,26 +77,23 @@ class SimulatedUSB(object):
         self.linearity_coefficient_c3 = new_dict['C3']
         return True
 
+    def coefficients(self):
+        """ The current c0-c3 linearity coefficients as floats. Axes are
+        cached per coefficient set, so new_coefficients takes effect on
+        the next call.
+        """
+        return (float(self.linearity_coefficient_c0),
+                float(self.linearity_coefficient_c1),
+                float(self.linearity_coefficient_c2),
+                float(self.linearity_coefficient_c3))
+
     def translate_wavelength(self):
         """ Using the supplied calibration coefficients, apply the
         polynomial transformation. Return the axis of pixel_count in
         length.
         """
-
-        c0 = float(self.linearity_coefficient_c0)
-        c1 = float(self.linearity_coefficient_c1)
-        c2 = float(self.linearity_coefficient_c2)
-        c3 = float(self.linearity_coefficient_c3)
-
-        wl_data = []
-        #print "Translate wavelength with: %s, %s, %s, %s" \
-            #% (c0, c1, c2, c3)
-
-        for x in range(self.pixel_count):
-            new_x = c0 + (c1 * x) + (c2 * x * x) + (c3 * x * x * x)
-            wl_data.append(new_x)
-
-        return wl_data
+        return calibration.wavelength_axis(self.coefficients(),
+                                           self.pixel_count)
 
 
     def get_line_pixel(self):
@@ -216,9 +214,10 @@ class CameraUSB(object):
     """ Communicate with a Wasatch Photonics Stroker ARM USB board
     according to the specification found in:
     Wasatch_Raman_USB_Interface_Specification - 042314.doc."""
-    def __init__(self):
+    def __init__(self, list_output=False):
         #print "Start of CameraUSB object"
         self._device = None
+        self.list_output = list_output
 
         # setConfiguration and claim interface are only necessary when
         # doing bulk read. Track local state and only set and claim on
@@ -226,10 +225,13 @@ class CameraUSB(object):
         self._bulk_enabled = False
 
     def connect(self, vid, pid):
-        for bus in usb.busses():
-            for dev in bus.devices:
-                if dev.idVendor == vid and dev.idProduct == pid:
-                    self._device = dev.open()
+        # Walk the bus on every connect, so an unplugged or replugged
+        # unit is not opened from a stale scan
+        bus_registry = registry.get_registry(vid)
+        bus_registry.refresh()
+        entry = bus_registry.match(pid=pid)
+        if entry is not None:
+            self._device = usb.legacy.Device(entry.usb_device).open()
 
         if self._device is None:
             #print "Can't open device VID:%s PID:%s" % (vid, pid)
@@ -298,12 +300,12 @@ class CameraUSB(object):
         waitti = self._device.controlMsg(HOST2DEVICE, CMD_GET_IMAGE,
                                          ZEROS, 1, 0, TIMEOUT)
 
-        data = []
         block = self._device.bulkRead(IN2HOST1_EP, 2048, TIMEOUT)
-        data.extend(block)
 
-        # Unpack that data into a list
-        data = [i + 256 * j for i, j in zip(data[::2], data[1::2])]
+        # Older pyusb returns a tuple of ints, so copy into a buffer
+        # before viewing as uint16 pixels
+        data = decode.unpack_line(bytearray(block))
+        data = decode.format_line(data, self.list_output)
 
         return 1, data
 
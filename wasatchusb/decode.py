@@ -0,0 +1,49 @@
+""" decode - convert raw bulk endpoint buffers into pixel data.
+
+Every Wasatch Photonics line scan device returns 16 bit pixels as
+little endian byte pairs on the bulk endpoint. Decoding with a python
+list comprehension allocates a python int per pixel, so this module
+views the bytes in place as a numpy uint16 array instead.
+"""
+
+import numpy
+
+import logging
+log = logging.getLogger(__name__)
+
+# Little endian unsigned 16 bit, regardless of host byte order
+PIXEL_DTYPE = numpy.dtype("<u2")
+
+
+def unpack_line(raw_data):
+    """ Return a uint16 numpy array that shares memory with raw_data. Any
+    trailing odd byte is ignored. raw_data can be the array.array
+    returned by pyusb, a bytearray or a bytes string.
+    """
+    count = len(raw_data) // 2
+    return numpy.frombuffer(raw_data, dtype=PIXEL_DTYPE, count=count)
+
+
+def unpack_line_into(raw_data, out):
+    """ Decode raw_data into the caller provided uint16 array out, which
+    must be exactly half the length of raw_data. Returns out.
+    """
+    out[:] = unpack_line(raw_data)
+    return out
+
+
+def check_length(count, raw_data):
+    """ Raise IOError unless a bulk read of count bytes filled raw_data,
+    so a short read is never decoded over the tail of the previous line.
+    """
+    if count != len(raw_data):
+        raise IOError("short read %d/%d" % (count, len(raw_data)))
+
+
+def format_line(pixels, list_output=False):
+    """ Return the decoded pixels as is, or as a list of python ints for
+    callers that still expect the historical get_line result.
+    """
+    if list_output:
+        return pixels.tolist()
+    return pixels
@@ -0,0 +1,502 @@
+""" fake_backend - a pyusb backend that answers the Wasatch vendor opcodes.
+
+FakeBackend plugs into usb.core.find through the backend keyword, so the
+real feature identification and stroker protocol Device classes run
+unmodified against it: connect, control transfers and bulk reads all go
+through pyusb exactly as they do with libusb. Each FakeSpectrometer
+holds the state a unit keeps in firmware and EEPROM, answers the
+opcodes the device classes use, and streams a synthetic line from
+endpoint 0x82, plus 0x86 on 2048 pixel MTI units. Latency can be added
+per control transfer and per line to model the bus and the sensor.
+"""
+
+import time
+import array
+import errno
+import struct
+import threading
+
+import numpy
+import usb
+import usb.core
+import usb.backend
+
+from wasatchusb import registry
+
+import logging
+log = logging.getLogger(__name__)
+
+# Standard request and descriptor codes used by pyusb
+GET_DESCRIPTOR = 0x06
+DESC_TYPE_DEVICE = 0x01
+DESC_TYPE_CONFIG = 0x02
+DESC_TYPE_STRING = 0x03
+DESC_TYPE_INTERFACE = 0x04
+DESC_TYPE_ENDPOINT = 0x05
+
+# English (US) is the only language of the string descriptors
+LANGID = 0x0409
+
+BULK_ENDPOINTS = (0x82, 0x86)
+
+# Answer length of every vendor get request
+PAGE_LENGTH = 64
+
+IDENTITY_PAGE = struct.Struct("<15sx15sx")
+CALIBRATION_PAGE = struct.Struct("<4d3f2f2f4x")
+
+
+class Descriptor(object):
+    """ Plain attribute holder for the descriptor fields pyusb copies.
+    """
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def timeout_error():
+    return usb.core.USBTimeoutError("Operation timed out", -7,
+                                    errno.ETIMEDOUT)
+
+
+def pipe_error():
+    """ The error libusb reports when firmware stalls an unknown opcode.
+    """
+    return usb.core.USBError("Pipe error", -9, errno.EPIPE)
+
+
+class FakeSpectrometer(object):
+    """ Firmware and EEPROM state of one emulated unit. The protocol
+    follows the pid, as for real devices. latency is the seconds each
+    control transfer takes, line_latency the seconds each line takes to
+    read out, and with integrate set a line also waits for the current
+    integration time.
+    """
+    def __init__(self, pid=0x1000, serial="FAKE0001", model="WP-785",
+                 vid=registry.WASATCH_VID, bus=1, address=1,
+                 latency=0.0, line_latency=0.0, integrate=False,
+                 spectrum=None):
+        self.vid = vid
+        self.pid = pid
+        self.serial = serial
+        self.model = model
+        self.bus = bus
+        self.address = address
+        self.latency = latency
+        self.line_latency = line_latency
+        self.integrate = integrate
+
+        self.integration_time = 10
+        self.gain = (0, 1)
+        self.ccd_adc = 3657
+        self.laser_adc = 1302
+        self.trigger_source = 0
+        self.laser_enable = 0
+        self.laser_available = 1
+        self.tec_enable = 0
+        self.tec_setpoint = 0
+        self.software_code = (4, 3, 2, 1)
+        self.fpga_revision = b"010-007"
+        self.wavelength_coeffs = (780.0, 0.2, -1e-5, 0.0)
+        self.calibration_page = CALIBRATION_PAGE.pack(
+            *(self.wavelength_coeffs
+              + (3566.62, -143.543, -0.324723, 20.0, 10.0, 0.0, 0.0)))
+
+        self.frames = 0
+        self.acquires = 0
+        self.pending = 0
+        self.open_count = 0
+        self.configuration = 0
+        self.claimed = set()
+        self.ready = threading.Condition(threading.Lock())
+
+        self.pixels = self.line_pixels()
+        if spectrum is None:
+            spectrum = self.default_spectrum()
+        self.set_spectrum(spectrum)
+
+        self.get_handlers = {
+            0xBF: self.get_integration_time,
+            0xC5: self.get_gain,
+            0xC0: self.get_software_code,
+            0xB4: self.get_fpga_revision,
+            0xD7: self.get_ccd_adc,
+            0xD5: self.get_laser_adc,
+            0xD3: self.get_trigger_source,
+            0xE2: self.get_laser_enable,
+        }
+        self.send_handlers = {
+            0xAD: self.acquire,
+            0xB2: self.set_integration_time,
+            0xBE: self.set_laser_enable,
+            0xD2: self.set_trigger_source,
+            0xD6: self.set_tec_enable,
+            0xD8: self.set_tec_setpoint,
+        }
+        if self.is_feature_identification():
+            self.get_handlers[0xFF] = self.get_upper_area
+            self.send_handlers[0xFF] = self.set_upper_area
+        else:
+            self.get_handlers[0xA2] = self.get_eeprom
+
+    def is_feature_identification(self):
+        return self.pid in registry.FEATURE_IDENTIFICATION_PIDS
+
+    def line_pixels(self):
+        """ Total 16 bit pixels per line, across both endpoints.
+        """
+        if self.pid == 0x2000:
+            return 512
+        if self.pid == 1 and not self.is_feature_identification():
+            return 2048
+        return 1024
+
+    def default_spectrum(self):
+        """ A flat dark level with two gaussian peaks.
+        """
+        axis = numpy.arange(self.pixels, dtype=numpy.float64)
+        line = 800.0
+        for center, height in ((0.3, 20000.0), (0.7, 8000.0)):
+            width = self.pixels / 100.0
+            offset = (axis - center * self.pixels) / width
+            line = line + height * numpy.exp(-0.5 * offset * offset)
+        return line
+
+    def set_spectrum(self, spectrum):
+        """ Set the line returned by every following acquisition.
+        """
+        line = numpy.asarray(spectrum).astype("<u2")
+        if line.shape != (self.pixels,):
+            raise ValueError("Spectrum must have %s pixels" % self.pixels)
+
+        self.spectrum = line
+        self.line_bytes = array.array("B", line.tobytes())
+
+    # Acquisition
+
+    def acquire(self, value, index, data):
+        with self.ready:
+            self.acquires += 1
+            if self.trigger_source == 0:
+                self.pending += 1
+                self.ready.notify()
+
+    def trigger(self, count=1):
+        """ Fire the external trigger input count times.
+        """
+        with self.ready:
+            self.pending += count
+            self.ready.notify()
+
+    def line_time(self):
+        seconds = self.line_latency
+        if self.integrate:
+            seconds += self.integration_time / 1000.0
+        return seconds
+
+    def read_line(self, endpoint, buff, timeout):
+        """ Copy the next line, or its second half from endpoint 0x86 on
+        MTI units, into buff. Waits for an acquire or trigger and the
+        line time for up to timeout ms, then fails the way libusb does.
+        """
+        half = endpoint == 0x86
+        if not half:
+            if timeout:
+                deadline = time.time() + timeout / 1000.0
+            with self.ready:
+                while self.pending == 0:
+                    remaining = None
+                    if timeout:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            raise timeout_error()
+                    self.ready.wait(remaining)
+                self.pending -= 1
+
+            seconds = self.line_time()
+            if timeout and seconds > 0 and time.time() + seconds > deadline:
+                time.sleep(max(0.0, deadline - time.time()))
+                raise timeout_error()
+            if seconds > 0:
+                time.sleep(seconds)
+            self.frames += 1
+
+        source = self.line_bytes
+        if self.pixels == 2048:
+            middle = len(source) // 2
+            if half:
+                source = source[middle:]
+            else:
+                source = source[:middle]
+
+        count = min(len(buff), len(source))
+        buff[:count] = source[:count]
+        return count
+
+    # Vendor get requests
+
+    def get_integration_time(self, value, index):
+        return struct.pack("<I", self.integration_time)[:3]
+
+    def get_gain(self, value, index):
+        return struct.pack("<2B", *self.gain)
+
+    def get_software_code(self, value, index):
+        return struct.pack("<4B", *self.software_code)
+
+    def get_fpga_revision(self, value, index):
+        return self.fpga_revision
+
+    def get_ccd_adc(self, value, index):
+        # Big endian, see Device.get_ccd_temperature
+        return struct.pack(">H", self.ccd_adc)
+
+    def get_laser_adc(self, value, index):
+        return struct.pack("<H", self.laser_adc)
+
+    def get_trigger_source(self, value, index):
+        return struct.pack("<B", self.trigger_source)
+
+    def get_laser_enable(self, value, index):
+        return struct.pack("<B", self.laser_enable)
+
+    def get_eeprom(self, value, index):
+        return struct.pack("<4d", *self.wavelength_coeffs)
+
+    def get_upper_area(self, value, index):
+        if value == 0x01 and index == 0:
+            return IDENTITY_PAGE.pack(self.model.encode("latin-1"),
+                                      self.serial.encode("latin-1"))
+        if value == 0x01 and index == 1:
+            return self.calibration_page
+        if value == 0x03:
+            return struct.pack("<H", self.pixels)
+        if value == 0x08:
+            return struct.pack("<B", self.laser_available)
+        return b""
+
+    # Vendor send requests
+
+    def set_integration_time(self, value, index, data):
+        self.integration_time = value
+
+    def set_laser_enable(self, value, index, data):
+        self.laser_enable = value
+
+    def set_trigger_source(self, value, index, data):
+        self.trigger_source = value
+
+    def set_tec_enable(self, value, index, data):
+        self.tec_enable = value
+
+    def set_tec_setpoint(self, value, index, data):
+        self.tec_setpoint = value
+
+    def set_upper_area(self, value, index, data):
+        # Only the calibration page write is supported
+        if value != 0x02 or index != 0x01:
+            raise pipe_error()
+
+        page = bytes(bytearray(data))
+        self.calibration_page = page[:CALIBRATION_PAGE.size].ljust(
+            CALIBRATION_PAGE.size, b"\x00")
+        self.wavelength_coeffs = struct.unpack_from("<4d", page)
+
+    # Control endpoint
+
+    def string_descriptor(self, index):
+        if index == 0:
+            payload = struct.pack("<H", LANGID)
+        else:
+            text = {1: u"Wasatch Photonics", 2: self.model,
+                    3: self.serial}.get(index)
+            if text is None:
+                raise pipe_error()
+            payload = text.encode("utf-16-le")
+        return struct.pack("<2B", len(payload) + 2, DESC_TYPE_STRING) \
+               + payload
+
+    def control(self, request_type, request, value, index, data,
+                timeout=None):
+        """ Answer one control transfer. Returns the bytes for a device
+        to host request, None for host to device. A latency longer than
+        timeout ms fails the way libusb does.
+        """
+        if timeout and self.latency * 1000.0 > timeout:
+            time.sleep(timeout / 1000.0)
+            raise timeout_error()
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        vendor = request_type & 0x60 == 0x40
+        device_to_host = request_type & 0x80
+
+        if not vendor:
+            if request == GET_DESCRIPTOR and value >> 8 == DESC_TYPE_STRING:
+                return self.string_descriptor(value & 0xFF)
+            raise pipe_error()
+
+        if device_to_host:
+            handler = self.get_handlers.get(request)
+            if handler is None:
+                raise pipe_error()
+            return handler(value, index).ljust(PAGE_LENGTH, b"\x00")
+
+        handler = self.send_handlers.get(request)
+        if handler is None:
+            raise pipe_error()
+        handler(value, index, data)
+        return None
+
+    # Descriptors
+
+    def device_descriptor(self):
+        return Descriptor(
+            bLength=18, bDescriptorType=DESC_TYPE_DEVICE, bcdUSB=0x0200,
+            bDeviceClass=0xFF, bDeviceSubClass=0, bDeviceProtocol=0,
+            bMaxPacketSize0=64, idVendor=self.vid, idProduct=self.pid,
+            bcdDevice=0x0100, iManufacturer=1, iProduct=2,
+            iSerialNumber=3, bNumConfigurations=1, bus=self.bus,
+            address=self.address, port_number=self.address,
+            port_numbers=(self.address,), speed=3)
+
+    def configuration_descriptor(self):
+        return Descriptor(
+            bLength=9, bDescriptorType=DESC_TYPE_CONFIG,
+            wTotalLength=32, bNumInterfaces=1, bConfigurationValue=1,
+            iConfiguration=0, bmAttributes=0x80, bMaxPower=250,
+            extra_descriptors=[])
+
+    def interface_descriptor(self):
+        return Descriptor(
+            bLength=9, bDescriptorType=DESC_TYPE_INTERFACE,
+            bInterfaceNumber=0, bAlternateSetting=0,
+            bNumEndpoints=len(BULK_ENDPOINTS), bInterfaceClass=0xFF,
+            bInterfaceSubClass=0, bInterfaceProtocol=0, iInterface=0,
+            extra_descriptors=[])
+
+    def endpoint_descriptor(self, endpoint):
+        return Descriptor(
+            bLength=7, bDescriptorType=DESC_TYPE_ENDPOINT,
+            bEndpointAddress=endpoint, bmAttributes=0x02,
+            wMaxPacketSize=512, bInterval=0, bRefresh=0,
+            bSynchAddress=0, extra_descriptors=[])
+
+    def __repr__(self):
+        return "FakeSpectrometer(%s:%s serial %s)" \
+               % (hex(self.vid), hex(self.pid), self.serial)
+
+
+class FakeBackend(usb.backend.IBackend):
+    """ pyusb backend over a list of FakeSpectrometer units. Pass it to
+    usb.core.find, a DeviceRegistry, or a Device as backend. Units can
+    be added and removed at any time to emulate hotplug.
+    """
+    def __init__(self, devices=None):
+        self.devices = []
+        self.lock = threading.Lock()
+        for device in devices or []:
+            self.add(device)
+
+    def add(self, device):
+        with self.lock:
+            self.devices.append(device)
+        return device
+
+    def remove(self, device):
+        with self.lock:
+            self.devices.remove(device)
+        return device
+
+    def enumerate_devices(self):
+        with self.lock:
+            return list(self.devices)
+
+    def get_parent(self, dev):
+        return None
+
+    def get_device_descriptor(self, dev):
+        return dev.device_descriptor()
+
+    def get_configuration_descriptor(self, dev, config):
+        if config != 0:
+            raise IndexError("Invalid configuration %s" % config)
+        return dev.configuration_descriptor()
+
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        if intf != 0 or alt != 0 or config != 0:
+            raise IndexError("Invalid interface %s" % intf)
+        return dev.interface_descriptor()
+
+    def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
+        if ep >= len(BULK_ENDPOINTS):
+            raise IndexError("Invalid endpoint %s" % ep)
+        return dev.endpoint_descriptor(BULK_ENDPOINTS[ep])
+
+    def open_device(self, dev):
+        if dev not in self.devices:
+            raise usb.core.USBError("No such device", -4, errno.ENODEV)
+        dev.open_count += 1
+        return dev
+
+    def close_device(self, dev_handle):
+        dev_handle.claimed.clear()
+
+    def set_configuration(self, dev_handle, config_value):
+        dev_handle.configuration = config_value
+
+    def get_configuration(self, dev_handle):
+        return dev_handle.configuration
+
+    def set_interface_altsetting(self, dev_handle, intf, altsetting):
+        pass
+
+    def claim_interface(self, dev_handle, intf):
+        dev_handle.claimed.add(intf)
+
+    def release_interface(self, dev_handle, intf):
+        dev_handle.claimed.discard(intf)
+
+    def bulk_read(self, dev_handle, ep, intf, buff, timeout):
+        if ep not in BULK_ENDPOINTS:
+            raise pipe_error()
+        return dev_handle.read_line(ep, buff, timeout)
+
+    def ctrl_transfer(self, dev_handle, bmRequestType, bRequest, wValue,
+                      wIndex, data, timeout):
+        result = dev_handle.control(bmRequestType, bRequest, wValue,
+                                    wIndex, data, timeout)
+        if result is None:
+            return len(data)
+
+        count = min(len(data), len(result))
+        data[:count] = array.array("B", result[:count])
+        return count
+
+    def clear_halt(self, dev_handle, ep):
+        pass
+
+    def reset_device(self, dev_handle):
+        pass
+
+    def is_kernel_driver_active(self, dev_handle, intf):
+        return False
+
+    def detach_kernel_driver(self, dev_handle, intf):
+        pass
+
+    def attach_kernel_driver(self, dev_handle, intf):
+        pass
+
+
+def fake_device(pid=0x1000, **kwargs):
+    """ Connect the matching protocol Device to a new single unit fake
+    backend. Keyword arguments configure the FakeSpectrometer. Returns
+    the connected device; the unit is its backend.devices[0].
+    """
+    unit = FakeSpectrometer(pid=pid, **kwargs)
+    backend = FakeBackend([unit])
+    device = registry.device_class(pid)(vid=unit.vid, pid=pid,
+                                        backend=backend)
+    if device.connect() is not True:
+        raise usb.core.USBError("Failure connecting to %s" % unit)
+    return device
@@ -5,10 +5,21 @@ identification protocol devices from Wasatch Photonics.
 import usb
 import usb.core
 import usb.util
+import array
 import struct
-import math
 import sys
 
+from wasatchusb import decode
+from wasatchusb import registry
+from wasatchusb import calibration
+from wasatchusb import arbiter
+from wasatchusb import instrumentation
+from wasatchusb import thermistor
+from wasatchusb import settings
+from wasatchusb import timeouts
+from wasatchusb import mixins
+from wasatchusb import triggering
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -18,8 +29,48 @@ strm = logging.StreamHandler(sys.stdout)
 strm.setFormatter(frmt)
 log.addHandler(strm)
 
-# Seconds to wait before host os times out on ctrl transfer
-USB_TIMEOUT = 60000
+# Milliseconds to wait for a line while waiting on an external trigger.
+# Other transfers get deadlines from the device AdaptiveTimeout.
+USB_TIMEOUT = timeouts.CEILING
+
+# Upper area codes that are fixed once the unit leaves the factory: the
+# EEPROM pages, sensor line length and laser availability. Reads of
+# these are cached per device.
+CACHED_UPPER_CODES = (0x01, 0x03, 0x08)
+
+# Layouts of the upper area pages, compiled once. Model and serial are
+# 15 characters with a trailing pad byte each.
+IDENTITY_PAGE = struct.Struct("<15sx15sx")
+CALIBRATION_PAGE = struct.Struct("<4d3f2f2f4x")
+LINE_LENGTH = struct.Struct("<H")
+SOFTWARE_CODE = struct.Struct("<4B")
+FPGA_REVISION = struct.Struct("<7s")
+
+
+class DeviceInfo(object):
+    """ Identity, calibration and firmware details read in one pass by
+    Device.read_info.
+    """
+    __slots__ = ("model", "serial", "wavelength_coeffs", "tec_coeffs",
+                 "tec_max", "tec_min", "laser_max", "laser_min",
+                 "line_length", "laser_available", "software_code",
+                 "fpga_revision", "gain", "integration_time")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return "DeviceInfo(%s %s)" % (self.model, self.serial)
+
+
+def eeprom_text(raw):
+    """ Strip the NUL padding from an EEPROM string field.
+    """
+    return raw.replace(b"\x00", b"").decode("latin-1")
 
 class ListDevices(object):
     def __init__(self):
@@ -27,35 +78,56 @@ class ListDevices(object):
 
     def get_all(self, vid=0x24aa):
         """ Return the full list of devices that match the vendor id.
+        Rescans the bus, refreshing the shared device registry.
         """
         list_devices = []
 
-        for bus in usb.busses():
-            for device in bus.devices:
-                if device.idVendor == vid:
-                    single = (hex(device.idVendor),
-                              hex(device.idProduct))
-                    list_devices.append(single)
+        for entry in registry.get_registry(vid).refresh():
+            single = (hex(entry.vid), hex(entry.pid))
+            list_devices.append(single)
 
         return list_devices
 
-class Device(object):
-    def __init__(self, vid=0x24aa, pid=0x1000):
+class Device(mixins.DeviceMixin):
+    def __init__(self, vid=0x24aa, pid=0x1000, list_output=False,
+                 bus=None, address=None, backend=None):
         log.debug("init")
         self.vid = vid
         self.pid = pid
+        self.bus = bus
+        self.address = address
+        self.backend = backend
         self.device = None
+        self.list_output = list_output
         self.tec_coeff0 = 3566.62
         self.tec_coeff1 = -143.543
         self.tec_coeff2 = -0.324723
         self.trigger_source = 0
 
+        # Reused by read_line_into so streaming reads do not allocate
+        line_buffer = 2 * self.get_pixel_count()
+        self.bulk_buffer = array.array("B", [0]) * line_buffer
+        self.stream = None
+        self.averager = None
+        self.calibration = None
+        self.eeprom_cache = {}
+        self.transfer_stats = instrumentation.TransferStats()
+        self.trace = None
+        self.telemetry = None
+        self.settings = settings.SettingsCache()
+        self.timeouts = timeouts.AdaptiveTimeout()
+
+        # Held as a frame from each acquire to the end of its bulk
+        # read. Every other transfer takes a command hold, so control
+        # transfers from other threads land between lines.
+        self.lock = arbiter.CommandArbiter()
+
     def connect(self):
         """ Attempt to connect to the specified device. Log any failures and
         return False if there is a problem, otherwise return True.
         """
 
-        device = usb.core.find(idVendor=self.vid, idProduct=self.pid)
+        device = usb.core.find(**self.find_match())
         if device is None:
             log.critical("Can't find: %s, %s", (self.vid, self.pid))
             return False
@@ -73,7 +145,10 @@ class Device(object):
             log.warn("Failure in claimInterface: %s", exc)
             return None
 
-        self.device = device
+        self.device = instrumentation.InstrumentedDevice(
+            device, self.transfer_stats, self.trace, self.lock,
+            self.timeouts)
+        self.settings.invalidate()
         return True
 
     def disconnect(self):
@@ -83,6 +158,39 @@ class Device(object):
         log.info("Placeholder disconnect")
         return True
 
+    def read_info(self):
+        """ Read every EEPROM page and the firmware and FPGA revisions,
+        decoding each field once. Returns a DeviceInfo. The EEPROM pages
+        are left in the cache for the individual getters.
+        """
+        identity = self.get_upper_code(0x01)
+        cal_page = self.get_upper_code(0x01, FID_wIndex=1)
+        line_page = self.get_upper_code(0x03)
+        laser_page = self.get_upper_code(0x08)
+        sw_page = self.get_code(0xC0)
+        fpga_page = self.get_code(0xB4)
+
+        model, serial = IDENTITY_PAGE.unpack_from(identity)
+        calibration_values = CALIBRATION_PAGE.unpack_from(cal_page)
+        software = SOFTWARE_CODE.unpack_from(sw_page)
+        fpga = FPGA_REVISION.unpack_from(fpga_page)[0]
+
+        return DeviceInfo(
+            model=eeprom_text(model),
+            serial=eeprom_text(serial),
+            wavelength_coeffs=calibration_values[0:4],
+            tec_coeffs=calibration_values[4:7],
+            tec_max=calibration_values[7],
+            tec_min=calibration_values[8],
+            laser_max=calibration_values[9],
+            laser_min=calibration_values[10],
+            line_length=LINE_LENGTH.unpack_from(line_page)[0],
+            laser_available=laser_page[0],
+            software_code="%d.%d.%d.%d" % tuple(reversed(software)),
+            fpga_revision=eeprom_text(fpga),
+            gain=self.get_ccd_gain(),
+            integration_time=self.get_integration_time())
+
     def get_model_number(self):
         """ Extract the appropriate field with a control message to the
         device.
@@ -118,6 +226,18 @@ class Device(object):
         log.debug("Get: %s", get_coeff)
         return get_coeff
 
+    def get_wavelength_axis(self):
+        """ Return the wavelength of every pixel as a read only numpy
+        array. The coefficients are read once and the axis is cached
+        until set_calibration writes new values.
+        """
+        if self.calibration is None:
+            coeffs = [self.get_calibration(name)
+                      for name in ("C0", "C1", "C2", "C3")]
+            self.calibration = calibration.Calibration(
+                coeffs, self.get_pixel_count())
+        return self.calibration.wavelengths()
+
     def set_calibration(self, wvl_cal, tec_cal, laser_cal):
         """ Write the expected precision value for the given coefficients
         to the device eeprom. The entire page must be written at once,
@@ -157,9 +277,10 @@ class Device(object):
 
 
     def send_code(self, FID_bmRequest, FID_wValue=0, FID_wIndex=0,
-                  FID_data_or_wLength=""):
+                  FID_data_or_wLength="", timeout=None):
         """ Perform the control message transfer, return the extracted
-        value. Yes, the USB spec really does say data_or_length
+        value. Yes, the USB spec really does say data_or_length. The
+        timeout in ms defaults to the adaptive control deadline.
         """
         FID_bmRequestType = 0x40 # host to device
 
@@ -169,18 +290,23 @@ class Device(object):
                                                FID_bmRequest,
                                                FID_wValue,
                                                FID_wIndex,
-                                               FID_data_or_wLength)
+                                               FID_data_or_wLength,
+                                               timeout)
         except Exception as exc:
             log.critical("SEND Problem with ctrl transfer: %s", exc)
 
+        # Upper area writes change the EEPROM contents
+        if FID_bmRequest == 0xFF:
+            self.invalidate_eeprom()
+
         log.debug("Send Raw result: [%s]", result)
         return result
 
 
     def get_code(self, FID_bmRequest, FID_wValue=0, FID_wLength=64,
-                 FID_wIndex=0):
+                 FID_wIndex=0, timeout=None):
         """ Perform the control message transfer, return the extracted
-        value
+        value. The timeout in ms defaults to the adaptive control deadline.
         """
         FID_bmRequestType = 0xC0 # device to host
 
@@ -190,7 +316,8 @@ class Device(object):
                                                FID_bmRequest,
                                                FID_wValue,
                                                FID_wIndex,
-                                               FID_wLength)
+                                               FID_wLength,
+                                               timeout)
         except Exception as exc:
             log.critical("GET Problem with ctrl transfer: %s", exc)
 
@@ -199,11 +326,29 @@ class Device(object):
 
     def get_upper_code(self, FID_wValue, FID_wIndex=0):
         """ Convenience function to wrap "upper area" bmRequest feature
-        identification code around the standard get code command.
+        identification code around the standard get code command. EEPROM
+        and other factory values are read from the device once, then
+        served from eeprom_cache until invalidate_eeprom is called.
         """
-        return self.get_code(FID_bmRequest=0xFF,
-                             FID_wValue=FID_wValue,
-                             FID_wIndex=FID_wIndex)
+        key = (FID_wValue, FID_wIndex)
+        result = self.eeprom_cache.get(key)
+        if result is not None:
+            return result
+
+        result = self.get_code(FID_bmRequest=0xFF,
+                               FID_wValue=FID_wValue,
+                               FID_wIndex=FID_wIndex)
+
+        if result is not None and FID_wValue in CACHED_UPPER_CODES:
+            self.eeprom_cache[key] = result
+        return result
+
+    def invalidate_eeprom(self):
+        """ Forget cached EEPROM pages and the calibration axis built
+        from them, so the next read goes to the device.
+        """
+        self.eeprom_cache.clear()
+        self.calibration = None
 
 
     def get_serial_number(self):
@@ -218,13 +363,19 @@ class Device(object):
         serial_number = serial_number.replace("\x00", "")
         return serial_number
 
-    def get_integration_time(self):
-        """ Read the integration time stored on the device.
+    def get_integration_time(self, refresh=False):
+        """ Read the integration time stored on the device. The last
+        value read or written is returned unless refresh is set.
         """
+        curr_time = self.settings.get("integration_time")
+        if curr_time is not None and not refresh:
+            return curr_time
+
         result = self.get_code(0xBF)
 
         curr_time = (result[2] * 0x10000) + (result[1] * 0x100) + result[0]
 
+        self.settings.store("integration_time", curr_time)
         return curr_time
 
 
@@ -309,38 +460,127 @@ class Device(object):
         return "%s%s" % (chr_fpga_prefix, chr_fpga_suffix)
 
 
-    def get_line(self):
-        """ Issue the "acquire" control message, then immediately read
-        back from the bulk endpoint.
+    def get_pixel_count(self):
+        """ Return the number of 16 bit pixels in a line for this pid.
         """
+        if self.pid == 0x2000:
+            return 512
+        return 1024
 
-        # Only send the CMD_GET_IMAGE (internal trigger) if external
-        # trigger is disabled
+    def send_acquire(self):
+        """ Send the CMD_GET_IMAGE acquire opcode. Nothing is sent when
+        waiting for an external trigger.
+        """
         if self.trigger_source == 0:
-            result = self.send_code(0xAD, FID_data_or_wLength="00000000")
+            return self.send_code(0xAD, FID_data_or_wLength="00000000")
+
+    def line_timeout(self, timeout=None):
+        """ Milliseconds to wait for the next line: timeout if given,
+        USB_TIMEOUT when waiting on an external trigger, otherwise the
+        integration time plus the measured readout allowance.
+        """
+        if timeout is not None:
+            return timeout
+        if self.trigger_source != 0:
+            return USB_TIMEOUT
+        return self.timeouts.bulk(self.settings.get("integration_time"))
+
+    def read_bulk(self, size_or_buffer, timeout=None):
+        """ Read one line from the bulk endpoint within line_timeout.
+        Reads on the adaptive deadline are measured into the readout
+        allowance.
+        """
+        deadline = self.line_timeout(timeout)
+        if timeout is None and self.trigger_source == 0:
+            self.timeouts.expect(self.settings.get("integration_time"))
+        return self.device.read(0x82, size_or_buffer, timeout=deadline)
 
+    def get_line(self, timeout=None):
+        """ Issue the "acquire" control message, then immediately read
+        back from the bulk endpoint. Returns a uint16 numpy array that
+        views the bulk buffer directly, or a list if list_output is set.
+        Pass timeout in ms to override the deadline from line_timeout.
+        """
 
-        line_buffer = 2048 # 1024 16bit pixels
-        if self.pid == 0x2000:
-            line_buffer = 1024 # 512 16bit pixels
-        data = self.device.read(0x82, line_buffer, timeout=USB_TIMEOUT)
+        # Only send the CMD_GET_IMAGE (internal trigger) if external
+        # trigger is disabled
+        line_buffer = 2 * self.get_pixel_count()
+        with self.lock:
+            self.send_acquire()
+            data = self.read_bulk(line_buffer, timeout)
         log.debug("Raw data: %s", data)
 
         try:
-            data = [i + 256 * j for i, j in zip(data[::2], data[1::2])]
+            data = decode.unpack_line(data)
         except Exception as exc:
             log.critical("Failure in data unpack: %s", exc)
-            data = None
+            return None
 
-        return data
+        return decode.format_line(data, self.list_output)
 
-    def set_integration_time(self, int_time):
-        """ Send the updated integration time in a control message to the device.
+    def read_line_into(self, out, timeout=None):
+        """ Read one line from the bulk endpoint into the uint16 array
+        out without allocating. The acquire must already have been sent.
+        """
+        count = self.read_bulk(self.bulk_buffer, timeout)
+        decode.check_length(count, self.bulk_buffer)
+        return decode.unpack_line_into(self.bulk_buffer, out)
+
+    def start_triggered_stream(self, depth=256, queue_depth=64,
+                               period=None, poll=triggering.POLL):
+        """ Switch to the external trigger and start a background
+        thread that keeps a bulk read armed, putting each triggered line
+        into a ring buffer of depth frames and a queue of queue_depth
+        frames. period is the expected seconds between triggers, used
+        to count missed triggers; it is estimated when None. Each armed
+        read waits up to poll seconds, see triggering. See
+        read_triggered and get_trigger_counters. stop_stream puts back
+        the trigger source in use before.
         """
+        if self.stream is not None and self.stream.is_alive():
+            log.warn("Stream already running")
+            return False
 
-        log.debug("Send integration time: %s", int_time)
-        result = self.send_code(0xB2, int_time)
-        return result
+        previous_source = self.trigger_source
+        self.set_trigger_source(1)
+        self.stream = triggering.TriggeredStream(self, depth, queue_depth,
+                                                 period, poll)
+        self.stream.previous_source = previous_source
+        self.stream.start()
+        return True
+
+    def read_triggered(self, out=None, timeout=None):
+        """ Return (sequence, timestamp, frame) of the oldest queued
+        triggered line, waiting up to timeout seconds, or None. Sequence
+        numbers skip over missed triggers. Returns None if no triggered
+        stream was started.
+        """
+        if not isinstance(self.stream, triggering.TriggeredStream):
+            log.warn("No triggered stream")
+            return None
+        return self.stream.queue.get(out, timeout)
+
+    def get_trigger_counters(self):
+        """ Frame, missed trigger, gap, pause, dropped frame and error
+        counts of the triggered stream, or None if none was started.
+        """
+        if not isinstance(self.stream, triggering.TriggeredStream):
+            log.warn("No triggered stream")
+            return None
+        return self.stream.counters()
+
+    def stop_stream(self, timeout=None):
+        """ Stop the background acquisition thread. The ring buffer
+        remains readable until the next start_stream. Once a triggered
+        stream has stopped, the trigger source it replaced is restored,
+        so get_line sends its own acquire again.
+        """
+        stopped = super(Device, self).stop_stream(timeout)
+        previous_source = getattr(self.stream, "previous_source", None)
+        if stopped and previous_source is not None:
+            self.set_trigger_source(previous_source)
+            self.stream.previous_source = None
+        return stopped
 
 
     def get_ccd_temperature(self):
@@ -354,61 +594,41 @@ class Device(object):
         log.debug("Plain adc: %s", result)
 
         # Swap endianness of raw ADC value
-        adc_value  = float(result[1] + (result[0] * 256))
-
-        # Convert to voltage (12 bit)
-        voltage    = float((adc_value / 4096.0) * 1.5)
-
-        # Convert to resistance
-        resistance = 10000 * voltage
-        resistance = resistance / (2 - voltage)
-
-        # Find the log of the resistance with a 10kOHM resistor
-        logVal     = math.log( resistance / 10000 )
-        insideMain = float(logVal + ( 3977.0 / (25 + 273.0) ))
-        tempc      = float( (3977.0 / insideMain) -273.0 )
+        adc_value  = result[1] + (result[0] * 256)
 
-        return tempc
+        # 12 bit count through the 10kOHM divider, see thermistor
+        return thermistor.ccd_celsius(adc_value)
 
-    def set_ccd_tec_setpoint(self, setpoint):
-        """ Attempt to set the CCD cooler setpoint. Verify that it is
-        within an acceptable range. Ideally this is to prevent
-        condensation and other issues. This value is a default and is
-        hugely dependent on the environmental conditions.
+    def get_laser_temperature(self):
+        """ Read the laser thermistor Analog to Digital conversion value
+        from the device and convert it to degrees C.
         """
+        result = self.get_code(0xD5)
 
-        setpoint_min = 10
-        setpoint_max = 20
-        ok_range = "%s,%s" % (setpoint_min, setpoint_max)
-        if setpoint < setpoint_min:
-            log.critical("TEC setpoint out of range (%s)", ok_range)
-            return False
-
-        if setpoint > setpoint_max:
-            log.critical("TEC setpoint out of range (%s)", ok_range)
-            return False
-
-        new_point = self.tec_coeff0 + (self.tec_coeff1 * setpoint)
-        new_point += (self.tec_coeff2 * (setpoint * setpoint))
-        new_point = int(new_point)
+        log.debug("Plain adc: %s", result)
 
-        log.debug("Setting TEC setpoint to: %s", new_point)
-        result = self.send_code(0xD8, new_point)
-        return True
+        # LSB first, unlike the CCD temperature
+        adc_value  = result[0] + (result[1] * 256)
+        return thermistor.laser_celsius(adc_value)
 
-    def set_ccd_tec_enable(self, value=0):
+    def set_ccd_tec_enable(self, value=0, force=False):
         """ Write one for enable, zero for disable of the ccd tec
         cooler.
         """
         log.debug("Send CCD TEC enable: %s", value)
-        result = self.send_code(0xD6, value)
+        sent, result = settings.write(self, "tec_enable", value,
+                                      lambda: self.send_code(0xD6, value),
+                                      force)
+        return result
 
-    def set_laser_enable(self, value=0):
+    def set_laser_enable(self, value=0, force=False):
         """ Write one for enable, zero for disable of laser on the
         device.
         """
         log.debug("Send laser enable: %s", value)
-        result = self.send_code(0xBE, value)
+        sent, result = settings.write(self, "laser_enable", value,
+                                      lambda: self.send_code(0xBE, value),
+                                      force)
         return result
 
     def get_trigger_source(self):
@@ -0,0 +1,179 @@
+""" group - drive every attached Wasatch Photonics spectrometer at once.
+
+DeviceGroup opens each matching unit with the right protocol class and
+gives every device its own worker thread. A call such as get_line is
+handed to all workers at the same moment, and the results are gathered
+into a FrameBundle with a per-device arrival timestamp, so total
+throughput scales with the number of units rather than serializing on
+one python loop.
+"""
+
+import time
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from wasatchusb import registry
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class FrameBundle(object):
+    """ One result per device from a single group call. frames,
+    timestamps and errors are lists in the same order as the group
+    devices. A failed device has None for its frame and the exception
+    in errors.
+    """
+    def __init__(self, sequence, start_time, count):
+        self.sequence = sequence
+        self.start_time = start_time
+        self.frames = [None] * count
+        self.timestamps = [None] * count
+        self.errors = [None] * count
+
+    def complete(self):
+        """ True if every device returned without error.
+        """
+        return all(stamp is not None for stamp in self.timestamps) and \
+               all(error is None for error in self.errors)
+
+    def skew(self):
+        """ Seconds between the first and last device result.
+        """
+        stamps = [stamp for stamp in self.timestamps if stamp is not None]
+        if not stamps:
+            return 0.0
+        return max(stamps) - min(stamps)
+
+
+class DeviceWorker(threading.Thread):
+    """ Run calls for a single device in order, posting each result
+    with its arrival time to the shared results queue.
+    """
+    def __init__(self, index, device, results):
+        super(DeviceWorker, self).__init__()
+        self.daemon = True
+        self.index = index
+        self.device = device
+        self.results = results
+        self.requests = queue.Queue()
+        self.start()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+
+            sequence, name, args, kwargs = request
+            result = None
+            error = None
+            try:
+                result = getattr(self.device, name)(*args, **kwargs)
+            except Exception as exc:
+                log.critical("Device %s failed %s: %s",
+                             self.index, name, exc)
+                error = exc
+
+            self.results.put((sequence, self.index, result,
+                              time.time(), error))
+
+
+class DeviceGroup(object):
+    """ Open and acquire from several devices concurrently. Pass already
+    constructed devices, or call open_all to find every unit on the bus.
+    """
+    def __init__(self, devices=None):
+        self.devices = []
+        self.workers = []
+        self.results = queue.Queue()
+        self.sequence = 0
+
+        for device in devices or []:
+            self.add(device)
+
+    def add(self, device):
+        """ Add a connected device and start its worker thread.
+        """
+        index = len(self.devices)
+        self.devices.append(device)
+        self.workers.append(DeviceWorker(index, device, self.results))
+        return index
+
+    def open_all(self, vid=0x24aa):
+        """ Connect to every device on the vendor id, using the protocol
+        class that matches each product id. Return the number opened.
+        """
+        opened = 0
+        for entry in registry.get_registry(vid).entries():
+            device = entry.create()
+            if device.connect() is not True:
+                log.warn("Skipping %s", entry)
+                continue
+
+            self.add(device)
+            opened += 1
+
+        return opened
+
+    def call(self, name, *args, **kwargs):
+        """ Run the named device method with args and keyword args on
+        every device at the same moment. Return a FrameBundle once all
+        have answered, or when timeout seconds have passed. The timeout
+        keyword belongs to the group and is not passed to the devices.
+        """
+        timeout = kwargs.pop("timeout", None)
+
+        self.sequence += 1
+        bundle = FrameBundle(self.sequence, time.time(), len(self.devices))
+        for worker in self.workers:
+            worker.requests.put((self.sequence, name, args, kwargs))
+
+        deadline = None
+        if timeout is not None:
+            deadline = bundle.start_time + timeout
+
+        waiting = len(self.workers)
+        while waiting > 0:
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.time(), 0)
+            try:
+                result = self.results.get(timeout=remaining)
+            except queue.Empty:
+                log.warn("Timeout waiting for %s devices", waiting)
+                break
+
+            sequence, index, frame, stamp, error = result
+            if sequence != bundle.sequence:
+                # Late answer from a call that already timed out
+                continue
+
+            bundle.frames[index] = frame
+            bundle.timestamps[index] = stamp
+            bundle.errors[index] = error
+            waiting -= 1
+
+        return bundle
+
+    def get_line(self, timeout=None):
+        """ Acquire one line from every device concurrently.
+        """
+        return self.call("get_line", timeout=timeout)
+
+    def close(self):
+        """ Stop the worker threads and disconnect every device.
+        """
+        for worker in self.workers:
+            worker.requests.put(None)
+        for worker in self.workers:
+            worker.join()
+        for device in self.devices:
+            device.disconnect()
+
+        self.workers = []
+        self.devices = []
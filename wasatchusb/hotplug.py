@@ -0,0 +1,168 @@
+""" hotplug - react to spectrometers being attached and detached.
+
+HotplugMonitor keeps a DeviceRegistry current without full rescans and
+calls on_attach(entry) / on_detach(entry) with the DeviceEntry, which
+carries the vid, pid, bus/address and serial number. When the optional
+libusb1 package is installed and the platform libusb supports hotplug,
+events come from libusb callbacks. Otherwise the monitor polls the
+device list at a fixed interval and applies only the differences.
+"""
+
+import time
+import threading
+
+from wasatchusb import registry
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def libusb_hotplug_available():
+    """ True if libusb1 is installed and libusb reports hotplug support.
+    """
+    if usb1 is None:
+        return False
+
+    try:
+        with usb1.USBContext() as context:
+            return bool(context.hasCapability(usb1.CAP_HAS_HOTPLUG))
+    except Exception as exc:
+        log.debug("No libusb hotplug: %s", exc)
+        return False
+
+
+class HotplugMonitor(threading.Thread):
+    """ Background watcher that applies attach and detach events to a
+    registry and notifies the callbacks. Callbacks run on the monitor
+    thread and should return quickly.
+    """
+    def __init__(self, device_registry=None, on_attach=None,
+                 on_detach=None, interval=0.5, use_libusb=True):
+        super(HotplugMonitor, self).__init__()
+        self.daemon = True
+        if device_registry is None:
+            device_registry = registry.get_registry()
+        self.registry = device_registry
+        self.on_attach = on_attach
+        self.on_detach = on_detach
+        self.interval = interval
+        self.use_libusb = use_libusb and libusb_hotplug_available()
+        self.running = threading.Event()
+        self.events = []
+
+    def start(self):
+        # Baseline scan, so only later changes are reported. Serials are
+        # read now, as a detached unit can no longer be asked for one
+        self.registry.serial_index()
+        self.running.set()
+        super(HotplugMonitor, self).start()
+
+    def stop(self, timeout=None):
+        self.running.clear()
+        self.join(timeout)
+        return not self.is_alive()
+
+    def run(self):
+        if self.use_libusb:
+            log.debug("Using libusb hotplug callbacks")
+            self.run_libusb()
+        else:
+            log.debug("Polling for hotplug every %ss", self.interval)
+            while self.running.is_set():
+                self.poll_once()
+                time.sleep(self.interval)
+
+    def poll_once(self):
+        """ Compare the attached devices against the registry and apply
+        the differences. Returns (attached, detached) entry lists.
+        """
+        present = {}
+        for usb_device in self.registry.find_all():
+            location = (usb_device.bus, usb_device.address)
+            present[location] = usb_device
+
+        known = dict((entry.location(), entry)
+                     for entry in self.registry.entries())
+
+        detached = []
+        for location, entry in known.items():
+            usb_device = present.get(location)
+            if usb_device is None or usb_device.idProduct != entry.pid:
+                detached.append(self.detach(*location))
+
+        attached = []
+        for location, usb_device in present.items():
+            if self.registry.by_location_entry(*location) is None:
+                attached.append(self.attach(usb_device))
+
+        return [entry for entry in attached if entry is not None], \
+               [entry for entry in detached if entry is not None]
+
+    def attach(self, usb_device):
+        """ Index usb_device and notify on_attach. Returns the entry, or
+        None if the device was already known.
+        """
+        entry = self.registry.add(usb_device)
+        if entry is None:
+            return None
+
+        entry.get_serial()
+        log.info("Attached %s serial %s", entry, entry.serial)
+        self.notify(self.on_attach, entry)
+        return entry
+
+    def detach(self, bus, address):
+        """ Drop the device at bus/address and notify on_detach.
+        """
+        entry = self.registry.remove(bus, address)
+        if entry is None:
+            return None
+
+        log.info("Detached %s serial %s", entry, entry.serial)
+        self.notify(self.on_detach, entry)
+        return entry
+
+    def notify(self, callback, entry):
+        if callback is None:
+            return
+        try:
+            callback(entry)
+        except Exception as exc:
+            log.critical("Failure in hotplug callback: %s", exc)
+
+    def run_libusb(self):
+        """ Collect libusb hotplug events, then apply them outside the
+        libusb callback where further USB calls are allowed.
+        """
+        with usb1.USBContext() as context:
+            context.hotplugRegisterCallback(self.libusb_event,
+                                            vendor_id=self.registry.vid)
+            while self.running.is_set():
+                context.handleEventsTimeout(tv=self.interval)
+                events, self.events = self.events, []
+                for event, bus, address, pid in events:
+                    self.apply_libusb_event(event, bus, address, pid)
+
+    def libusb_event(self, context, device, event):
+        self.events.append((event, device.getBusNumber(),
+                            device.getDeviceAddress(),
+                            device.getProductID()))
+        # Returning False keeps the callback registered
+        return False
+
+    def apply_libusb_event(self, event, bus, address, pid):
+        if event == usb1.HOTPLUG_EVENT_DEVICE_LEFT:
+            self.detach(bus, address)
+            return
+
+        matches = list(self.registry.find_all(idProduct=pid, bus=bus,
+                                              address=address))
+        if not matches:
+            log.warn("Attached device at %s, %s is gone", bus, address)
+            return
+        self.attach(matches[0])
@@ -0,0 +1,239 @@
+""" instrumentation - counters and latency histograms for every USB
+transfer.
+
+connect wraps the pyusb device in an InstrumentedDevice, which times
+each ctrl_transfer and bulk read and adds it to a TransferStats kept by
+opcode (bRequest) for control transfers and by endpoint for bulk reads.
+Each entry holds the call, byte and error counts plus a histogram of
+power of two microsecond buckets, so recording is a few integer updates
+and percentiles can still be estimated afterwards. The same wrapper
+feeds the optional transaction trace in tracing, and the latency
+estimates that set the deadlines of transfers sent without one.
+"""
+
+import time
+import threading
+
+from wasatchusb import arbiter
+from wasatchusb import tracing
+
+import logging
+log = logging.getLogger(__name__)
+
+# perf_counter is python 3 only
+clock = getattr(time, "perf_counter", time.time)
+
+# Bucket i counts transfers that took less than 2**i microseconds, the
+# last bucket everything slower
+LATENCY_BUCKETS = 27
+
+CONTROL = "control"
+BULK = "bulk"
+
+
+class TransferCounter(object):
+    """ Totals and latency histogram for one opcode or endpoint.
+    """
+    __slots__ = ("calls", "bytes", "errors", "total", "max", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.bytes = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * LATENCY_BUCKETS
+
+    def add(self, seconds, count, failed):
+        self.calls += 1
+        self.bytes += count
+        if failed:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+        bucket = int(seconds * 1000000).bit_length()
+        self.histogram[min(bucket, LATENCY_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """ Upper bound in seconds of the bucket holding the fraction
+        (0 to 1) of transfers, or 0.0 if there are none.
+        """
+        if self.calls == 0:
+            return 0.0
+
+        wanted = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= wanted and count:
+                return min((2 ** bucket) / 1000000.0, self.max)
+        return self.max
+
+    def as_dict(self):
+        mean = 0.0
+        if self.calls:
+            mean = self.total / self.calls
+        return {"calls": self.calls, "bytes": self.bytes,
+                "errors": self.errors, "total": self.total,
+                "mean": mean, "max": self.max,
+                "p50": self.percentile(0.5),
+                "p99": self.percentile(0.99),
+                "histogram": list(self.histogram)}
+
+
+class TransferStats(object):
+    """ TransferCounters by kind (CONTROL or BULK) and key. Safe to
+    record from the streaming thread while another thread reads.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {CONTROL: {}, BULK: {}}
+            self.started = time.time()
+
+    def record(self, kind, key, seconds, count, failed=False):
+        with self.lock:
+            table = self.counters[kind]
+            counter = table.get(key)
+            if counter is None:
+                counter = TransferCounter()
+                table[key] = counter
+            counter.add(seconds, count, failed)
+
+    def snapshot(self):
+        """ Plain dict copy: {"control": {opcode: {...}}, "bulk":
+        {endpoint: {...}}, "elapsed": seconds since reset}.
+        """
+        with self.lock:
+            result = {"elapsed": time.time() - self.started}
+            for kind, table in self.counters.items():
+                result[kind] = dict((key, counter.as_dict())
+                                    for key, counter in table.items())
+            return result
+
+
+def transfer_length(result):
+    """ Bytes moved by a pyusb call, which returns either the data read
+    or the number of bytes written or read into a buffer.
+    """
+    if result is None:
+        return 0
+    try:
+        return len(result)
+    except TypeError:
+        return int(result)
+
+
+class InstrumentedDevice(object):
+    """ Stand in for a pyusb device that records every ctrl_transfer
+    and read into stats, and into trace when a tracing.TransactionTrace
+    is set. With an arbiter.CommandArbiter each transfer also takes a
+    command hold, and with a timeouts.AdaptiveTimeout each transfer is
+    measured into it and control transfers without a timeout get its
+    deadline. Device to host requests that time out on it are sent once
+    more on the backed off deadline; writes are not, as the firmware
+    may have acted on them. Everything else is passed through.
+    """
+    def __init__(self, device, stats, trace=None, command_arbiter=None,
+                 timeouts=None):
+        self.device = device
+        self.stats = stats
+        self.trace = trace
+        self.timeouts = timeouts
+        self.command = arbiter.NO_HOLD
+        if command_arbiter is not None:
+            self.command = command_arbiter.command
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+                      data_or_wLength=None, timeout=None):
+        with self.command:
+            if timeout is not None or self.timeouts is None:
+                return self.timed_ctrl_transfer(bmRequestType, bRequest,
+                                                wValue, wIndex,
+                                                data_or_wLength, timeout)
+
+            try:
+                return self.timed_ctrl_transfer(
+                    bmRequestType, bRequest, wValue, wIndex,
+                    data_or_wLength, self.timeouts.control(bmRequestType))
+            except Exception as exc:
+                if not bmRequestType & 0x80 or \
+                   tracing.error_code(exc) != tracing.TIMEOUT_ERROR:
+                    raise
+                log.debug("Retry control transfer 0x%02x after timeout",
+                          bRequest)
+
+            return self.timed_ctrl_transfer(
+                bmRequestType, bRequest, wValue, wIndex, data_or_wLength,
+                self.timeouts.control(bmRequestType))
+
+    def read(self, endpoint, size_or_buffer, timeout=None):
+        with self.command:
+            return self.timed_read(endpoint, size_or_buffer, timeout)
+
+    def timed_ctrl_transfer(self, bmRequestType, bRequest, wValue, wIndex,
+                            data_or_wLength, timeout):
+        started = time.time()
+        start = clock()
+        try:
+            result = self.device.ctrl_transfer(bmRequestType, bRequest,
+                                               wValue, wIndex,
+                                               data_or_wLength, timeout)
+        except Exception as exc:
+            duration = clock() - start
+            self.stats.record(CONTROL, bRequest, duration, 0, True)
+            if self.timeouts is not None:
+                self.timeouts.record(CONTROL, duration,
+                                     tracing.error_code(exc))
+            if self.trace is not None:
+                self.trace.record(started, CONTROL, bRequest, wValue,
+                                  wIndex, transfer_length(data_or_wLength),
+                                  0, duration, tracing.error_code(exc))
+            raise
+
+        duration = clock() - start
+        count = transfer_length(result)
+        self.stats.record(CONTROL, bRequest, duration, count)
+        if self.timeouts is not None:
+            self.timeouts.record(CONTROL, duration)
+        if self.trace is not None:
+            self.trace.record(started, CONTROL, bRequest, wValue, wIndex,
+                              transfer_length(data_or_wLength), count,
+                              duration)
+        return result
+
+    def timed_read(self, endpoint, size_or_buffer, timeout):
+        started = time.time()
+        start = clock()
+        try:
+            result = self.device.read(endpoint, size_or_buffer, timeout)
+        except Exception as exc:
+            duration = clock() - start
+            self.stats.record(BULK, endpoint, duration, 0, True)
+            if self.timeouts is not None:
+                self.timeouts.record(BULK, duration,
+                                     tracing.error_code(exc))
+            if self.trace is not None:
+                self.trace.record(started, BULK, endpoint, 0, 0,
+                                  transfer_length(size_or_buffer), 0,
+                                  duration, tracing.error_code(exc))
+            raise
+
+        duration = clock() - start
+        count = transfer_length(result)
+        self.stats.record(BULK, endpoint, duration, count)
+        if self.timeouts is not None:
+            self.timeouts.record(BULK, duration)
+        if self.trace is not None:
+            self.trace.record(started, BULK, endpoint, 0, 0,
+                              transfer_length(size_or_buffer), count,
+                              duration)
+        return result
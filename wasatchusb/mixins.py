@@ -0,0 +1,258 @@
+""" mixins - methods shared by the spectrometer device classes.
+
+Streaming, averaging and batched reads only need get_pixel_count,
+send_acquire, read_line_into, get_wavelength_axis and the device lock,
+so AcquisitionMixin serves the feature identification and stroker
+protocol devices and ReplayDevice alike. DeviceMixin adds what needs a
+USB handle: transfer statistics and tracing, telemetry, and the cached
+settings.
+"""
+
+import numpy
+
+from wasatchusb import averaging
+from wasatchusb import settings
+from wasatchusb import streaming
+from wasatchusb import telemetry
+from wasatchusb import tracing
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class AcquisitionMixin(object):
+    """ Batched, averaged and streamed acquisition on top of the line
+    reads of a device.
+    """
+    def get_wavenumber_axis(self, excitation):
+        """ Return the Raman shift of every pixel for the excitation
+        wavelength in nm, cached like get_wavelength_axis.
+        """
+        self.get_wavelength_axis()
+        return self.calibration.wavenumbers(excitation)
+
+    def get_lines(self, count, out=None, timeout=None):
+        """ Acquire count consecutive lines into a (count, pixels) uint16
+        array. Pass out to reuse an existing array with at least count
+        rows, and timeout to override the deadline of each line. Returns
+        the filled rows.
+        """
+        pixels = self.get_pixel_count()
+        if out is None:
+            out = numpy.empty((count, pixels), dtype=numpy.uint16)
+        elif out.shape[0] < count or out.shape[1] != pixels:
+            raise ValueError("Output must be at least (%s, %s)"
+                             % (count, pixels))
+
+        lines = out[:count]
+        for row in lines:
+            with self.lock:
+                self.send_acquire()
+                self.read_line_into(row, timeout)
+
+        log.debug("Read %s lines", count)
+        return lines
+
+    def set_scans_to_average(self, scans=1, mode="boxcar", alpha=None):
+        """ Configure get_averaged_line. The boxcar mode averages scans
+        fresh lines per call. The "ema" mode folds one new line per call
+        into an exponential moving average with weight alpha.
+        """
+        self.averager = averaging.create(self.get_pixel_count(), scans,
+                                         mode, alpha)
+        return True
+
+    def get_averaged_line(self):
+        """ Return the float64 average selected by set_scans_to_average.
+        The array is reused, so copy it to keep it past the next call.
+        """
+        if self.averager is None:
+            self.set_scans_to_average()
+        return self.averager.acquire(self)
+
+    def start_stream(self, depth=256, outstanding=1):
+        """ Start a background thread that acquires lines continuously
+        into a ring buffer of depth frames. See read_latest and read_n.
+        With outstanding greater than one, that many acquires are kept
+        queued on the device to remove dead time between frames.
+        """
+        if self.stream is not None and self.stream.is_alive():
+            log.warn("Stream already running")
+            return False
+
+        if outstanding > 1:
+            self.stream = streaming.PipelinedStream(self, depth,
+                                                    outstanding)
+        else:
+            self.stream = streaming.LineStream(self, depth)
+        self.stream.start()
+        return True
+
+    def stop_stream(self, timeout=None):
+        """ Stop the background acquisition thread. The ring buffer
+        remains readable until the next start_stream.
+        """
+        if self.stream is None:
+            return False
+
+        return self.stream.stop(timeout)
+
+    def read_latest(self, out=None):
+        """ Return (sequence, timestamp, frame) of the newest streamed
+        line, or None if no line has arrived yet.
+        """
+        return self.stream.ring.read_latest(out)
+
+    def read_n(self, count, out=None):
+        """ Return (sequences, timestamps, frames) of the most recent
+        count streamed lines, oldest first.
+        """
+        return self.stream.ring.read_n(count, out)
+
+    def get_duty_cycle(self):
+        """ Fraction of time spent integrating during the current stream,
+        or None if the integration time was never set on this handle.
+        """
+        return self.stream.duty_cycle()
+
+
+class DeviceMixin(AcquisitionMixin):
+    """ Methods common to the protocol classes of USB devices, which
+    hold vid, pid, bus, address, backend, the connected handle in
+    device, transfer_stats, trace, telemetry and settings.
+    """
+    def find_match(self):
+        """ Keyword arguments for usb.core.find. The bus and address pick
+        out one unit when several share the same pid. A pyusb backend,
+        such as fake_backend.FakeBackend, replaces the default libusb.
+        """
+        match = {"idVendor": self.vid, "idProduct": self.pid}
+        if self.bus is not None:
+            match["bus"] = self.bus
+        if self.address is not None:
+            match["address"] = self.address
+        if self.backend is not None:
+            match["backend"] = self.backend
+        return match
+
+    def stats(self):
+        """ Call, byte and error counts and latency histograms of the
+        control transfers by opcode and bulk reads by endpoint since
+        connect or the last reset_stats.
+        """
+        return self.transfer_stats.snapshot()
+
+    def reset_stats(self):
+        self.transfer_stats.reset()
+
+    def enable_trace(self, depth=4096, dump_path=None):
+        """ Keep the last depth USB transfers in memory. With dump_path
+        set the trace is also written there when a transfer fails.
+        """
+        self.trace = tracing.TransactionTrace(depth, dump_path)
+        if self.device is not None:
+            self.device.trace = self.trace
+        return self.trace
+
+    def disable_trace(self):
+        self.trace = None
+        if self.device is not None:
+            self.device.trace = None
+
+    def dump_trace(self, filename):
+        """ Write the recorded transfers to filename. Returns the number
+        written.
+        """
+        if self.trace is None:
+            log.warn("Transfer trace is not enabled")
+            return 0
+        return self.trace.dump(filename)
+
+    def start_telemetry(self, interval=1.0, depth=3600,
+                        channels=("ccd", "laser")):
+        """ Start a background thread that samples the temperature
+        channels every interval seconds into a ring of depth samples.
+        The device arbiter keeps the readings between lines.
+        """
+        if self.telemetry is not None and self.telemetry.is_alive():
+            log.warn("Telemetry already running")
+            return False
+
+        self.telemetry = telemetry.TelemetryPoller(self, interval, depth,
+                                                   channels)
+        self.telemetry.start()
+        return True
+
+    def stop_telemetry(self, timeout=None):
+        """ Stop the telemetry thread. The samples remain readable until
+        the next start_telemetry.
+        """
+        if self.telemetry is None:
+            return False
+
+        return self.telemetry.stop(timeout)
+
+    def latest_telemetry(self):
+        """ Return (timestamp, {channel: degrees C}) of the newest
+        telemetry sample, or None before the first one.
+        """
+        return self.telemetry.ring.latest()
+
+    def telemetry_window(self, seconds=None):
+        """ Return (timestamps, values) of the telemetry samples from the
+        last seconds, oldest first, with one values column per channel.
+        """
+        return self.telemetry.ring.window(seconds)
+
+    def set_integration_time(self, int_time, force=False):
+        """ Send the updated integration time in a control message to the device.
+        Nothing is sent if the device already has int_time, unless forced.
+        """
+
+        log.debug("Send integration time: %s", int_time)
+        sent, result = settings.write(self, "integration_time", int_time,
+                                      lambda: self.send_code(0xB2, int_time),
+                                      force)
+        return result
+
+    @property
+    def integration_time(self):
+        """ Integration time in ms last written or read, or None if not
+        known since connect.
+        """
+        return self.settings.get("integration_time")
+
+    def apply_settings(self, recipe, force=False):
+        """ Write a dict of integration_time, tec_setpoint, tec_enable and
+        laser_enable values, sending only those that differ from the
+        last values written. Returns the names that were sent.
+        """
+        return settings.apply(self, recipe, force)
+
+    def set_ccd_tec_setpoint(self, setpoint, force=False):
+        """ Attempt to set the CCD cooler setpoint. Verify that it is
+        within an acceptable range. Ideally this is to prevent
+        condensation and other issues. This value is a default and is
+        hugely dependent on the environmental conditions.
+        """
+
+        setpoint_min = 10
+        setpoint_max = 20
+        ok_range = "%s,%s" % (setpoint_min, setpoint_max)
+        if setpoint < setpoint_min:
+            log.critical("TEC setpoint out of range (%s)", ok_range)
+            return False
+
+        if setpoint > setpoint_max:
+            log.critical("TEC setpoint out of range (%s)", ok_range)
+            return False
+
+        new_point = self.tec_coeff0 + (self.tec_coeff1 * setpoint)
+        new_point += (self.tec_coeff2 * (setpoint * setpoint))
+        new_point = int(new_point)
+
+        log.debug("Setting TEC setpoint to: %s", new_point)
+        sent, result = settings.write(self, "tec_setpoint", setpoint,
+                                      lambda: self.send_code(0xD8, new_point),
+                                      force)
+        return not sent or result is not None
@@ -0,0 +1,247 @@
+""" recording - append only binary datasets of spectra.
+
+A dataset is a directory holding three files. header.json describes the
+pixel count and the device that took the data, frames.u16 holds every
+frame as little endian uint16 pixels back to back, and frames.meta one
+fixed size META record per frame: sequence, arrival time, integration
+time in ms and CCD temperature in degrees C, NaN if unknown. Recorder
+fills a preallocated chunk of frames in place and writes each full
+chunk with one call per file, so recording costs a copy at most and
+runs at disk speed. Recording opens the files as numpy memmaps, so a
+multi GB run opens instantly and only the frames used are read. Frames
+are counted from both files, so the partial chunk of an interrupted
+run is ignored, and trimmed when the dataset is appended to.
+"""
+
+import os
+import json
+import time
+import numpy
+
+import logging
+log = logging.getLogger(__name__)
+
+VERSION = 1
+
+HEADER = "header.json"
+FRAMES = "frames.u16"
+METADATA = "frames.meta"
+
+PIXEL = numpy.dtype("<u2")
+META = numpy.dtype([("sequence", "<i8"), ("timestamp", "<f8"),
+                    ("integration_time", "<u4"), ("temperature", "<f4")])
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER)) as header_file:
+        return json.load(header_file)
+
+
+def stored_frames(path, pixels):
+    """ Number of frames held completely in both files of a dataset.
+    """
+    frame_bytes = os.path.getsize(os.path.join(path, FRAMES))
+    meta_bytes = os.path.getsize(os.path.join(path, METADATA))
+    return min(frame_bytes // (pixels * PIXEL.itemsize),
+               meta_bytes // META.itemsize)
+
+
+def describe(device):
+    """ Identity and calibration of a connected device for the dataset
+    header.
+    """
+    if hasattr(device, "read_info"):
+        info = device.read_info().as_dict()
+    else:
+        info = {"serial": device.get_serial_number(),
+                "wavelength_coeffs": [float(coeff) for coeff in
+                                      device.get_calibration_coeffs()]}
+
+    info["pid"] = device.pid
+    for name, value in info.items():
+        if isinstance(value, tuple):
+            info[name] = list(value)
+    return info
+
+
+def ccd_temperature(device):
+    """ Newest CCD temperature from the device telemetry, without a
+    transfer, or NaN when telemetry is not running.
+    """
+    poller = getattr(device, "telemetry", None)
+    if poller is None or "ccd" not in poller.channels:
+        return numpy.nan
+
+    latest = poller.ring.latest()
+    if latest is None:
+        return numpy.nan
+    return latest[1]["ccd"]
+
+
+class Recorder(object):
+    """ Append frames to the dataset at path, creating it if needed.
+    info is stored in the header of a new dataset. Frames are written
+    every chunk_frames frames and on flush or close.
+    """
+    def __init__(self, path, pixels, info=None, chunk_frames=256):
+        if chunk_frames < 1:
+            raise ValueError("Chunk must hold at least one frame")
+
+        self.path = path
+        self.pixels = pixels
+        if os.path.exists(os.path.join(path, HEADER)):
+            self.header = read_header(path)
+            if self.header["pixels"] != pixels:
+                raise ValueError("Dataset has %s pixels, not %s"
+                                 % (self.header["pixels"], pixels))
+            self.count = self.trim()
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.header = {"version": VERSION, "pixels": pixels,
+                           "created": time.time(), "device": info or {}}
+            with open(os.path.join(path, HEADER), "w") as header_file:
+                json.dump(self.header, header_file, indent=1,
+                          sort_keys=True)
+            self.count = 0
+
+        self.frame_file = open(os.path.join(path, FRAMES), "ab")
+        self.meta_file = open(os.path.join(path, METADATA), "ab")
+
+        self.frames = numpy.zeros((chunk_frames, pixels), dtype=PIXEL)
+        self.meta = numpy.zeros(chunk_frames, dtype=META)
+        self.pending = 0
+
+    def trim(self):
+        """ Cut both files back to the frames they hold completely.
+        """
+        count = stored_frames(self.path, self.pixels)
+        for name, size in ((FRAMES, self.pixels * PIXEL.itemsize),
+                           (METADATA, META.itemsize)):
+            with open(os.path.join(self.path, name), "r+b") as data_file:
+                data_file.truncate(count * size)
+        return count
+
+    def write_slot(self):
+        """ Return the row the next frame should be read into.
+        """
+        if self.pending == len(self.frames):
+            self.flush()
+        return self.frames[self.pending]
+
+    def commit(self, sequence=None, timestamp=None, integration_time=0,
+               temperature=numpy.nan):
+        """ Add the row returned by write_slot as the next frame. The
+        sequence defaults to the number of frames in the dataset.
+        """
+        if sequence is None:
+            sequence = self.count
+        if timestamp is None:
+            timestamp = time.time()
+
+        self.meta[self.pending] = (sequence, timestamp,
+                                   integration_time or 0, temperature)
+        self.pending += 1
+        self.count += 1
+        if self.pending == len(self.frames):
+            self.flush()
+
+    def append(self, frame, sequence=None, timestamp=None,
+               integration_time=0, temperature=numpy.nan):
+        """ Copy frame into the dataset.
+        """
+        self.write_slot()[:] = frame
+        self.commit(sequence, timestamp, integration_time, temperature)
+
+    def flush(self):
+        """ Write the frames held in the current chunk.
+        """
+        if self.pending == 0:
+            return
+
+        self.frames[:self.pending].tofile(self.frame_file)
+        self.meta[:self.pending].tofile(self.meta_file)
+        self.frame_file.flush()
+        self.meta_file.flush()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.frame_file.close()
+        self.meta_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class Recording(object):
+    """ Read only view of the frames stored in a dataset when opened.
+    frames is a (count, pixels) uint16 memmap and meta the matching
+    META records; the timestamps serve as the time index.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.pixels = self.header["pixels"]
+        self.count = stored_frames(path, self.pixels)
+
+        if self.count == 0:
+            self.frames = numpy.zeros((0, self.pixels), dtype=PIXEL)
+            self.meta = numpy.zeros(0, dtype=META)
+        else:
+            self.frames = numpy.memmap(os.path.join(path, FRAMES),
+                                       dtype=PIXEL, mode="r",
+                                       shape=(self.count, self.pixels))
+            self.meta = numpy.memmap(os.path.join(path, METADATA),
+                                     dtype=META, mode="r",
+                                     shape=(self.count,))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def device(self):
+        return self.header["device"]
+
+    @property
+    def timestamps(self):
+        return self.meta["timestamp"]
+
+    def index_at(self, timestamp):
+        """ Index of the last frame that arrived at or before timestamp,
+        or -1 if none did.
+        """
+        return int(numpy.searchsorted(self.timestamps, timestamp,
+                                      side="right")) - 1
+
+    def between(self, start, stop):
+        """ Return (meta, frames) of the frames that arrived from start up
+        to but not including stop, as views into the dataset.
+        """
+        first = numpy.searchsorted(self.timestamps, start, side="left")
+        last = numpy.searchsorted(self.timestamps, stop, side="left")
+        return self.meta[first:last], self.frames[first:last]
+
+
+def record(device, path, count, chunk_frames=256):
+    """ Acquire count lines from a connected device straight into the
+    dataset at path, with the CCD temperature from the device telemetry
+    if it is running. Returns the number of frames in the dataset.
+    """
+    pixels = device.get_pixel_count()
+    with Recorder(path, pixels, describe(device), chunk_frames) as recorder:
+        for index in range(count):
+            row = recorder.write_slot()
+            with device.lock:
+                device.send_acquire()
+                device.read_line_into(row)
+            recorder.commit(timestamp=time.time(),
+                            integration_time=device.integration_time,
+                            temperature=ccd_temperature(device))
+
+    log.debug("Recorded %s lines to %s", count, path)
+    return recorder.count
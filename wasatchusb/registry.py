@@ -0,0 +1,289 @@
+""" registry - one enumeration pass over every Wasatch Photonics device.
+
+DeviceRegistry walks the bus once with usb.core.find and indexes each
+0x24aa device by product id, bus/address and serial number, along with
+the protocol class to drive it. Results are kept until invalidate or
+refresh is called, so repeated lookups and opening a unit by serial
+number do not touch the bus again. A lookup that finds nothing in the
+cache walks the bus once more, so a unit attached since the last scan
+is still found. The hotplug monitor keeps the index current with add
+and remove as devices come and go.
+"""
+
+import usb
+import usb.core
+import usb.util
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+WASATCH_VID = 0x24aa
+
+# Product ids that speak the feature identification protocol. Everything
+# else on the Wasatch vendor id is a stroker protocol device.
+FEATURE_IDENTIFICATION_PIDS = (0x1000, 0x2000, 0x3000, 0x4000)
+
+
+def device_class(pid):
+    """ Return the device class that speaks the protocol for pid.
+    """
+    # Imported here as both protocol modules use the registry
+    from wasatchusb import feature_identification, stroker_protocol
+
+    if pid in FEATURE_IDENTIFICATION_PIDS:
+        return feature_identification.Device
+    return stroker_protocol.StrokerProtocolDevice
+
+
+def read_serial(usb_device):
+    """ Read the serial number string descriptor, or return None. Older
+    units need the 256 langid, newer units require none.
+    """
+    if not usb_device.iSerialNumber:
+        return None
+
+    for langid in (256, None):
+        try:
+            return usb.util.get_string(usb_device,
+                                       usb_device.iSerialNumber, langid)
+        except Exception as exc:
+            log.debug("Failure to read langid %s serial: %s", langid, exc)
+
+    return None
+
+
+class DeviceEntry(object):
+    """ One attached device as seen during the last scan.
+    """
+    __slots__ = ("vid", "pid", "bus", "address", "serial_index",
+                 "usb_device", "serial", "serial_read", "backend")
+
+    def __init__(self, usb_device, backend=None):
+        self.vid = usb_device.idVendor
+        self.pid = usb_device.idProduct
+        self.bus = usb_device.bus
+        self.address = usb_device.address
+        self.serial_index = usb_device.iSerialNumber
+        self.usb_device = usb_device
+        self.serial = None
+        self.serial_read = False
+        self.backend = backend
+
+    def location(self):
+        return (self.bus, self.address)
+
+    def get_serial(self):
+        """ Serial number from the USB descriptor, read on first use.
+        """
+        if not self.serial_read:
+            self.serial = read_serial(self.usb_device)
+            self.serial_read = True
+        return self.serial
+
+    def device_class(self):
+        return device_class(self.pid)
+
+    def is_feature_identification(self):
+        return self.pid in FEATURE_IDENTIFICATION_PIDS
+
+    def create(self, **kwargs):
+        """ Construct, but do not connect, the protocol device.
+        """
+        if self.backend is not None:
+            kwargs.setdefault("backend", self.backend)
+        return self.device_class()(vid=self.vid, pid=self.pid,
+                                   bus=self.bus, address=self.address,
+                                   **kwargs)
+
+    def __repr__(self):
+        return "DeviceEntry(%s:%s bus %s address %s)" \
+               % (hex(self.vid), hex(self.pid), self.bus, self.address)
+
+
+class DeviceRegistry(object):
+    """ Cached index of the devices on one vendor id. Pass a pyusb
+    backend to scan something other than the default libusb.
+    """
+    def __init__(self, vid=WASATCH_VID, backend=None):
+        self.vid = vid
+        self.backend = backend
+        self.scans = 0
+        self.lock = threading.RLock()
+        self.invalidate()
+
+    def invalidate(self):
+        """ Drop the cached scan. The next lookup walks the bus again.
+        """
+        self._entries = None
+        self.by_pid = {}
+        self.by_location = {}
+        self.by_serial = None
+
+    def refresh(self):
+        """ Walk the bus now and rebuild every index. Serials already
+        read are kept for devices still at the same bus/address.
+        """
+        with self.lock:
+            known = self.by_location
+            self.invalidate()
+            entries = [DeviceEntry(usb_device, self.backend)
+                       for usb_device in self.find_all()]
+            self.scans += 1
+
+            for entry in entries:
+                previous = known.get(entry.location())
+                if previous is not None and previous.pid == entry.pid \
+                   and previous.serial_read:
+                    entry.serial = previous.serial
+                    entry.serial_read = True
+
+                self.by_pid.setdefault(entry.pid, []).append(entry)
+                self.by_location[entry.location()] = entry
+
+            self._entries = entries
+            log.debug("Scan %s found %s devices", self.scans, len(entries))
+            return list(entries)
+
+    def find_all(self, **match):
+        """ usb.core.find every device on the vendor id, through the
+        registry backend.
+        """
+        match["idVendor"] = self.vid
+        if self.backend is not None:
+            match["backend"] = self.backend
+        return usb.core.find(find_all=True, **match)
+
+    def entries(self):
+        """ Every device from the cached scan, scanning if needed.
+        """
+        with self.lock:
+            if self._entries is None:
+                self.refresh()
+            return list(self._entries)
+
+    def serial_index(self):
+        """ Map of serial number to entry. String descriptors are only
+        read the first time this is needed after a scan.
+        """
+        with self.lock:
+            entries = self.entries()
+            if self.by_serial is None:
+                self.by_serial = {}
+                for entry in entries:
+                    serial = entry.get_serial()
+                    if serial is not None:
+                        self.by_serial[serial] = entry
+            return self.by_serial
+
+    def find(self, serial=None, pid=None, bus=None, address=None):
+        """ Return the first entry matching every given field, or None.
+        The bus is scanned again when the cached scan has no match.
+        """
+        with self.lock:
+            scans = self.scans
+            entry = self.match(serial, pid, bus, address)
+            if entry is None and self.scans == scans:
+                log.debug("No cached match, scanning again")
+                self.refresh()
+                entry = self.match(serial, pid, bus, address)
+            return entry
+
+    def match(self, serial=None, pid=None, bus=None, address=None):
+        """ First entry of the cached scan matching every given field,
+        or None.
+        """
+        if serial is not None:
+            candidates = [self.serial_index().get(serial)]
+        elif bus is not None and address is not None:
+            candidates = [self.by_location_entry(bus, address)]
+        elif pid is not None:
+            with self.lock:
+                self.entries()
+                candidates = list(self.by_pid.get(pid, []))
+        else:
+            candidates = self.entries()
+
+        for entry in candidates:
+            if entry is None:
+                continue
+            if pid is not None and entry.pid != pid:
+                continue
+            if bus is not None and entry.bus != bus:
+                continue
+            if address is not None and entry.address != address:
+                continue
+            return entry
+
+        return None
+
+    def add(self, usb_device):
+        """ Index a newly attached device without rescanning. Returns the
+        new entry, or None if that bus/address is already known.
+        """
+        with self.lock:
+            self.entries()
+            entry = DeviceEntry(usb_device, self.backend)
+            if entry.location() in self.by_location:
+                return None
+
+            self._entries.append(entry)
+            self.by_pid.setdefault(entry.pid, []).append(entry)
+            self.by_location[entry.location()] = entry
+            if self.by_serial is not None:
+                serial = entry.get_serial()
+                if serial is not None:
+                    self.by_serial[serial] = entry
+            return entry
+
+    def remove(self, bus, address):
+        """ Drop a detached device from every index. Returns the removed
+        entry, or None if it was not known.
+        """
+        with self.lock:
+            entry = self.by_location.pop((bus, address), None)
+            if entry is None:
+                return None
+
+            self._entries.remove(entry)
+            self.by_pid[entry.pid].remove(entry)
+            if not self.by_pid[entry.pid]:
+                del self.by_pid[entry.pid]
+            if self.by_serial is not None and entry.serial is not None:
+                if self.by_serial.get(entry.serial) is entry:
+                    del self.by_serial[entry.serial]
+            return entry
+
+    def by_location_entry(self, bus, address):
+        with self.lock:
+            self.entries()
+            return self.by_location.get((bus, address))
+
+    def open(self, serial=None, pid=None, bus=None, address=None,
+             **kwargs):
+        """ Construct and connect the protocol device for the first
+        matching entry. Returns None if nothing matches or the connect
+        fails.
+        """
+        entry = self.find(serial=serial, pid=pid, bus=bus, address=address)
+        if entry is None:
+            log.critical("No device for serial %s pid %s", serial, pid)
+            return None
+
+        device = entry.create(**kwargs)
+        if device.connect() is not True:
+            return None
+        return device
+
+
+_registries = {}
+
+
+def get_registry(vid=WASATCH_VID):
+    """ The shared registry for a vendor id.
+    """
+    registry = _registries.get(vid)
+    if registry is None:
+        registry = DeviceRegistry(vid)
+        _registries[vid] = registry
+    return registry
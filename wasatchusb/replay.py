@@ -0,0 +1,185 @@
+""" replay - play a recorded dataset back through the Device interface.
+
+ReplayDevice answers the acquisition, temperature and calibration calls
+of feature_identification.Device from a dataset written by recording,
+so processing pipelines can be benchmarked and regression tested on
+production spectra without a spectrometer attached. Lines come off the
+dataset memmap in order, as fast as the caller reads them or paced by
+their recorded timestamps. Temperatures and integration times are those
+recorded with the line last read, and the calibration comes from the
+dataset header.
+"""
+
+import time
+import numpy
+
+from wasatchusb import arbiter
+from wasatchusb import calibration
+from wasatchusb import decode
+from wasatchusb import mixins
+from wasatchusb import recording
+from wasatchusb.feature_identification import DeviceInfo
+
+import logging
+log = logging.getLogger(__name__)
+
+COEFFICIENTS = ("C0", "C1", "C2", "C3")
+
+
+class ReplayDevice(mixins.AcquisitionMixin):
+    """ Play back the dataset at path. With realtime set, each line is
+    held until its recorded arrival time, scaled by speed, has passed
+    since the first line. With loop set the dataset starts over at the
+    end, otherwise reads past the end fail and a stream ends there.
+    """
+    def __init__(self, path, realtime=False, speed=1.0, loop=False,
+                 list_output=False):
+        if speed <= 0:
+            raise ValueError("Replay speed must be positive")
+
+        self.path = path
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.list_output = list_output
+
+        self.recording = recording.Recording(path)
+        self.info = self.recording.device
+        self.pid = self.info.get("pid")
+        self.line = numpy.zeros(self.recording.pixels, dtype=numpy.uint16)
+
+        # Index of the next line, and of the line last read
+        self.position = 0
+        self.current = None
+        self.started = None
+
+        self.stream = None
+        self.averager = None
+        self.calibration = None
+        self.lock = arbiter.CommandArbiter()
+
+        self.integration_time = None
+        if len(self.recording):
+            self.integration_time = \
+                int(self.recording.meta["integration_time"][0])
+
+    def connect(self):
+        """ Return True if the dataset holds any lines.
+        """
+        if len(self.recording) == 0:
+            log.critical("No lines to replay in %s", self.path)
+            return False
+        return True
+
+    def disconnect(self):
+        log.info("Placeholder disconnect")
+
+    def rewind(self):
+        """ Start again from the first line.
+        """
+        self.position = 0
+        self.started = None
+
+    def get_pixel_count(self):
+        return self.recording.pixels
+
+    def get_serial_number(self):
+        return self.info.get("serial", "")
+
+    def get_model_number(self):
+        return self.info.get("model", "")
+
+    def read_info(self):
+        """ DeviceInfo of the recording unit, as stored in the header.
+        """
+        return DeviceInfo(**self.info)
+
+    def send_acquire(self):
+        """ Nothing to trigger: read_line_into takes the next line.
+        """
+        return None
+
+    def next_index(self):
+        """ Index of the line to read next, waiting for its recorded
+        time when replaying in real time. Raises EOFError at the end of
+        the dataset unless looping.
+        """
+        if self.position >= len(self.recording):
+            if not self.loop or len(self.recording) == 0:
+                raise EOFError("End of replay at line %s" % self.position)
+            self.rewind()
+
+        index = self.position
+        self.position += 1
+
+        if self.realtime:
+            timestamps = self.recording.timestamps
+            if self.started is None:
+                self.started = time.time()
+            due = self.started + (timestamps[index] - timestamps[0]) \
+                  / self.speed
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        return index
+
+    def read_line_into(self, out, timeout=None):
+        """ Copy the next recorded line into the uint16 array out.
+        """
+        index = self.next_index()
+        out[:] = self.recording.frames[index]
+        self.current = index
+        return out
+
+    def get_line(self, timeout=None):
+        """ Return the next recorded line as a uint16 numpy array that
+        is overwritten by the next call, or a list if list_output is
+        set. Returns None at the end of the dataset.
+        """
+        try:
+            self.read_line_into(self.line)
+        except EOFError as exc:
+            log.warn("%s", exc)
+            return None
+        return decode.format_line(self.line, self.list_output)
+
+    def recorded(self, field):
+        """ Value of a metadata field recorded with the line last read,
+        or with the first line before any has been read.
+        """
+        index = self.current
+        if index is None:
+            index = 0
+        return self.recording.meta[field][index]
+
+    def get_ccd_temperature(self):
+        """ CCD temperature in degrees C recorded with the current line,
+        NaN if none was recorded.
+        """
+        return float(self.recorded("temperature"))
+
+    def get_integration_time(self, refresh=False):
+        return int(self.recorded("integration_time"))
+
+    def set_integration_time(self, int_time, force=False):
+        """ The recorded integration times cannot change, so only log.
+        """
+        log.info("Replay ignores integration time %s", int_time)
+        return None
+
+    def get_calibration(self, coefficient="C0"):
+        """ Wavelength calibration coefficient from the dataset header.
+        """
+        coeffs = self.info["wavelength_coeffs"]
+        return float(coeffs[COEFFICIENTS.index(coefficient)])
+
+    def get_wavelength_axis(self):
+        """ Return the wavelength of every pixel as a read only numpy
+        array.
+        """
+        if self.calibration is None:
+            coeffs = [self.get_calibration(name) for name in COEFFICIENTS]
+            self.calibration = calibration.Calibration(
+                coeffs, self.get_pixel_count())
+        return self.calibration.wavelengths()
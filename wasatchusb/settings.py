@@ -0,0 +1,108 @@
+""" settings - write-through cache of the values last sent to a device.
+
+The setters record each value once the control transfer succeeds, skip
+the transfer when asked to write the value already held, and the
+getters answer from the cache until a refresh is forced. A failed write
+forgets the cached value, so the next call always goes to the device.
+apply_settings takes a recipe dict and sends only the entries that
+differ from the cache. Setters return None or False when nothing
+reached the device.
+"""
+
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+# Recipe names and their device setters, in the order they are applied.
+# The laser goes last so it is only enabled once the rest is in place.
+SETTERS = (("integration_time", "set_integration_time"),
+           ("tec_setpoint", "set_ccd_tec_setpoint"),
+           ("tec_enable", "set_ccd_tec_enable"),
+           ("laser_enable", "set_laser_enable"))
+
+
+class SettingsCache(object):
+    """ Last known value of each named setting on one device.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.skipped = 0
+
+    def get(self, name):
+        """ Cached value, or None if unknown.
+        """
+        with self.lock:
+            return self.values.get(name)
+
+    def changed(self, name, value):
+        """ True unless value is already cached for name.
+        """
+        with self.lock:
+            return name not in self.values or self.values[name] != value
+
+    def store(self, name, value):
+        with self.lock:
+            self.values[name] = value
+
+    def invalidate(self, name=None):
+        """ Forget one setting, or all of them.
+        """
+        with self.lock:
+            if name is None:
+                self.values.clear()
+            else:
+                self.values.pop(name, None)
+
+
+def write(device, name, value, send, force=False):
+    """ Call send() to write value unless the device cache already
+    holds it. Returns (sent, result), where result is the send result
+    or None when skipped.
+    """
+    cache = device.settings
+    if not force and not cache.changed(name, value):
+        log.debug("Skip %s, already %s", name, value)
+        cache.skipped += 1
+        return False, None
+
+    result = send()
+    if result is None:
+        cache.invalidate(name)
+    else:
+        cache.store(name, value)
+    return True, result
+
+
+def written(result):
+    """ True if a setter result shows the value was written: skipped,
+    rejected and failed writes return None or False.
+    """
+    return result is not None and result is not False
+
+
+def apply(device, recipe, force=False):
+    """ Send the recipe entries that differ from the device cache.
+    Returns the names that were written.
+    """
+    known = dict(SETTERS)
+    for name in recipe:
+        if name not in known:
+            raise ValueError("Unknown setting: %s" % name)
+
+    names = []
+    for name, setter in SETTERS:
+        if name not in recipe:
+            continue
+
+        value = recipe[name]
+        if not force and not device.settings.changed(name, value):
+            continue
+
+        if written(getattr(device, setter)(value, force=force)):
+            names.append(name)
+        else:
+            log.warn("Setting %s to %s was not written", name, value)
+
+    return names
@@ -0,0 +1,277 @@
+""" streaming - background acquisition into a preallocated ring buffer.
+
+A reader thread keeps the detector busy by triggering and reading lines
+back to back, writing each frame into the next row of a fixed size
+uint16 array along with a sequence number and arrival timestamp.
+Consumers pull the latest frame, or the last N frames, at their own
+pace without stalling the USB pipe.
+
+PipelinedStream keeps several acquire commands outstanding so the next
+readout is already queued when a bulk read lands, removing the host
+round trip from the dead time between frames at short integrations.
+"""
+
+import time
+import numpy
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class FrameRing(object):
+    """ Fixed size circular store of frames. Rows are allocated once at
+    creation; the writer fills the next slot in place and then commits
+    it. The slot being written is never visible to readers.
+    """
+    def __init__(self, depth, pixels):
+        if depth < 2:
+            raise ValueError("Ring depth must be at least 2")
+
+        self.depth = depth
+        self.pixels = pixels
+        self.frames = numpy.zeros((depth, pixels), dtype=numpy.uint16)
+        self.sequence = numpy.zeros(depth, dtype=numpy.int64)
+        self.timestamps = numpy.zeros(depth, dtype=numpy.float64)
+
+        # Total number of frames committed since creation
+        self.count = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+
+    def write_slot(self):
+        """ Return the row the writer should fill next.
+        """
+        return self.frames[self.count % self.depth]
+
+    def commit(self, timestamp=None, sequence=None):
+        """ Publish the row returned by write_slot as the newest frame.
+        The sequence number defaults to the count of committed frames.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.lock:
+            slot = self.count % self.depth
+            if sequence is None:
+                sequence = self.count
+            self.sequence[slot] = sequence
+            self.timestamps[slot] = timestamp
+            self.count += 1
+            self.ready.notify_all()
+
+    def available(self):
+        """ Number of committed frames that can be read. One slot is
+        always reserved for the writer.
+        """
+        return min(self.count, self.depth - 1)
+
+    def wait(self, count, timeout=None):
+        """ Block until more than count frames have been committed.
+        Return True if that happened before the timeout.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self.lock:
+            while self.count <= count:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                self.ready.wait(remaining)
+            return self.count > count
+
+    def latest_timestamp(self):
+        """ Arrival time of the newest committed frame, or None.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            return float(self.timestamps[(self.count - 1) % self.depth])
+
+    def read_latest(self, out=None):
+        """ Return (sequence, timestamp, frame) for the newest committed
+        frame, or None if nothing has arrived. The frame is copied into
+        out when given, otherwise into a new array.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+
+            slot = (self.count - 1) % self.depth
+            if out is None:
+                out = numpy.empty(self.pixels, dtype=numpy.uint16)
+            out[:] = self.frames[slot]
+            return int(self.sequence[slot]), \
+                   float(self.timestamps[slot]), out
+
+    def read_n(self, count, out=None):
+        """ Return (sequences, timestamps, frames) for the most recent
+        count frames, oldest first. Fewer rows are returned if fewer are
+        available. Frames are copied into out when given, which must
+        have at least count rows.
+        """
+        with self.lock:
+            count = min(count, self.available())
+            first = self.count - count
+            slots = numpy.arange(first, self.count) % self.depth
+
+            if out is None:
+                out = numpy.empty((count, self.pixels),
+                                  dtype=numpy.uint16)
+            frames = out[:count]
+            numpy.take(self.frames, slots, axis=0, out=frames)
+            return self.sequence[slots], self.timestamps[slots], frames
+
+
+class LineStream(threading.Thread):
+    """ Given a connected device, trigger and read lines continuously
+    into a FrameRing until stopped. The device must provide
+    get_pixel_count, send_acquire, read_line_into and the lock held
+    around each acquire and read. A device with no more lines, such as
+    a finished replay, raises EOFError from read_line_into to end the
+    stream.
+    """
+    def __init__(self, device, depth=256):
+        super(LineStream, self).__init__()
+        self.daemon = True
+        self.device = device
+        self.ring = FrameRing(depth, device.get_pixel_count())
+        self.errors = 0
+        self.running = threading.Event()
+        self.start_time = None
+
+        # Last integration time written to the device in ms, if known
+        self.integration_time = getattr(device, "integration_time", None)
+
+    def start(self):
+        self.running.set()
+        self.start_time = time.time()
+        super(LineStream, self).start()
+
+    def line_rate(self):
+        """ Average lines per second since the stream started.
+        """
+        elapsed = self.elapsed()
+        if not elapsed:
+            return 0.0
+        return self.ring.count / elapsed
+
+    def duty_cycle(self):
+        """ Fraction of wall clock time the detector spent integrating,
+        from 0.0 to 1.0. Returns None if the integration time is unknown.
+        """
+        if self.integration_time is None:
+            return None
+
+        elapsed = self.elapsed()
+        if not elapsed:
+            return 0.0
+
+        exposed = self.ring.count * self.integration_time / 1000.0
+        return min(exposed / elapsed, 1.0)
+
+    def elapsed(self):
+        """ Seconds from the start of the stream to the newest frame.
+        """
+        latest = self.ring.latest_timestamp()
+        if self.start_time is None or latest is None:
+            return 0.0
+        return latest - self.start_time
+
+    def stop(self, timeout=None):
+        """ Ask the reader to finish after the current frame, and wait
+        for it to exit. Return True if the thread has stopped.
+        """
+        self.running.clear()
+        self.join(timeout)
+        return not self.is_alive()
+
+    def run(self):
+        ring = self.ring
+        device = self.device
+        while self.running.is_set():
+            try:
+                with device.lock:
+                    device.send_acquire()
+                    device.read_line_into(ring.write_slot())
+            except EOFError as exc:
+                log.info("Stream ended: %s", exc)
+                self.running.clear()
+                break
+            except Exception as exc:
+                log.critical("Failure in stream read: %s", exc)
+                self.errors += 1
+
+                # Avoid spinning on a device that has gone away
+                time.sleep(0.01)
+                continue
+
+            ring.commit(time.time())
+
+        log.debug("Stream stopped after %s frames", ring.count)
+
+
+class PipelinedStream(LineStream):
+    """ Keep outstanding acquire commands queued on the device. As soon
+    as a bulk read lands, the next acquire is sent before the frame is
+    published, so the detector never waits on the host. pyusb only
+    offers synchronous transfers, so the queue depth is held by the
+    device firmware rather than by libusb async transfers.
+    """
+    def __init__(self, device, depth=256, outstanding=2):
+        super(PipelinedStream, self).__init__(device, depth)
+        if outstanding < 1:
+            raise ValueError("At least one acquire must be outstanding")
+        self.outstanding = outstanding
+        self.pending = 0
+
+    def run(self):
+        ring = self.ring
+        device = self.device
+
+        while self.running.is_set():
+            try:
+                with device.lock:
+                    while self.pending < self.outstanding:
+                        device.send_acquire()
+                        self.pending += 1
+
+                    # A failed read still used up its acquire; the
+                    # rest stay queued on the device
+                    try:
+                        device.read_line_into(ring.write_slot())
+                    finally:
+                        self.pending -= 1
+                    arrival = time.time()
+
+                    device.send_acquire()
+                    self.pending += 1
+            except Exception as exc:
+                log.critical("Failure in pipelined read: %s", exc)
+                self.errors += 1
+                time.sleep(0.01)
+                continue
+
+            ring.commit(arrival)
+
+        self.drain()
+        log.debug("Pipelined stream stopped after %s frames", ring.count)
+
+    def drain(self):
+        """ Read and discard the lines still queued on the device so the
+        next caller starts from a fresh acquire.
+        """
+        scratch = self.ring.write_slot()
+        while self.pending > 0:
+            try:
+                with self.device.lock:
+                    self.device.read_line_into(scratch)
+            except Exception as exc:
+                log.warn("Failure draining pipelined read: %s", exc)
+            finally:
+                self.pending -= 1
+        self.pending = 0
@@ -7,8 +7,20 @@ https://en.wikipedia.org/wiki/Stroker_kit
 
 import usb
 import math
+import array
+import numpy
 import struct
 
+from wasatchusb import decode
+from wasatchusb import registry
+from wasatchusb import calibration
+from wasatchusb import arbiter
+from wasatchusb import instrumentation
+from wasatchusb import thermistor
+from wasatchusb import settings
+from wasatchusb import timeouts
+from wasatchusb import mixins
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -22,17 +34,17 @@ class ListDevices(object):
 
     def get_all(self, vid=0x24aa):
         """ Return the full list of devices that match the vendor id.
-        Explicitly reject the feature identification codes
+        Explicitly reject the feature identification codes. Rescans the
+        bus, refreshing the shared device registry.
         """
         list_devices = []
 
-        for bus in usb.busses():
-            for device in bus.devices:
+        for entry in registry.get_registry(vid).refresh():
 
-                single = self.device_match(device, vid)
+            single = self.device_match(entry.usb_device, vid)
 
-                if single is not None:
-                    list_devices.append(single)
+            if single is not None:
+                list_devices.append(single)
 
         return list_devices
 
@@ -43,37 +55,59 @@ class ListDevices(object):
         if device.idVendor != vid:
             return None
 
-        if device.idProduct == 0x1000 or \
-           device.idProduct == 0x2000 or \
-           device.idProduct == 0x3000 or \
-           device.idProduct == 0x4000:
-               return None
+        if device.idProduct in registry.FEATURE_IDENTIFICATION_PIDS:
+            return None
 
         single = (hex(device.idVendor), hex(device.idProduct))
         return single
 
-class StrokerProtocolDevice(object):
+class StrokerProtocolDevice(mixins.DeviceMixin):
     """ Provide function wrappers for all of the common tasks associated
     with stroker control. This includes control messages to pass
     settings back and forth, as well as bulk transfers to get lines of
     data from the device.
     """
-    def __init__(self, vid=0x24aa, pid=0x0001):
+    def __init__(self, vid=0x24aa, pid=0x0001, list_output=False,
+                 bus=None, address=None, backend=None):
         log.debug("init")
         self.vid = vid
         self.pid = pid
+        self.bus = bus
+        self.address = address
+        self.backend = backend
         self.device = None
+        self.list_output = list_output
         self.tec_coeff0 = 3566.62
         self.tec_coeff1 = -143.543
         self.tec_coeff2 = -0.324723
 
+        # Reused by read_line_into so streaming reads do not allocate.
+        # MTI units read the second half of the line into it as well.
+        line_buffer = 2048 # 1024 16bit pixels
+        if self.pid == 0x2000:
+            line_buffer = 1024 # 512 16bit pixels
+        self.bulk_buffer = array.array("B", [0]) * line_buffer
+        self.stream = None
+        self.averager = None
+        self.calibration = None
+        self.transfer_stats = instrumentation.TransferStats()
+        self.trace = None
+        self.telemetry = None
+        self.settings = settings.SettingsCache()
+        self.timeouts = timeouts.AdaptiveTimeout()
+
+        # Held as a frame from each acquire to the end of its bulk
+        # read. Every other transfer takes a command hold, so control
+        # transfers from other threads land between lines.
+        self.lock = arbiter.CommandArbiter()
+
     def connect(self):
         """ Attempt to connect to the specified device. Log any failures and
         return False if there is a problem, otherwise return True.
         """
 
         try:
-            device = usb.core.find(idVendor=self.vid, idProduct=self.pid)
+            device = usb.core.find(**self.find_match())
         except Exception as exc:
             log.critical("Exception in find: %s", exc)
             log.info("Is the device available with libusb?")
@@ -96,7 +130,10 @@ class StrokerProtocolDevice(object):
             log.warn("Failure in claimInterface: %s", exc)
             return None
 
-        self.device = device
+        self.device = instrumentation.InstrumentedDevice(
+            device, self.transfer_stats, self.trace, self.lock,
+            self.timeouts)
+        self.settings.invalidate()
         return True
 
     def disconnect(self):
@@ -106,21 +143,23 @@ class StrokerProtocolDevice(object):
         log.info("Placeholder disconnect")
         return True
 
-
-    def send_code(self, FID_bmRequest, FID_wValue=0):
+    def send_code(self, FID_bmRequest, FID_wValue=0, timeout=None):
         """ Perform the control message transfer required to send a
-        value to the device, return the extracted value.
+        value to the device, return the extracted value. The timeout in
+        ms defaults to the adaptive control deadline.
         """
         FID_bmRequestType = 0x40 # host to device
         FID_wIndex = 0           # current specification has all index 0
         FID_wLength = ""
 
+        result = None
         try:
             result = self.device.ctrl_transfer(FID_bmRequestType,
                                                FID_bmRequest,
                                                FID_wValue,
                                                FID_wIndex,
-                                               FID_wLength)
+                                               FID_wLength,
+                                               timeout)
         except Exception as exc:
             log.critical("Problem with ctrl transfer: %s", exc)
 
@@ -128,19 +167,23 @@ class StrokerProtocolDevice(object):
         return result
 
 
-    def get_code(self, FID_bmRequest, FID_wValue=0, FID_wLength=64):
+    def get_code(self, FID_bmRequest, FID_wValue=0, FID_wLength=64,
+                 timeout=None):
         """ Use the StrokerProtocol (sp), and perform the control
-        message transfer required to get a setting from the device.
+        message transfer required to get a setting from the device. The
+        timeout in ms defaults to the adaptive control deadline.
         """
         FID_bmRequestType = 0xC0 # device to host
         FID_wIndex = 0           # current specification has all index 0
 
+        result = None
         try:
             result = self.device.ctrl_transfer(FID_bmRequestType,
                                                FID_bmRequest,
                                                FID_wValue,
                                                FID_wIndex,
-                                               FID_wLength)
+                                               FID_wLength,
+                                               timeout)
         except Exception as exc:
             log.critical("Problem with ctrl transfer: %s", exc)
 
@@ -169,14 +212,20 @@ class StrokerProtocolDevice(object):
         return serial
 
 
-    def get_integration_time(self):
-        """ Read the integration time stored on the device.
+    def get_integration_time(self, refresh=False):
+        """ Read the integration time stored on the device. The last
+        value read or written is returned unless refresh is set.
         """
+        curr_time = self.settings.get("integration_time")
+        if curr_time is not None and not refresh:
+            return curr_time
+
         result = self.get_code(0xBF)
 
         curr_time = (result[2] * 0x10000) + (result[1] * 0x100) + result[0]
 
         log.debug("Integration time: %s", curr_time)
+        self.settings.store("integration_time", curr_time)
         return curr_time
 
 
@@ -247,40 +296,101 @@ class StrokerProtocolDevice(object):
         return "%s%s" % (chr_fpga_prefix, chr_fpga_suffix)
 
 
-    def get_line(self):
+    def get_pixel_count(self):
+        """ Return the number of 16 bit pixels in a line for this pid,
+        including the second half read from endpoint 86 on MTI units.
+        """
+        if self.pid == 1:
+            return 2048
+        if self.pid == 0x2000:
+            return 512
+        return 1024
+
+    def send_acquire(self):
+        """ Send the acquire opcode that starts a line readout.
+        """
+        return self.send_code(0xAD)
+
+    def line_timeout(self, timeout=None):
+        """ Milliseconds to wait for the next line: timeout if given,
+        otherwise the integration time plus the measured readout
+        allowance.
+        """
+        if timeout is not None:
+            return timeout
+        return self.timeouts.bulk(self.settings.get("integration_time"))
+
+    def read_bulk(self, endpoint, size_or_buffer, timeout=None,
+                  integration_time=None):
+        """ Read from a bulk endpoint within timeout ms, by default within
+        integration_time plus the readout allowance. Reads on that
+        default deadline are measured into the allowance.
+        """
+        if timeout is None:
+            timeout = self.timeouts.bulk(integration_time)
+            self.timeouts.expect(integration_time)
+        return self.device.read(endpoint, size_or_buffer, timeout=timeout)
+
+    def get_line(self, timeout=None):
         """ Issue the "acquire" control message, then immediately read
-        back from the bulk endpoint.
+        back from the bulk endpoint. Returns a uint16 numpy array, or a
+        list if list_output is set. Pass timeout in ms to override the
+        deadline from line_timeout.
         """
-        result = self.send_code(0xAD)
+        line_buffer = len(self.bulk_buffer)
+        with self.lock:
+            result = self.send_acquire()
+            data = self.read_bulk(0x82, line_buffer, timeout,
+                                  self.settings.get("integration_time"))
 
-        line_buffer = 2048 # 1024 16bit pixels
-        if self.pid == 0x2000:
-            line_buffer = 1024 # 512 16bit pixels
+            # The 2048 pixel MTI units (pid 1) send a second half
+            second_half = None
+            if self.pid == 1:
+                second_half = self.read_second_half(timeout)
 
-        data = self.device.read(0x82, line_buffer, timeout=1000)
         log.debug("Raw data: %s", data)
 
         try:
-            data = [i + 256 * j for i, j in zip(data[::2], data[1::2])]
+            data = decode.unpack_line(data)
         except Exception as exc:
             log.critical("Failure in data unpack: %s", exc)
-            data = None
+            return None
 
         # Append the 2048 pixel data for just MTI produt id (1)
+        if second_half is not None:
+            data = numpy.concatenate((data, second_half))
+
+        return decode.format_line(data, self.list_output)
+
+    def read_line_into(self, out, timeout=None):
+        """ Read one line from the bulk endpoints into the uint16 array
+        out without allocating. The acquire must already have been sent.
+        """
+        half = len(self.bulk_buffer) // 2
+
+        count = self.read_bulk(0x82, self.bulk_buffer, timeout,
+                               self.settings.get("integration_time"))
+        decode.check_length(count, self.bulk_buffer)
+        decode.unpack_line_into(self.bulk_buffer, out[:half])
+
         if self.pid == 1:
-            second_half = self.read_second_half()
-            data.extend(second_half)
+            # Already read out, so only the readout allowance applies
+            count = self.read_bulk(0x86, self.bulk_buffer, timeout, 0)
+            decode.check_length(count, self.bulk_buffer)
+            decode.unpack_line_into(self.bulk_buffer, out[half:])
 
-        return data
+        return out
 
-    def read_second_half(self):
+    def read_second_half(self, timeout=None):
         """ Read from end point 86 of the ancient-er 2048 pixel
-            hamamatsu detector in MTI units.
+            hamamatsu detector in MTI units. Returns a uint16 numpy array.
+            The line is already read out, so the deadline defaults to
+            the readout allowance alone.
         """
         log.debug("Also read off end point 86")
-        data = self.device.read(0x86, 2048, timeout=1000)
+        data = self.read_bulk(0x86, 2048, timeout, 0)
         try:
-            data = [i + 256 * j for i, j in zip(data[::2], data[1::2])]
+            data = decode.unpack_line(data)
 
         except Exception as exc:
             log.critical("Failure in data unpack: %s", exc)
@@ -288,15 +398,6 @@ class StrokerProtocolDevice(object):
 
         return data
 
-    def set_integration_time(self, int_time):
-        """ Send the updated integration time in a control message to the device.
-        """
-
-        log.debug("Send integration time: %s", int_time)
-        result = self.send_code(0xB2, int_time)
-        return result
-
-
     def get_laser_temperature(self):
         """ Read the Analog to Digital conversion value from the device.
         Apply formula to convert AD value to temperature, return raw
@@ -313,13 +414,10 @@ class StrokerProtocolDevice(object):
         log.debug("Plain adc: %s", result)
 
         try:
-            adc_value  = float(result[0] + (result[1] * 256))
-            voltage    = float((adc_value / 4096.0) * 2.5)
-            resistance = 21450 * voltage
-            resistance = resistance / (2.5 - voltage)
-            logVal     = math.log( resistance / 10000 )
-            insideMain = float(logVal + ( 3977.0 / (25 + 273.0) ))
-            tempc      = float( (3977.0 / insideMain) -273.0 )
+            adc_value  = result[0] + (result[1] * 256)
+            tempc      = thermistor.laser_celsius(adc_value)
+            if math.isnan(tempc):
+                raise ValueError("No temperature for adc %s" % adc_value)
             result = tempc
 
         except Exception as exc:
@@ -341,49 +439,54 @@ class StrokerProtocolDevice(object):
         log.debug("Plain adc: %s", result)
 
         # Swap endianness of raw ADC value
-        adc_value  = float(result[1] + (result[0] * 256))
-
-        # Convert to voltage (12 bit)
-        voltage    = float((adc_value / 4096.0) * 1.5)
+        adc_value  = result[1] + (result[0] * 256)
 
-        # Convert to resistance
-        resistance = 10000 * voltage
-        resistance = resistance / (2 - voltage)
+        # 12 bit count through the 10kOHM divider, see thermistor
+        return thermistor.ccd_celsius(adc_value)
 
-        # Find the log of the resistance with a 10kOHM resistor
-        logVal     = math.log( resistance / 10000 )
-        insideMain = float(logVal + ( 3977.0 / (25 + 273.0) ))
-        tempc      = float( (3977.0 / insideMain) -273.0 )
-
-        return tempc
-
-    def get_laser_enable(self):
-        """ Read the laser enable status from the device.
+    def get_laser_enable(self, refresh=False):
+        """ Read the laser enable status from the device. The last
+        value read or written is returned unless refresh is set.
         """
+        enabled = self.settings.get("laser_enable")
+        if enabled is not None and not refresh:
+            return enabled
+
         result = self.get_code(0xE2)
+        self.settings.store("laser_enable", result[0])
         return result[0]
 
-    def set_laser_enable(self, value=0):
+    def set_laser_enable(self, value=0, force=False):
         """ Write one for enable, zero for disable of laser on the
         device.
         """
         if self.pid == 1:
             log.warn("DISABLING LASER FUNCTION FOR MTI")
-            return
+            return None
 
         log.debug("Send laser enable: %s", value)
-        result = self.send_code(0xBE, value)
+        sent, result = settings.write(self, "laser_enable", value,
+                                      lambda: self.send_code(0xBE, value),
+                                      force)
         return result
 
-    def set_ccd_tec_enable(self, value=0):
+    def set_ccd_tec_enable(self, value=0, force=False):
         """ Write one for enable, zero for disable of the ccd tec
-        cooler.
+        cooler. The double write is skipped entirely if the cooler is
+        already in that state.
         """
         log.debug("Send CCD TEC enable: %s", value)
+        sent, result = settings.write(self, "tec_enable", value,
+                                      lambda: self.send_tec_enable(value),
+                                      force)
+        return result
+
+    def send_tec_enable(self, value):
         result = self.send_code(0xD6, value)
 
         log.critical("Double set required, see notes.")
         result = self.send_code(0xD6, value)
+        return result
 
     def get_calibration_coeffs(self):
         """ Read the calibration coefficients from the on-board EEPROM.
@@ -400,6 +503,15 @@ class StrokerProtocolDevice(object):
         log.debug("Coeffs: %s, %s, %s, %s" % (c0, c1, c2, c3))
         return [c0, c1, c2, c3]
 
+    def get_wavelength_axis(self):
+        """ Return the wavelength of every pixel as a read only numpy
+        array. The EEPROM is read once and the axis cached on the device.
+        """
+        if self.calibration is None:
+            self.calibration = calibration.Calibration(
+                self.get_calibration_coeffs(), self.get_pixel_count())
+        return self.calibration.wavelengths()
+
     def decode_eeprom(self, raw_data, width, offset=0):
         """ Reorder, pad and decode the eeprom data to produce a string
         representation of the value stored in the device memory.
@@ -412,30 +524,3 @@ class StrokerProtocolDevice(object):
 
         log.debug("Unpacked str: %s ", unpacked)
         return str(unpacked[0])
-
-    def set_ccd_tec_setpoint(self, setpoint):
-        """ Attempt to set the CCD cooler setpoint. Verify that it is
-        within an acceptable range. Ideally this is to prevent
-        condensation and other issues. This value is a default and is
-        hugely dependent on the environmental conditions.
-        """
-
-        setpoint_min = 10
-        setpoint_max = 20
-        ok_range = "%s,%s" % (setpoint_min, setpoint_max)
-        if setpoint < setpoint_min:
-            log.critical("TEC setpoint out of range (%s)", ok_range)
-            return False
-
-        if setpoint > setpoint_max:
-            log.critical("TEC setpoint out of range (%s)", ok_range)
-            return False
-
-        new_point = self.tec_coeff0 + (self.tec_coeff1 * setpoint)
-        new_point += (self.tec_coeff2 * (setpoint * setpoint))
-        new_point = int(new_point)
-
-        log.debug("Setting TEC setpoint to: %s", new_point)
-        result = self.send_code(0xD8, new_point)
-        return True
-
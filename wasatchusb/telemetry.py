@@ -0,0 +1,138 @@
+""" telemetry - background sampling of the CCD and laser temperatures.
+
+TelemetryPoller reads each temperature channel at a fixed interval on
+its own thread and appends the readings to a TelemetryRing, a fixed
+size time series allocated once. Readings are ordinary control
+transfers, which the device arbiter keeps out of the gap between an
+acquire and its bulk read, so samples land between lines. Readers ask
+the ring for the latest sample or for the samples of a recent window
+instead of polling the device inline with their frames.
+"""
+
+import time
+import numpy
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+# Device method that reads each channel, in degrees C
+CHANNELS = {"ccd": "get_ccd_temperature",
+            "laser": "get_laser_temperature"}
+
+
+class TelemetryRing(object):
+    """ The last depth samples of one or more channels. A channel that
+    failed to read holds NaN for that sample.
+    """
+    def __init__(self, depth, channels):
+        if depth < 1:
+            raise ValueError("Telemetry depth must be at least 1")
+
+        self.depth = depth
+        self.channels = tuple(channels)
+        self.timestamps = numpy.zeros(depth, dtype=numpy.float64)
+        self.values = numpy.zeros((depth, len(self.channels)),
+                                  dtype=numpy.float64)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        with self.lock:
+            slot = self.count % self.depth
+            self.timestamps[slot] = timestamp
+            self.values[slot] = values
+            self.count += 1
+
+    def latest(self):
+        """ Return (timestamp, {channel: value}) of the newest sample, or
+        None if nothing has been sampled.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+
+            slot = (self.count - 1) % self.depth
+            return float(self.timestamps[slot]), \
+                   dict(zip(self.channels,
+                            [float(value) for value in self.values[slot]]))
+
+    def window(self, seconds=None, now=None):
+        """ Return (timestamps, values) of the samples from the last
+        seconds, oldest first, or all held samples if seconds is None.
+        values has one column per channel in channel order.
+        """
+        with self.lock:
+            count = min(self.count, self.depth)
+            slots = numpy.arange(self.count - count, self.count) \
+                    % self.depth
+            timestamps = self.timestamps[slots]
+            values = self.values[slots]
+
+        if seconds is not None:
+            if now is None:
+                now = time.time()
+            recent = timestamps >= now - seconds
+            timestamps = timestamps[recent]
+            values = values[recent]
+
+        return timestamps, values
+
+    def channel(self, name, seconds=None):
+        """ Return (timestamps, values) of one channel over the window.
+        """
+        column = self.channels.index(name)
+        timestamps, values = self.window(seconds)
+        return timestamps, values[:, column]
+
+
+class TelemetryPoller(threading.Thread):
+    """ Sample the channels of a connected device every interval
+    seconds until stopped.
+    """
+    def __init__(self, device, interval=1.0, depth=3600,
+                 channels=("ccd", "laser")):
+        super(TelemetryPoller, self).__init__()
+        self.daemon = True
+        for name in channels:
+            if name not in CHANNELS:
+                raise ValueError("Unknown telemetry channel: %s" % name)
+
+        self.device = device
+        self.interval = interval
+        self.channels = tuple(channels)
+        self.ring = TelemetryRing(depth, self.channels)
+        self.readers = [getattr(device, CHANNELS[name])
+                        for name in self.channels]
+        self.errors = 0
+        self.stopping = threading.Event()
+
+    def stop(self, timeout=None):
+        """ Ask the poller to exit after the current sample, and wait for
+        it. Return True if the thread has stopped.
+        """
+        self.stopping.set()
+        self.join(timeout)
+        return not self.is_alive()
+
+    def sample(self):
+        """ Read every channel once and append the readings.
+        """
+        values = []
+        for reader in self.readers:
+            try:
+                values.append(float(reader()))
+            except Exception as exc:
+                log.warn("Failure reading telemetry: %s", exc)
+                self.errors += 1
+                values.append(numpy.nan)
+
+        self.ring.append(time.time(), values)
+        return values
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.sample()
+            self.stopping.wait(self.interval)
+
+        log.debug("Telemetry stopped after %s samples", self.ring.count)
@@ -0,0 +1,72 @@
+""" thermistor - 12 bit ADC to temperature conversion by lookup table.
+
+The CCD and laser temperatures are read as 12 bit ADC counts across a
+thermistor voltage divider. Rather than evaluate the divider and the
+beta equation with a log per reading, the temperature of all 4096
+counts is computed once per circuit with numpy and kept, so a reading
+is a single index and whole arrays of logged counts convert with one
+take. Counts where the divider equation has no answer map to NaN.
+"""
+
+import numpy
+
+import logging
+log = logging.getLogger(__name__)
+
+ADC_COUNTS = 4096
+
+# (ADC full scale volts, series resistor ohms, divider supply volts)
+CCD_CIRCUIT = (1.5, 10000.0, 2.0)
+LASER_CIRCUIT = (2.5, 21450.0, 2.5)
+
+# Thermistor beta and its resistance at 25 C
+BETA = 3977.0
+NOMINAL = 10000.0
+
+_tables = {}
+
+
+def build_table(full_scale, resistor, supply, beta=BETA,
+                nominal=NOMINAL):
+    """ Degrees C for every ADC count of one divider circuit.
+    """
+    voltage = numpy.arange(ADC_COUNTS, dtype=numpy.float64) \
+              / ADC_COUNTS * full_scale
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        resistance = resistor * voltage / (supply - voltage)
+        inside = numpy.log(resistance / nominal) + beta / (25 + 273.0)
+        table = beta / inside - 273.0
+
+    table[~numpy.isfinite(table) | (resistance <= 0)] = numpy.nan
+    return table
+
+
+def table(circuit=CCD_CIRCUIT, beta=BETA, nominal=NOMINAL):
+    """ The shared, read only table for a circuit, built on first use.
+    """
+    key = tuple(float(value) for value in circuit) + (beta, nominal)
+    result = _tables.get(key)
+    if result is None:
+        result = build_table(*key)
+        result.flags.writeable = False
+        _tables[key] = result
+    return result
+
+
+def to_celsius(adc, circuit=CCD_CIRCUIT):
+    """ Convert one ADC count, or an array of them, to degrees C.
+    Counts above the 12 bit range are clipped to full scale.
+    """
+    lookup = table(circuit)
+    if numpy.isscalar(adc):
+        return float(lookup[min(int(adc), ADC_COUNTS - 1)])
+    return lookup.take(numpy.asarray(adc, dtype=numpy.intp), mode="clip")
+
+
+def ccd_celsius(adc):
+    return to_celsius(adc, CCD_CIRCUIT)
+
+
+def laser_celsius(adc):
+    return to_celsius(adc, LASER_CIRCUIT)
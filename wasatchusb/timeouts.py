@@ -0,0 +1,168 @@
+""" timeouts - transfer deadlines from the integration time and the
+latency measured on each device.
+
+A bulk read can only finish once the sensor has integrated and read the
+line out, so its deadline is the current integration time plus an
+allowance for readout and transfer. Control transfers only get an
+allowance. Each allowance follows the measured latency the way TCP
+sets its retransmit timeout: a smoothed mean plus four times the
+smoothed mean deviation, kept above a floor. A working unit then times
+out a little past its usual latency, so a dead one is noticed in tens
+of milliseconds, and long integrations still get all the time they
+need. Every timeout doubles the allowance until the next transfer
+succeeds, so one slow transfer does not fail all that follow it.
+Control reads that time out are sent once more on the doubled
+allowance before failing. Host to device writes, which may wait on the
+firmware, never get less than WRITE_FLOOR and are never resent, since
+a write that timed out may still have been carried out.
+"""
+
+import threading
+
+from wasatchusb import tracing
+from wasatchusb import instrumentation
+
+import logging
+log = logging.getLogger(__name__)
+
+# All deadlines in milliseconds. CONTROL_FLOOR, WRITE_FLOOR and
+# BULK_FLOOR are the shortest allowances, INITIAL the allowance before
+# anything has been measured, and CEILING the longest wait, also used
+# for bulk reads while the integration time is unknown.
+CONTROL_FLOOR = 20
+WRITE_FLOOR = 1000
+BULK_FLOOR = 50
+INITIAL = 1000
+CEILING = 60000
+
+# Smoothing of the mean and of the mean deviation, and the number of
+# deviations allowed above the mean, as in RFC 6298
+MEAN_GAIN = 0.125
+DEVIATION_GAIN = 0.25
+DEVIATIONS = 4
+
+# libusb error code of a transfer that ran out of time
+TIMEOUT_ERROR = tracing.TIMEOUT_ERROR
+
+
+class LatencyEstimate(object):
+    """ Smoothed latency and mean deviation of one kind of transfer, in
+    ms, and the allowance derived from them.
+    """
+    def __init__(self, floor, initial=INITIAL):
+        self.floor = floor
+        self.initial = initial
+        self.mean = None
+        self.deviation = 0.0
+        self.backoff = 1
+        self.samples = 0
+
+    def add(self, ms):
+        if self.mean is None:
+            self.mean = ms
+            self.deviation = ms / 2.0
+        else:
+            error = ms - self.mean
+            self.mean += MEAN_GAIN * error
+            self.deviation += DEVIATION_GAIN * (abs(error) - self.deviation)
+        self.samples += 1
+        self.backoff = 1
+
+    def timed_out(self):
+        if self.allowance() < CEILING:
+            self.backoff *= 2
+
+    def allowance(self, floor=None):
+        """ Allowance in ms, kept above floor if given instead of the
+        floor of the estimate.
+        """
+        if floor is None:
+            floor = self.floor
+        if self.mean is None:
+            ms = max(floor, self.initial)
+        else:
+            ms = max(floor, self.mean + DEVIATIONS * self.deviation)
+        return min(ms * self.backoff, CEILING)
+
+
+class AdaptiveTimeout(object):
+    """ Deadlines for the transfers of one device. The instrumented
+    device handle asks control() for the deadline of any control
+    transfer sent without one, and records every transfer here.
+    """
+    def __init__(self, control_floor=CONTROL_FLOOR, bulk_floor=BULK_FLOOR,
+                 write_floor=WRITE_FLOOR):
+        self.lock = threading.Lock()
+        self.control_latency = LatencyEstimate(control_floor)
+        self.readout_latency = LatencyEstimate(bulk_floor)
+        self.write_floor = write_floor
+
+        # Integration time in ms of the line being read, while a read
+        # with an adaptive deadline is in flight
+        self.expected = None
+
+    def control(self, bmRequestType=0xC0):
+        """ Deadline in ms for one control transfer of bmRequestType.
+        """
+        floor = None
+        if not bmRequestType & 0x80:
+            floor = self.write_floor
+
+        with self.lock:
+            return int(self.control_latency.allowance(floor))
+
+    def bulk(self, integration_time):
+        """ Deadline in ms for the bulk read of a line integrating for
+        integration_time ms, or CEILING when that is None.
+        """
+        with self.lock:
+            if integration_time is None:
+                return CEILING
+            return int(integration_time + self.readout_latency.allowance())
+
+    def expect(self, integration_time):
+        """ Measure the next bulk read into the readout estimate, as a
+        line integrating for integration_time ms. Only reads on the
+        deadline from bulk are announced here, so reads waiting on an
+        external trigger or a caller's deadline do not skew the
+        estimate.
+        """
+        with self.lock:
+            self.expected = integration_time
+
+    def record(self, kind, seconds, result=0):
+        """ Add a transfer of kind instrumentation.CONTROL or BULK that
+        took seconds, with its libusb result code.
+        """
+        with self.lock:
+            if kind == instrumentation.CONTROL:
+                estimate = self.control_latency
+                ms = seconds * 1000.0
+            else:
+                if self.expected is None:
+                    return
+                estimate = self.readout_latency
+                ms = max(0.0, seconds * 1000.0 - self.expected)
+                self.expected = None
+
+            if result == 0:
+                estimate.add(ms)
+            elif result == TIMEOUT_ERROR:
+                estimate.timed_out()
+                log.debug("%s transfer timed out, allow %s ms", kind,
+                          estimate.allowance())
+
+    def as_dict(self):
+        """ Current allowances and smoothed latencies in ms.
+        """
+        with self.lock:
+            result = {}
+            for kind, estimate in ((instrumentation.CONTROL,
+                                    self.control_latency),
+                                   (instrumentation.BULK,
+                                    self.readout_latency)):
+                result[kind] = {"allowance": estimate.allowance(),
+                                "mean": estimate.mean,
+                                "deviation": estimate.deviation,
+                                "samples": estimate.samples}
+            return result
@@ -0,0 +1,107 @@
+""" tracing - in memory ring buffer of recent USB transfers.
+
+When enabled on a device, every control transfer and bulk read is kept
+as one tuple in a fixed size ring: wall clock start time, kind, opcode
+or endpoint, wValue, wIndex, requested length, bytes moved, duration
+and result code. Recording is a tuple store, so the trace can stay on
+in the field; nothing is formatted until dump writes the ring to a file,
+on demand or automatically when a transfer raises.
+"""
+
+import time
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+FIELDS = ("time", "kind", "request", "value", "index", "length", "bytes",
+          "duration", "result")
+
+# libusb error code of a transfer that ran out of time, and the result
+# code of a transfer that raised without a libusb error code
+TIMEOUT_ERROR = -7
+UNKNOWN_ERROR = -99
+
+
+def error_code(exc):
+    """ libusb style error code of a failed transfer, negative like
+    LIBUSB_ERROR_TIMEOUT (-7).
+    """
+    code = getattr(exc, "backend_error_code", None)
+    if code is None:
+        return UNKNOWN_ERROR
+    return code
+
+
+class TransactionTrace(object):
+    """ The last depth transfers. With dump_path set, the ring is
+    written there whenever a transfer fails, at most once per
+    dump_interval seconds so a stalled unit does not thrash the disk.
+    """
+    def __init__(self, depth=4096, dump_path=None, dump_interval=1.0):
+        self.depth = depth
+        self.dump_path = dump_path
+        self.dump_interval = dump_interval
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.records = [None] * self.depth
+            self.count = 0
+            self.last_dump = 0.0
+
+    def record(self, started, kind, request, value, index, length,
+               count, duration, result=0):
+        with self.lock:
+            self.records[self.count % self.depth] = (
+                started, kind, request, value, index, length, count,
+                duration, result)
+            self.count += 1
+
+        if result != 0 and self.dump_path is not None:
+            self.failed()
+
+    def failed(self):
+        now = time.time()
+        if now - self.last_dump < self.dump_interval:
+            return
+
+        self.last_dump = now
+        try:
+            self.dump(self.dump_path)
+        except Exception as exc:
+            log.critical("Failure writing transfer trace: %s", exc)
+
+    def entries(self):
+        """ Recorded transfers, oldest first, as tuples in FIELDS order.
+        """
+        with self.lock:
+            if self.count <= self.depth:
+                return self.records[:self.count]
+
+            start = self.count % self.depth
+            return self.records[start:] + self.records[:start]
+
+    def dump(self, filename=None):
+        """ Write the trace as tab separated text with a header line.
+        Returns the number of transfers written.
+        """
+        if filename is None:
+            filename = self.dump_path
+        if filename is None:
+            raise ValueError("No trace file name")
+
+        entries = self.entries()
+        with open(filename, "w") as trace_file:
+            trace_file.write("\t".join(FIELDS) + "\n")
+            for entry in entries:
+                started, kind, request, value, index, length, count, \
+                    duration, result = entry
+                trace_file.write("%.6f\t%s\t0x%02x\t%s\t%s\t%s\t%s\t%.6f"
+                                 "\t%s\n" % (started, kind, request, value,
+                                             index, length, count,
+                                             duration, result))
+
+        log.info("Wrote %s transfers to %s", len(entries), filename)
+        return len(entries)
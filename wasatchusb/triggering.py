@@ -0,0 +1,238 @@
+""" triggering - continuous acquisition on the external trigger input.
+
+With the trigger source set to external, the unit reads out a line each
+time its trigger input fires and no acquire command is sent. A
+TriggeredStream keeps a bulk read armed at all times, so a line is
+taken off the endpoint as soon as it is ready, and stamps it with its
+arrival time. TriggerTiming compares each inter-arrival interval with
+the trigger period, given or estimated from the intervals seen so far,
+to count the triggers that never produced a line. The sequence number
+of each frame advances by one per trigger, missed ones included, so
+gaps are visible to consumers. Frames go into the stream FrameRing like
+any other stream, and into a bounded FrameQueue for consumers that
+must see every frame; when the queue is full new frames are counted as
+dropped rather than stalling the armed read.
+
+An armed read that reaches its poll deadline while a line is arriving
+is cancelled with part of that line already taken, and the rest lands
+at the start of the next read, so the frames that follow are shifted
+until the trigger next goes idle. The poll is therefore kept much
+longer than a line, which makes this rare, and a short read left by
+such a transfer is flushed and counted as an error.
+"""
+
+import time
+import numpy
+import threading
+
+from wasatchusb import streaming
+from wasatchusb import timeouts
+from wasatchusb import tracing
+
+import logging
+log = logging.getLogger(__name__)
+
+# Weight of each new interval in the estimated trigger period
+PERIOD_GAIN = 0.1
+
+# An interval longer than this many periods is a pause in the trigger
+# source, such as a stopped conveyor, rather than missed triggers
+PAUSE_PERIODS = 8
+
+# Seconds each armed read waits for a trigger, and the least number of
+# line times it waits for
+POLL = 1.0
+POLL_LINES = 20
+
+# Deadline in ms of the reads that flush a partial line, and the most
+# reads made before giving up on a device that keeps sending
+FLUSH = 10
+FLUSH_READS = 8
+
+
+class TriggerTiming(object):
+    """ Inter-arrival accounting of triggered frames. period is the
+    expected seconds between triggers, or None to estimate it.
+    """
+    def __init__(self, period=None):
+        self.period = period
+        self.estimate = period
+        self.last = None
+        self.missed = 0
+        self.gaps = 0
+        self.pauses = 0
+
+    def arrival(self, timestamp):
+        """ Add a frame that arrived at timestamp. Returns the number of
+        triggers missed since the previous frame.
+        """
+        last = self.last
+        self.last = timestamp
+        if last is None:
+            return 0
+
+        interval = timestamp - last
+        if self.estimate is None:
+            self.estimate = interval
+            return 0
+
+        periods = interval / self.estimate
+        if periods > PAUSE_PERIODS:
+            self.pauses += 1
+            return 0
+
+        missed = int(round(periods)) - 1
+        if missed > 0:
+            self.gaps += 1
+            self.missed += missed
+            return missed
+
+        if self.period is None:
+            self.estimate += PERIOD_GAIN * (interval - self.estimate)
+        return 0
+
+
+class FrameQueue(object):
+    """ Bounded first in, first out queue of frames, allocated once.
+    """
+    def __init__(self, depth, pixels):
+        if depth < 1:
+            raise ValueError("Queue depth must be at least 1")
+
+        self.depth = depth
+        self.pixels = pixels
+        self.frames = numpy.zeros((depth, pixels), dtype=numpy.uint16)
+        self.sequence = numpy.zeros(depth, dtype=numpy.int64)
+        self.timestamps = numpy.zeros(depth, dtype=numpy.float64)
+
+        # Totals of frames put, taken and dropped since creation
+        self.tail = 0
+        self.head = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+
+    def __len__(self):
+        with self.lock:
+            return self.tail - self.head
+
+    def put(self, frame, sequence, timestamp):
+        """ Copy frame to the back of the queue. Returns False, and
+        counts the frame as dropped, if the queue is full.
+        """
+        with self.lock:
+            if self.tail - self.head >= self.depth:
+                self.dropped += 1
+                return False
+
+            slot = self.tail % self.depth
+            self.frames[slot] = frame
+            self.sequence[slot] = sequence
+            self.timestamps[slot] = timestamp
+            self.tail += 1
+            self.ready.notify_all()
+            return True
+
+    def get(self, out=None, timeout=None):
+        """ Return (sequence, timestamp, frame) from the front of the
+        queue, waiting up to timeout seconds for one, or None if none
+        arrived. The frame is copied into out when given.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        with self.lock:
+            while self.tail == self.head:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                self.ready.wait(remaining)
+
+            slot = self.head % self.depth
+            if out is None:
+                out = numpy.empty(self.pixels, dtype=numpy.uint16)
+            out[:] = self.frames[slot]
+            self.head += 1
+            return int(self.sequence[slot]), \
+                   float(self.timestamps[slot]), out
+
+
+class TriggeredStream(streaming.LineStream):
+    """ Read externally triggered lines into the ring and the queue
+    until stopped. Each armed read waits up to poll seconds, stretched
+    to POLL_LINES integration times, so the thread notices stop and
+    other threads' commands get the device within a poll while the
+    trigger is idle.
+    """
+    def __init__(self, device, depth=256, queue_depth=64, period=None,
+                 poll=POLL):
+        super(TriggeredStream, self).__init__(device, depth)
+        self.queue = FrameQueue(queue_depth, self.ring.pixels)
+        self.timing = TriggerTiming(period)
+        if self.integration_time:
+            poll = max(poll, POLL_LINES * self.integration_time / 1000.0)
+        self.poll = poll
+        self.sequence = -1
+
+        # Trigger source to restore on the device once stopped
+        self.previous_source = None
+
+    def counters(self):
+        """ Frames read, triggers missed, gaps, pauses, frames dropped
+        from the full queue and read errors so far.
+        """
+        return {"frames": self.ring.count, "missed": self.timing.missed,
+                "gaps": self.timing.gaps, "pauses": self.timing.pauses,
+                "dropped": self.queue.dropped, "errors": self.errors}
+
+    def run(self):
+        ring = self.ring
+        device = self.device
+        poll = int(self.poll * 1000)
+
+        while self.running.is_set():
+            frame = ring.write_slot()
+            try:
+                with device.lock:
+                    device.read_line_into(frame, poll)
+                arrival = time.time()
+            except Exception as exc:
+                # Nothing triggered within the poll
+                if tracing.error_code(exc) == timeouts.TIMEOUT_ERROR:
+                    continue
+
+                log.critical("Failure in triggered read: %s", exc)
+                self.errors += 1
+                self.flush(frame)
+                continue
+
+            missed = self.timing.arrival(arrival)
+            if missed:
+                log.warn("Missed %s triggers before frame %s", missed,
+                         self.sequence + missed + 1)
+
+            self.sequence += missed + 1
+            ring.commit(arrival, self.sequence)
+            self.queue.put(frame, self.sequence, arrival)
+
+        log.debug("Triggered stream stopped after %s frames", ring.count)
+
+    def flush(self, scratch):
+        """ Discard what is left on the endpoint after a failed read,
+        until a read times out, so the next read starts on a line.
+        """
+        device = self.device
+        for count in range(FLUSH_READS):
+            try:
+                with device.lock:
+                    device.read_line_into(scratch, FLUSH)
+            except Exception as exc:
+                if tracing.error_code(exc) == timeouts.TIMEOUT_ERROR:
+                    return
+                log.debug("Flushed partial line: %s", exc)
+                time.sleep(0.01)
+
+        log.warn("Endpoint still busy after %s flush reads", FLUSH_READS)
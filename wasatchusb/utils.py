@@ -1,5 +1,5 @@
 
-import usb
+from wasatchusb import registry
 
 class FindDevices(object):
     ''' List Wasatch Photonics devices found connected to the host OS.'''
@@ -8,17 +8,13 @@ class FindDevices(object):
         pass
 
     def get_serial(self, vid, pid):
-        busses = usb.busses()
-        for bus in busses:
-            devices = bus.devices
-            for dev in devices:
-                if dev.idVendor == 0x24aa:
-                    #print "  idVendor:",hex(dev.idVendor)
-                    #print "  idProduct:",hex(dev.idProduct)
-
-                    ld = dev.open()
-                    local_serial = ld.getString(dev.iSerialNumber, 256)
-                    return True, local_serial
+        for entry in registry.get_registry(0x24aa).refresh():
+            #print "  idVendor:",hex(entry.vid)
+            #print "  idProduct:",hex(entry.pid)
+
+            local_serial = entry.get_serial()
+            if local_serial is not None:
+                return True, local_serial
 
         return False, "serial_failure"
 
@@ -27,17 +23,15 @@ class FindDevices(object):
 
         device_list = []
 
-        for bus in usb.busses():
-            for device in bus.devices:
-                # iSerialNumber in this context is position, not value.
-                # see get_serial above for details
-                if device.idVendor == vid:
-                    result = hex(device.idVendor) + ":" + \
-                             hex(device.idProduct) + ":" + \
-                             hex(device.iSerialNumber) + " "
-                    result = result.replace('0x', '')
-                    result = result.replace('L', '')
-                    device_list.append(result)
+        for entry in registry.get_registry(vid).refresh():
+            # iSerialNumber in this context is position, not value.
+            # see get_serial above for details
+            result = hex(entry.vid) + ":" + \
+                     hex(entry.pid) + ":" + \
+                     hex(entry.serial_index) + " "
+            result = result.replace('0x', '')
+            result = result.replace('L', '')
+            device_list.append(result)
 
         return 1, device_list
 